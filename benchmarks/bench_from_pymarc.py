@@ -0,0 +1,54 @@
+"""
+a benchmark comparing IIIFMetadataBoxFromMarc.from_pymarc against from_dict(record.as_dict())
+
+It reports the time per record and the peak memory allocated while converting a single record
+
+    python -m benchmarks.bench_from_pymarc --records 5000 --fields 40
+"""
+
+from argparse import ArgumentParser
+from time import perf_counter
+import tracemalloc
+
+from marc2iiif.classes import IIIFMetadataBoxFromMarc
+
+from .synthetic import synthetic_records, to_pymarc
+
+
+def via_dict(record):
+    return IIIFMetadataBoxFromMarc.from_dict(record.as_dict())
+
+
+def via_pymarc(record):
+    return IIIFMetadataBoxFromMarc.from_pymarc(record)
+
+
+def measure(convert, records):
+    start = perf_counter()
+    for record in records:
+        convert(record)
+    elapsed = perf_counter() - start
+    peaks = []
+    tracemalloc.start()
+    for record in records[:500]:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        convert(record)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    tracemalloc.stop()
+    return elapsed / len(records), sum(peaks) / len(peaks)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--fields", type=int, default=40)
+    args = parser.parse_args()
+    records = [to_pymarc(x) for x in synthetic_records(args.records, fields=args.fields)]
+    for name, convert in (("from_dict(as_dict())", via_dict), ("from_pymarc", via_pymarc)):
+        seconds, peak = measure(convert, records)
+        print("{:<22} {:>9.1f} us/record {:>9.1f} KiB peak/record".format(name, seconds * 1e6, peak / 1024))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""
+a benchmark reporting how much memory a collection of converted records holds on to
+
+Every record is converted with IIIFDataExtractionFromMarc.from_dict and kept in a list, as a
+deduplication job would, and the bytes still allocated afterwards are divided by the number
+of records
+
+    python -m benchmarks.bench_memory --records 100000
+"""
+
+from argparse import ArgumentParser
+import tracemalloc
+
+from marc2iiif.classes import IIIFDataExtractionFromMarc
+
+from .synthetic import synthetic_records
+
+CHUNK = 1000
+
+
+def main():
+    parser = ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--fields", type=int, default=16)
+    parser.add_argument("--shared", type=float, default=0.0,
+                        help="the fraction of fields repeated across records")
+    args = parser.parse_args()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    kept = []
+    for start in range(0, args.records, CHUNK):
+        records = synthetic_records(min(CHUNK, args.records - start), fields=args.fields, seed=start,
+                                    shared=args.shared)
+        kept.extend(IIIFDataExtractionFromMarc.from_dict(x) for x in records)
+        del records
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    print("{} records held: {:.0f} bytes/record".format(len(kept), held / len(kept)))
+
+
+if __name__ == "__main__":
+    main()
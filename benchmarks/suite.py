@@ -0,0 +1,193 @@
+"""
+the benchmark suite for the extraction and serialization hot paths
+
+Each stage is measured on its own over the same synthetic records:
+
+- combine_subfields: utils.combine_subfields_into_one_value on every data field
+- from_dict: IIIFMetadataBoxFromMarc.from_dict
+- from_pymarc: IIIFMetadataBoxFromMarc.from_pymarc
+- to_dict: IIIFDataExtractionFromMarc.to_dict
+- json_dumps: json.dumps(IIIFDataExtractionFromMarc.to_dict())
+- to_json: IIIFDataExtractionFromMarc.to_json
+
+For every stage it reports records per second, the peak memory allocated while processing a
+single record and the number of memory blocks each record's result keeps alive. Results can
+be saved as json and compared against a previous run:
+
+    python -m benchmarks.suite --records 5000 --output before.json
+    python -m benchmarks.suite --records 5000 --output after.json --compare before.json
+"""
+
+from argparse import ArgumentParser
+from json import dump, dumps, load
+from platform import python_version
+from subprocess import CalledProcessError, check_output
+from sys import exit as sys_exit
+from time import perf_counter
+import tracemalloc
+
+from marc2iiif.classes import IIIFDataExtractionFromMarc, IIIFMetadataBoxFromMarc
+from marc2iiif.utils import combine_subfields_into_one_value
+
+from .synthetic import synthetic_records, to_pymarc
+
+MEMORY_SAMPLE = 200
+
+
+def _subfield_lists(record):
+    return [body["subfields"] for a_field in record["fields"] for body in a_field.values()
+            if not isinstance(body, str)]
+
+
+def _combine_all(subfield_lists):
+    return [combine_subfields_into_one_value(x) for x in subfield_lists]
+
+
+def stages(records):
+    """
+    a function to prepare the input of every stage and the function measured on it
+
+    :param list records: dictified MARC records
+
+    :rtype list
+    :returns a list of (stage name, function, inputs) tuples
+    """
+    extractions = [IIIFDataExtractionFromMarc.from_dict(x) for x in records]
+    return [
+        ("combine_subfields", _combine_all, [_subfield_lists(x) for x in records]),
+        ("from_dict", IIIFMetadataBoxFromMarc.from_dict, records),
+        ("from_pymarc", IIIFMetadataBoxFromMarc.from_pymarc, [to_pymarc(x) for x in records]),
+        ("to_dict", IIIFDataExtractionFromMarc.to_dict, extractions),
+        ("json_dumps", lambda x: dumps(x.to_dict()), extractions),
+        ("to_json", IIIFDataExtractionFromMarc.to_json, extractions),
+    ]
+
+
+def measure(function, inputs, repeat=3):
+    """
+    a function to measure the speed and the memory use of one stage
+
+    :param function function: the stage, called once per record
+    :param list inputs: one input per record
+    :param int repeat: the number of timed runs; the fastest one is reported
+
+    :rtype dict
+    :returns records_per_second, peak_bytes_per_record and blocks_per_record
+    """
+    best = None
+    for _ in range(repeat):
+        start = perf_counter()
+        for an_input in inputs:
+            function(an_input)
+        elapsed = perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    sample = inputs[:MEMORY_SAMPLE]
+    peaks = []
+    tracemalloc.start()
+    for an_input in sample:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        function(an_input)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    before = tracemalloc.take_snapshot()
+    kept = [function(an_input) for an_input in sample]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocks = sum(x.count_diff for x in after.compare_to(before, "filename"))
+    return {"records_per_second": len(inputs) / best,
+            "peak_bytes_per_record": sum(peaks) / len(peaks),
+            "blocks_per_record": blocks / len(kept)}
+
+
+def current_commit():
+    try:
+        return check_output(["git", "rev-parse", "--short", "HEAD"], universal_newlines=True).strip()
+    except (CalledProcessError, OSError):
+        return None
+
+
+def run(records=2000, fields=40, repeats=4, subfields=3, subfield_size=24, seed=0, shared=0.0, only=None):
+    """
+    a function to run the whole suite
+
+    :param int records: the number of synthetic records
+    :param int fields: the number of data fields per record
+    :param int repeats: how many times each tag is repeated within a record
+    :param int subfields: the number of subfields per field
+    :param int subfield_size: the number of characters per subfield value
+    :param int seed: the seed of the synthetic record generator
+    :param float shared: the fraction of fields repeated across records
+    :param list only: the names of the stages to run; all of them by default
+
+    :rtype dict
+    :returns the parameters of the run and the measurements of every stage
+    """
+    parameters = {"records": records, "fields": fields, "repeats": repeats, "subfields": subfields,
+                  "subfield_size": subfield_size, "seed": seed, "shared": shared}
+    data = synthetic_records(records, fields=fields, repeats=repeats, subfields=subfields,
+                             subfield_size=subfield_size, seed=seed, shared=shared)
+    results = {}
+    for name, function, inputs in stages(data):
+        if only and name not in only:
+            continue
+        results[name] = measure(function, inputs)
+    return {"commit": current_commit(), "python": python_version(), "parameters": parameters,
+            "results": results}
+
+
+def compare(current, baseline, tolerance=0.10):
+    """
+    a function to find the stages that got slower than a baseline run
+
+    :param dict current: the output of run
+    :param dict baseline: the output of a previous run
+    :param float tolerance: the fraction of records per second a stage may lose
+
+    :rtype list
+    :returns a list of (stage, current records per second, baseline records per second)
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before and result["records_per_second"] < before["records_per_second"] * (1 - tolerance):
+            regressions.append((name, result["records_per_second"], before["records_per_second"]))
+    return regressions
+
+
+def main():
+    parser = ArgumentParser(description="benchmark the marc2iiif extraction and serialization hot paths")
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--fields", type=int, default=40)
+    parser.add_argument("--repeats", type=int, default=4)
+    parser.add_argument("--subfields", type=int, default=3)
+    parser.add_argument("--subfield-size", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shared", type=float, default=0.0)
+    parser.add_argument("--only", action="append", help="run only the named stage; can be repeated")
+    parser.add_argument("--output", help="a path to save the results to as json")
+    parser.add_argument("--compare", help="a path to the json results of a previous run")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+    current = run(records=args.records, fields=args.fields, repeats=args.repeats, subfields=args.subfields,
+                  subfield_size=args.subfield_size, seed=args.seed, shared=args.shared,
+                  only=args.only)
+    print("{:<18} {:>14} {:>16} {:>16}".format("stage", "records/sec", "peak bytes/rec", "blocks/rec"))
+    for name, result in current["results"].items():
+        print("{:<18} {:>14.0f} {:>16.0f} {:>16.1f}".format(name, result["records_per_second"],
+                                                             result["peak_bytes_per_record"],
+                                                             result["blocks_per_record"]))
+    if args.output:
+        with open(args.output, "w") as a_stream:
+            dump(current, a_stream, indent=2)
+    if args.compare:
+        with open(args.compare) as a_stream:
+            baseline = load(a_stream)
+        regressions = compare(current, baseline, tolerance=args.tolerance)
+        for name, now, before in regressions:
+            print("REGRESSION {}: {:.0f} records/sec, was {:.0f}".format(name, now, before))
+        if regressions:
+            sys_exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+synthetic MARC records for the benchmarks
+
+Records are generated deterministically from a seed so that two runs of a benchmark, on two
+different commits, convert exactly the same data
+"""
+
+from random import Random
+
+from pymarc import Field, Record, Subfield
+
+from marc2iiif.constants import DESCRIPTION_LOOKUPS, LABEL_LOOKUP
+
+MAPPED_TAGS = sorted(LABEL_LOOKUP) + DESCRIPTION_LOOKUPS
+UNMAPPED_TAGS = ["010", "020", "035", "040", "100", "246", "490", "999"]
+
+
+def synthetic_records(total, fields=40, repeats=4, subfields=3, subfield_size=24, seed=0, shared=0.0):
+    """
+    a function to generate dictified MARC records in the shape from_dict expects
+
+    :param int total: the number of records to generate
+    :param int fields: the number of data fields in each record, besides 001 and 245
+    :param int repeats: how many times each tag chosen for a record is repeated in it
+    :param int subfields: the number of subfields in each field
+    :param int subfield_size: the number of characters in each subfield value
+    :param int seed: the seed of the random generator
+    :param float shared: the fraction of fields whose subfield values are taken from a small pool,
+     the way content types, subject headings and holding institutions repeat across a catalog
+
+    :rtype list
+    :returns a list of dictified MARC records
+    """
+    rnd = Random(seed)
+    words = ["".join(rnd.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rnd.randint(2, 9)))
+             for _ in range(500)]
+
+    def value():
+        text = " ".join(rnd.choice(words) for _ in range(subfield_size // 4 + 1))
+        return text[:subfield_size]
+
+    stock = [[value() for _ in range(subfields)] for _ in range(200)] if shared else None
+    records = []
+    for n in range(total):
+        record_fields = [{"001": "{:09d}".format(n)},
+                         {"245": {"ind1": "1", "ind2": "0",
+                                  "subfields": [{"a": value()}, {"c": value()}]}}]
+        while len(record_fields) < fields + 2:
+            tag = rnd.choice(MAPPED_TAGS if rnd.random() < 0.8 else UNMAPPED_TAGS)
+            for _ in range(repeats):
+                codes = "abcdefghijklmnopqrstuvwxyz"
+                if shared and rnd.random() < shared:
+                    values = rnd.choice(stock)
+                else:
+                    values = [value() for _ in range(subfields)]
+                record_fields.append({tag: {"ind1": " ", "ind2": " ",
+                                            "subfields": [{codes[x % 26]: values[x]} for x in range(subfields)]}})
+        record_fields = record_fields[:fields + 2]
+        record_fields.append({"856": {"ind1": "4", "ind2": "0",
+                                      "subfields": [{"u": "http://pi.lib.uchicago.edu/1001/cat/bib/" + str(n)}]}})
+        records.append({"leader": "00000nam a2200000 a 4500", "fields": record_fields})
+    return records
+
+
+def to_pymarc(dictified_record):
+    """
+    a function to build a pymarc Record out of a dictified MARC record
+
+    :param dict dictified_record: a record as returned by synthetic_records
+
+    :rtype :instance:`pymarc.Record`
+    """
+    record = Record(leader=dictified_record["leader"])
+    for a_field in dictified_record["fields"]:
+        for tag, body in a_field.items():
+            if isinstance(body, str):
+                record.add_field(Field(tag=tag, data=body))
+            else:
+                record.add_field(Field(tag=tag, indicators=[body["ind1"], body["ind2"]],
+                                       subfields=[Subfield(code, value) for subfield in body["subfields"]
+                                                  for code, value in subfield.items()]))
+    return record
@@ -0,0 +1,224 @@
+"""
+an asyncio driver for converting binary MARC files that live on slow, e.g. network mounted, storage
+
+Reading, converting and writing run as stages joined by bounded queues, so many file operations
+are in flight at once and a slow read or write never holds up the others. Files are read and
+manifests written by a pool of threads; the CPU bound extraction and serialization run in an
+executor, by default a pool of processes. The event loop itself never waits on a file or on a
+conversion.
+
+    >>> from asyncio import run
+    >>> converted, errors = run(convert_async("/mnt/dumps", ShardedManifestWriter("/mnt/manifests")))
+"""
+
+from asyncio import Queue, Semaphore, gather, get_running_loop
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from os import cpu_count
+from os.path import dirname
+from time import perf_counter
+
+from .classes import IIIFDataExtractionFromMarc, MarcFilesFromDisk
+from .instrumentation import PipelineStats
+from .utils import iter_raw_marc
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def _read_batch(records, batch_size):
+    return list(islice(records, batch_size))
+
+
+def _open_raw_records(path):
+    a_stream = open(path, 'rb')
+    return a_stream, iter_raw_marc(a_stream)
+
+
+async def iter_raw_records(path, io_executor=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    an async generator reading the records of a binary MARC file in batches without parsing them
+
+    Every read is done in io_executor so the event loop is free while the storage answers
+
+    :param str path: a path to a binary MARC file
+    :param :instance:`concurrent.futures.Executor` io_executor: the executor to read in; defaults
+     to the event loop's default executor
+    :param int batch_size: the number of records read per trip to the executor
+
+    :rtype async generator
+    :returns lists of up to batch_size (byte offset, record bytes) tuples
+    """
+    loop = get_running_loop()
+    a_stream, records = await loop.run_in_executor(io_executor, _open_raw_records, path)
+    try:
+        while True:
+            batch = await loop.run_in_executor(io_executor, _read_batch, records, batch_size)
+            if not batch:
+                return
+            yield batch
+    finally:
+        await loop.run_in_executor(io_executor, a_stream.close)
+
+
+def convert_batch(path, raw_records, profile=None, use_orjson=False, stats=None):
+    """
+    a function to convert a batch of binary MARC records into manifest json
+
+    It does all of the CPU bound work of the pipeline and is what runs in the executor. Errors
+    are collected rather than raised so that one bad record never takes down the rest of a run
+
+    :param str path: the file the records were read from, for error messages
+    :param list raw_records: (byte offset, record bytes) tuples
+    :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+    :param bool use_orjson: whether to encode manifests with orjson when it is available
+    :param :instance:`PipelineStats` stats: where to record how long each stage takes, if anywhere
+
+    :rtype tuple
+    :returns a list of (identifier, manifest bytes), a list of (path, byte offset, message) errors
+     and the stats
+    """
+    from pymarc import Record
+    manifests = []
+    errors = []
+    for offset, raw_record in raw_records:
+        try:
+            if stats is None:
+                an_extraction = IIIFDataExtractionFromMarc.from_pymarc(Record(data=raw_record), profile=profile)
+                data = an_extraction.to_json(use_orjson=use_orjson).encode("utf-8")
+            else:
+                with stats.time("parse"):
+                    record = Record(data=raw_record)
+                an_extraction = IIIFDataExtractionFromMarc.from_pymarc(record, profile=profile, stats=stats)
+                with stats.time("serialize"):
+                    data = an_extraction.to_json(use_orjson=use_orjson).encode("utf-8")
+            manifests.append((an_extraction.metadata.identifier, data))
+        except Exception as an_error:
+            errors.append((path, offset, "{}: {}".format(type(an_error).__name__, an_error)))
+    return manifests, errors, stats
+
+
+async def convert_async(file_path, writer, workers=None, executor=None, io_workers=32, read_ahead=4,
+                        queue_size=8, batch_size=DEFAULT_BATCH_SIZE, profile=None, stats=None, duplicates=None):
+    """
+    a coroutine to convert a MARC file or a directory tree of MARC files with overlapping reads,
+    conversions and writes
+
+    Manifests are placed by the writer, e.g. a :instance:`marc2iiif.writers.ShardedManifestWriter`,
+    whose written, unchanged and skipped counters are updated as the run goes
+
+    :param str file_path: a binary MARC file or a directory tree containing them
+    :param :instance:`ShardedManifestWriter` writer: where to write the manifests
+    :param int workers: the number of batches converted at the same time, by as many worker
+     processes; defaults to the number of CPUs. With 1 the conversions run in a single thread
+    :param :instance:`concurrent.futures.Executor` executor: an executor to convert records in
+     instead of a pool of worker processes
+    :param int io_workers: the number of threads reading and writing files at the same time
+    :param int read_ahead: the number of files read at the same time
+    :param int queue_size: the number of batches each queue holds before the stage feeding it waits
+    :param int batch_size: the number of records converted and written as one batch
+    :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+    :param :instance:`PipelineStats` stats: where to add up how long each stage takes, if anywhere
+    :param :instance:`marc2iiif.dedup.DuplicateFilter` duplicates: a filter dropping records already
+     read as soon as their batch is read; as files are read at the same time, which copy of a
+     duplicated record is kept depends on which file gets to it first
+
+    :rtype tuple
+    :returns the number of records converted and a list of (path, byte offset, message) errors
+    """
+    loop = get_running_loop()
+    io_executor = ThreadPoolExecutor(max_workers=io_workers)
+    converters = workers or cpu_count() or 1
+    own_executor = executor is None
+    if own_executor:
+        if converters == 1:
+            executor = ThreadPoolExecutor(max_workers=1)
+        else:
+            executor = ProcessPoolExecutor(max_workers=converters)
+    raw_batches = Queue(maxsize=queue_size)
+    converted_batches = Queue(maxsize=queue_size)
+    errors = []
+    converted = 0
+    use_orjson = getattr(writer, "use_orjson", False)
+
+    async def read(path, limit):
+        async with limit:
+            try:
+                async for batch in iter_raw_records(path, io_executor, batch_size):
+                    if duplicates is not None:
+                        batch = list(duplicates.filter(batch))
+                        if not batch:
+                            continue
+                    await raw_batches.put((path, batch))
+            except Exception as an_error:
+                errors.append((path, 0, "{}: {}".format(type(an_error).__name__, an_error)))
+
+    async def read_all():
+        paths = await loop.run_in_executor(io_executor, list, MarcFilesFromDisk(file_path).files())
+        limit = Semaphore(read_ahead)
+        await gather(*(read(path, limit) for path in paths))
+        for _ in range(converters):
+            await raw_batches.put(None)
+
+    async def convert():
+        while True:
+            item = await raw_batches.get()
+            if item is None:
+                await converted_batches.put(None)
+                return
+            path, batch = item
+            result = await loop.run_in_executor(executor, convert_batch, path, batch, profile, use_orjson,
+                                                None if stats is None else PipelineStats())
+            await converted_batches.put(result)
+
+    async def write():
+        nonlocal converted
+        finished = 0
+        while finished < converters:
+            item = await converted_batches.get()
+            if item is None:
+                finished += 1
+                continue
+            manifests, batch_errors, batch_stats = item
+            errors.extend(batch_errors)
+            converted += len(manifests)
+            if batch_stats is not None:
+                stats.merge(batch_stats)
+            # a record appearing twice in one batch is written once, with its last manifest
+            pending = {}
+            for identifier, data in manifests:
+                if identifier:
+                    pending[writer.path_for(identifier)] = data
+                else:
+                    writer.skipped += 1
+            start = perf_counter()
+            paths = sorted(pending)
+            results = await gather(*(loop.run_in_executor(io_executor, writer.commit_file, path, pending[path])
+                                     for path in paths))
+            touched = set()
+            for path, written in zip(paths, results):
+                if written:
+                    writer.written += 1
+                    touched.add(dirname(path))
+                else:
+                    writer.unchanged += 1
+            if writer.durable and touched:
+                await loop.run_in_executor(io_executor, writer.sync_directories, touched)
+            if stats is not None:
+                stats.add("write", perf_counter() - start, len(paths))
+
+    tasks = [loop.create_task(read_all())]
+    tasks.extend(loop.create_task(convert()) for _ in range(converters))
+    tasks.append(loop.create_task(write()))
+    try:
+        await gather(*tasks)
+    except BaseException:
+        for a_task in tasks:
+            a_task.cancel()
+        if own_executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+        io_executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    if own_executor:
+        executor.shutdown()
+    io_executor.shutdown()
+    return converted, errors
@@ -3,22 +3,127 @@ the main classes for interacting with the marc2iiif library code
 """
 
 from collections import OrderedDict
+from io import BufferedIOBase, RawIOBase
+from bisect import insort
 from itertools import chain
+from json import dumps
+from json.encoder import encode_basestring_ascii
 from os import scandir
 from os.path import dirname, isdir, isfile
-from pymarc import MARCReader
 from re import compile as re_compile
+from sys import intern
+from time import perf_counter
 
-from .constants import DESCRIPTION_LOOKUPS, LABEL_LOOKUP, TITLE_LOOKUPS
-from .utils import combine_subfields_into_one_value, default_identifier_extraction, match_single_file, search_for_marc_file
+from .constants import DEFAULT_DESCRIPTION, DEFAULT_TITLE, DESCRIPTION_ROLE, IDENTIFIER_LABEL, MANIFEST_CONTEXT, \
+    MANIFEST_ID_PREFIX, MANIFEST_TYPE, MERGED_VALUE_SEPARATOR, METADATA_ROLE, REPEATED_FIRST, REPEATED_MERGE, \
+    TITLE_ROLE
+from .instrumentation import timed
+from .profiles import DEFAULT_PROFILE
+from .utils import combine_subfields_into_one_value, default_identifier_extraction, identifier_from_url, \
+    iter_marcxml_records, iter_raw_marc, match_single_file, pymarc_subfield_pairs, search_for_marc_file, \
+    search_for_marcxml_file, shared_value
+
+# orjson is imported the first time it is asked for, so short lived processes that never use
+# it do not pay for importing it
+_ORJSON = []
+
+
+def _orjson():
+    if not _ORJSON:
+        try:
+            import orjson
+        except ImportError:
+            orjson = None
+        _ORJSON.append(orjson)
+    return _ORJSON[0]
+
+
+def _manifest_sequences():
+    return [{"@id": "http://example.org/sequence",
+             "@type": "sc:Sequence",
+             "label": "First sequence",
+             "canvases": [
+                 {"@id": "http://example.org/canvas",
+                  "@type": "sc:Canvas",
+                  "label": "First canvas",
+                  "height": 1,
+                  "width": 1
+                 }
+             ]
+            }]
+
+
+# the parts of a serialized manifest that never change, laid out exactly as json.dumps would
+_MANIFEST_JSON_HEAD = '{"@context": ' + encode_basestring_ascii(MANIFEST_CONTEXT) + ', "@id": '
+_MANIFEST_JSON_LABEL = ', "@type": ' + encode_basestring_ascii(MANIFEST_TYPE) + ', "label": '
+_MANIFEST_JSON_DESCRIPTION = ', "description": '
+_MANIFEST_JSON_METADATA = ', "metadata": ['
+_MANIFEST_JSON_TAIL = '], "sequences": ' + dumps(_manifest_sequences()) + '}'
+_MANIFEST_SEQUENCES = _manifest_sequences()
+
+
+def _encode_json_value(value):
+    # a string the way json.dumps writes it, with None written as null
+    return "null" if value is None else encode_basestring_ascii(value)
+
+
+def _manifest_id(identifier):
+    return None if identifier is None else MANIFEST_ID_PREFIX + identifier
+
+
+def _dict_tagged_fields(a_dict):
+    return ((key, body) for a_field in a_dict.get("fields") for key, body in a_field.items())
+
+
+def _pymarc_tagged_fields(record):
+    return ((a_field.tag, a_field) for a_field in record.fields)
+
+
+def _combine_dict_subfields(body):
+    return combine_subfields_into_one_value(body.get("subfields"))
+
+
+def _dict_subfield(body, code):
+    for subfield in body.get("subfields"):
+        if code in subfield:
+            return subfield.get(code)
+    return None
+
+
+def _combine_pymarc_subfields(a_field):
+    return shared_value(" ".join([value for _, value in pymarc_subfield_pairs(a_field)]).strip())
+
+
+def _pymarc_subfield(a_field, code):
+    for subfield_code, value in pymarc_subfield_pairs(a_field):
+        if subfield_code == code:
+            return value
+    return None
+
+
+def _pattern_identifier(a_field, find_subfield, patterns):
+    url = find_subfield(a_field, "u")
+    if url is None:
+        return ""
+    return identifier_from_url(url, patterns) or ""
+
+
+def _merged_fields(fields):
+    # one field per label, in the order the labels first appear, holding its distinct values
+    merged = {}
+    for a_field in fields:
+        if a_field.value:
+            merged.setdefault(a_field.label, {})[a_field.value] = None
+    return [IIIFMetadataField(label, shared_value(MERGED_VALUE_SEPARATOR.join(values)))
+            for label, values in merged.items()]
 
-# TODO write abstract file reader class and inherit MarcFilesFromDisk from that
 
 class IIIFDataExtractionFromMarc:
     """
     a class to be used for retrieving and packaging metadata from MARC records for conversion to IIIF
     """
     __name__ = "IIIFDataExtractionFromMarc"
+    __slots__ = ("_metadata",)
 
     def __init__(self, metadata):
         """
@@ -51,26 +156,71 @@ class IIIFDataExtractionFromMarc:
         :returns the data in the instance as a IIIF valid dict that can be exported to json
         """
         out = OrderedDict()
-        out["@context"] = "http://iiif.io/api/presentation/2/context.json"
-        out["@id"] = "https://iiif-manifest.lib.uchicago.edu/" + self.metadata.identifier
-        out["@type"] = "sc:Manifest"
+        out["@context"] = MANIFEST_CONTEXT
+        out["@id"] = _manifest_id(self.metadata.identifier)
+        out["@type"] = MANIFEST_TYPE
         out["label"] = self.metadata.label
         out["description"] = self.metadata.description
         out["metadata"] = self.metadata.to_dict()
-        out["sequences"] = [{"@id": "http://example.org/sequence",
-                            "@type": "sc:Sequence",
-                            "label": "First sequence",
-                            "canvases": [
-                                {"@id": "http://example.org/canvas",
-                                 "@type": "sc:Canvas",
-                                 "label": "First canvas",
-                                 "height": 1,
-                                 "width": 1
-                                }
-                            ]
-                          }]
+        out["sequences"] = _manifest_sequences()
         return out
 
+    def _json_fragments(self):
+        metadata = self.metadata
+        yield _MANIFEST_JSON_HEAD
+        yield _encode_json_value(_manifest_id(metadata.identifier))
+        yield _MANIFEST_JSON_LABEL
+        yield _encode_json_value(metadata.label)
+        yield _MANIFEST_JSON_DESCRIPTION
+        yield _encode_json_value(metadata.description)
+        yield _MANIFEST_JSON_METADATA
+        yield ", ".join(['{"label": ' + _encode_json_value(a_field._label) +
+                         ', "value": ' + _encode_json_value(a_field._value) + '}'
+                         for a_field in getattr(metadata, "_fields", ()) if a_field is not None])
+        yield _MANIFEST_JSON_TAIL
+
+    def _orjson_manifest(self):
+        metadata = self.metadata
+        return _orjson().dumps({"@context": MANIFEST_CONTEXT,
+                                "@id": _manifest_id(metadata.identifier),
+                                "@type": MANIFEST_TYPE,
+                                "label": metadata.label,
+                                "description": metadata.description,
+                                "metadata": metadata.fields,
+                                "sequences": _MANIFEST_SEQUENCES})
+
+    def to_json(self, use_orjson=False):
+        """
+        a method to output the contents of the instance as a IIIF manifest json string
+
+        By default the output is exactly what json.dumps(self.to_dict()) would give, but it is
+        assembled from precomputed fragments without building the dictionary. With use_orjson
+        the manifest is encoded by orjson when it is installed, which gives compact UTF-8 json
+
+        :param bool use_orjson: whether to encode with orjson when it is available
+
+        :rtype str
+        :returns the IIIF manifest for the instance as json
+        """
+        if use_orjson and _orjson() is not None:
+            return self._orjson_manifest().decode("utf-8")
+        return "".join(self._json_fragments())
+
+    def write_to(self, a_stream, use_orjson=False):
+        """
+        a method to write the IIIF manifest json for the instance to an open file
+
+        :param a_stream: a text or binary file object opened for writing
+        :param bool use_orjson: whether to encode with orjson when it is available
+        """
+        binary = isinstance(a_stream, (RawIOBase, BufferedIOBase))
+        if use_orjson and _orjson() is not None:
+            output = self._orjson_manifest()
+            a_stream.write(output if binary else output.decode("utf-8"))
+            return
+        for a_fragment in self._json_fragments():
+            a_stream.write(a_fragment.encode("ascii") if binary else a_fragment)
+
     def show_title(self):
         """
         a method to show the title of the IIIF record
@@ -176,19 +326,38 @@ class IIIFDataExtractionFromMarc:
 
 
     @classmethod
-    def from_dict(cls, dictified_marc_record):
+    def from_dict(cls, dictified_marc_record, profile=None, stats=None, lazy=False):
         """
         a method to create an instance of IIIFDataExtractionFromMarc from a dictionary of a MARC record
 
         :param dict dictified_marc_record: a dictionary containing a complete MARC record
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long extraction takes, if anywhere
+        :param bool lazy: whether to extract each part of the metadata only when it is first used
 
         :rtype :instance:`IIIFDataExtractionFromMarc`
         """
         if not isinstance(dictified_marc_record, dict):
             raise ValueError("can only instantiate class from a dict")
-        new_metadata = IIIFMetadataBoxFromMarc.from_dict(dictified_marc_record)
+        box = LazyIIIFMetadataBoxFromMarc if lazy else IIIFMetadataBoxFromMarc
+        new_metadata = box.from_dict(dictified_marc_record, profile=profile, stats=stats)
         return cls(new_metadata)
 
+    @classmethod
+    def from_pymarc(cls, record, profile=None, stats=None, lazy=False):
+        """
+        a method to create an instance of IIIFDataExtractionFromMarc straight from a pymarc Record
+
+        :param :instance:`pymarc.Record` record: a MARC record read by pymarc
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long extraction takes, if anywhere
+        :param bool lazy: whether to extract each part of the metadata only when it is first used
+
+        :rtype :instance:`IIIFDataExtractionFromMarc`
+        """
+        box = LazyIIIFMetadataBoxFromMarc if lazy else IIIFMetadataBoxFromMarc
+        return cls(box.from_pymarc(record, profile=profile, stats=stats))
+
     def set_metadata(self, value):
         """
         sets the metadata property
@@ -204,8 +373,7 @@ class IIIFDataExtractionFromMarc:
         """
         gets the value of the metadata property
         """
-        if hasattr(self, '_metadata'):
-            return getattr(self, '_metadata')
+        return getattr(self, '_metadata', None)
    
     def del_metadata(self):
         """
@@ -222,6 +390,7 @@ class IIIFMetadataBoxFromMarc:
     """
  
     __name__ = "IIIFMetadataBoxFromMarc"
+    __slots__ = ("_label", "_description", "_identifier", "_fields", "_total", "_index", "_removed")
 
     def __init__(self, label, description, identifier, fields):
         """
@@ -256,7 +425,7 @@ class IIIFMetadataBoxFromMarc:
         return out
 
     @classmethod
-    def from_dict(cls, a_dict):
+    def from_dict(cls, a_dict, profile=None, stats=None):
         """
         a classmethod to create an instance of the class from a dictionary
 
@@ -265,38 +434,124 @@ class IIIFMetadataBoxFromMarc:
         is a list of dictionaries that contain a subfield key and a str value.
 
         :param dict a_dict: a dictionary containing a MARC record
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long extraction takes, if anywhere
+        """
+        return cls._from_tagged_fields(_dict_tagged_fields(a_dict), _combine_dict_subfields, _dict_subfield, profile, stats)
+
+    @classmethod
+    def from_pymarc(cls, record, profile=None, stats=None):
+        """
+        a classmethod to create an instance of the class straight from a pymarc Record
+
+        It produces the same metadata as from_dict(record.as_dict()) without building the
+        intermediate dictionary
+
+        :param :instance:`pymarc.Record` record: a MARC record read by pymarc
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long extraction takes, if anywhere
+        """
+        return cls._from_tagged_fields(_pymarc_tagged_fields(record), _combine_pymarc_subfields, _pymarc_subfield,
+                                       profile, stats)
+
+    @classmethod
+    def _from_tagged_fields(cls, tagged_fields, combine, find_subfield, profile=None, stats=None):
+        """
+        a classmethod doing a single pass over the fields of a record in whatever form it comes in
+
+        :param iterable tagged_fields: (MARC field, field) pairs in record order
+        :param function combine: a function merging the subfields of a field into a single string
+        :param function find_subfield: a function returning the first value of a subfield code
+         in a field, or None
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long each part of extraction
+         takes; nothing is timed when it is None
         """
-        fields = []
+        timing = stats is not None
+        if timing:
+            start = perf_counter()
+            role_seconds = {TITLE_ROLE: 0.0, DESCRIPTION_ROLE: 0.0, METADATA_ROLE: 0.0}
+            role_counts = {TITLE_ROLE: 0, DESCRIPTION_ROLE: 0, METADATA_ROLE: 0}
+        profile = profile or DEFAULT_PROFILE
+        dispatch_table = profile.dispatch
+        patterns = profile.identifier_patterns
         identifier = ""
-        label = ""
-        description = ""
-        fields = a_dict.get("fields")
-        match_titles = [list(set(x.keys()) & set(TITLE_LOOKUPS))[0] 
-            for x in fields if list(set(x.keys() & set(TITLE_LOOKUPS)))]
-        match_descriptions = [list(set(x.keys()) & set(DESCRIPTION_LOOKUPS))[0] 
-            for x in fields  if list(set(x.keys() & set(DESCRIPTION_LOOKUPS)))]
-        match_mdata_fields = [list(set(x.keys()) & set(LABEL_LOOKUP.keys()))[0]
-            for x in fields if list(set(x.keys()) & set(LABEL_LOOKUP.keys()))]
-        label = "An untitled Cultural Heritage Object"
-        description = "This Cultural Heritage Object does not have a description"
+        label = DEFAULT_TITLE
+        description = DEFAULT_DESCRIPTION
+        repeated_first = profile.repeated == REPEATED_FIRST
+        max_values = profile.max_values
         metadata = []
-        for key in match_titles + match_descriptions + match_mdata_fields:
-            if key in TITLE_LOOKUPS:
-                subfields = [x.get(key).get("subfields") for x in fields if x.get(key)][0]
-                label = [x for x in subfields if 'a' in x.keys()][0].get("a")
-            elif key in DESCRIPTION_LOOKUPS:
-                description = [combine_subfields_into_one_value(x.get(key).get("subfields")) for x in fields if x.get(key)][0]
-            elif key in LABEL_LOOKUP.keys():
-                metadata.append(
-                    IIIFMetadataField(LABEL_LOOKUP.get(key),
-                    [combine_subfields_into_one_value(x.get(key).get("subfields"))
-                        for x in fields if x.get(key)][0])
-                )
-        if metadata:
-            pot_id = [x.value for x in metadata if x.label == 'Electronic Location and Access']
-            if pot_id:
-                identifier = pot_id[0]
-        return cls(label, description, identifier, metadata)
+        # every occurrence of a metadata field is combined as it is met, unless the profile asks
+        # for the value of the first occurrence of each tag or the label has reached max_values
+        first_values = {}
+        label_counts = {}
+        description_values = {}
+        title_fields = {}
+        title_tag = None
+        description_tag = None
+        for key, a_field in tagged_fields:
+            dispatch = dispatch_table.get(key)
+            if not dispatch:
+                continue
+            role, field_label = dispatch
+            if timing:
+                role_start = perf_counter()
+            if role == TITLE_ROLE:
+                title_tag = key
+                if key not in title_fields:
+                    title_fields[key] = a_field
+            elif role == DESCRIPTION_ROLE:
+                description_tag = key
+                if key not in description_values:
+                    description_values[key] = combine(a_field)
+            else:
+                wanted = not max_values or label_counts.get(field_label, 0) < max_values
+                value = None
+                if wanted or (not identifier and not patterns and field_label == IDENTIFIER_LABEL):
+                    if not repeated_first:
+                        value = combine(a_field)
+                    elif key in first_values:
+                        value = first_values[key]
+                    else:
+                        value = first_values[key] = combine(a_field)
+                    if wanted:
+                        if max_values:
+                            label_counts[field_label] = label_counts.get(field_label, 0) + 1
+                        metadata.append(IIIFMetadataField(field_label, value))
+                if not identifier and field_label == IDENTIFIER_LABEL:
+                    if patterns:
+                        identifier = _pattern_identifier(a_field, find_subfield, patterns)
+                    else:
+                        identifier = value
+            if timing:
+                role_seconds[role] += perf_counter() - role_start
+                role_counts[role] += 1
+        if description_tag:
+            description = description_values[description_tag]
+        if timing:
+            role_start = perf_counter()
+        if title_tag:
+            title = find_subfield(title_fields[title_tag], "a")
+            if title is not None:
+                label = title
+        if timing:
+            # merging the metadata fields and building the box are charged to metadata
+            role_end = perf_counter()
+            role_seconds[TITLE_ROLE] += role_end - role_start
+            role_start = role_end
+        if profile.repeated == REPEATED_MERGE:
+            metadata = _merged_fields(metadata)
+        new_box = cls(label, description, identifier, metadata)
+        if timing:
+            role_seconds[METADATA_ROLE] += perf_counter() - role_start
+            total = perf_counter() - start
+            stats.add("extract", total)
+            stats.add("extract.match", total - sum(role_seconds.values()))
+            for role, seconds in role_seconds.items():
+                stats.add("extract." + role, seconds, role_counts[role])
+            if patterns:
+                stats.add("identifier.matched" if identifier else "identifier.missed", 0.0)
+        return new_box
 
     def add_field(self, a_field):
         """
@@ -307,48 +562,104 @@ class IIIFMetadataBoxFromMarc:
         if isinstance(a_field, IIIFMetadataField):
             if hasattr(self, '_fields'):
                 self._fields.append(a_field)
+                if self._index is not None:
+                    self._index.setdefault((a_field._label, a_field._value), []).append(len(self._fields) - 1)
             else:
                 self.fields = [a_field]
         else:
             raise ValueError("fields can only contain IIIFMetadataFields")
 
+    def _field_index(self):
+        # the (label, value) -> positions index is only built once a record is first edited, so
+        # plain conversion runs never pay for it; removed fields leave a None behind in _fields
+        # until more than half of the list is empty, when it is compacted
+        if self._index is None:
+            if not hasattr(self, "_fields"):
+                return {}
+            self._fields = [n for n in self._fields if n is not None]
+            self._removed = 0
+            index = {}
+            for position, n_field in enumerate(self._fields):
+                index.setdefault((n_field._label, n_field._value), []).append(position)
+            self._index = index
+        return self._index
+
+    def _position_of(self, a_field):
+        for position in self._field_index().get((a_field._label, a_field._value), ()):
+            if self._fields[position] is a_field:
+                return position
+        raise ValueError("field is not in this metadata box")
+
+    def _unindex(self, key, position):
+        positions = self._index[key]
+        positions.remove(position)
+        if not positions:
+            del self._index[key]
+
     def _find_field(self, field_name, field_value):
-        for n in self._fields:
-            if n.label == field_name and n.value == field_value:
-                return [n]
+        positions = self._field_index().get((field_name, field_value))
+        if positions:
+            return [self._fields[positions[0]]]
         return []
 
     def _replace_field_value(self, field_to_mod, new_value):
-        self._fields[self._fields.index(field_to_mod)].value = new_value
+        position = self._position_of(field_to_mod)
+        self._unindex((field_to_mod._label, field_to_mod._value), position)
+        field_to_mod.value = new_value
+        insort(self._index.setdefault((field_to_mod._label, field_to_mod._value), []), position)
 
     def _remove_metadata_field(self, field_to_delete):
-        position = self._fields.index(field_to_delete) 
-        del self._fields[position]
+        position = self._position_of(field_to_delete)
+        self._unindex((field_to_delete._label, field_to_delete._value), position)
+        self._fields[position] = None
+        self._removed += 1
+        if self._removed * 2 > len(self._fields):
+            self._index = None
+            self._field_index()
+
+    def _bulk_edit(self, edits):
+        # one pass over the fields for a whole set of edits; edits maps (label, value) to the
+        # new value, or to None for the field to be removed
+        matched = {}
+        kept = []
+        for n_field in getattr(self, "_fields", ()):
+            if n_field is None:
+                continue
+            key = (n_field._label, n_field._value)
+            if key in edits:
+                matched[key] = matched.get(key, 0) + 1
+                new_value = edits[key]
+                if new_value is None:
+                    continue
+                n_field.value = new_value
+            kept.append(n_field)
+        if matched:
+            self._fields = kept
+            self._index = None
+        return matched
 
     def get_fields(self):
-        output = []
-        if hasattr(self, "_fields"):
-            for n_field in getattr(self, "_fields"):
-                output.append({"label": n_field.label, "value": n_field.value})
-        return output
+        return [{"label": n_field._label, "value": n_field._value} for n_field in getattr(self, "_fields", ())
+                if n_field is not None]
 
     def set_fields(self, value):
         for a_field in value:
             if not isinstance(a_field, IIIFMetadataField):
                 raise ValueError("fields can only contain IIIFMetadataField instances")
         self._fields = value
+        self._index = None
 
     def del_fields(self):
         if hasattr(self, "_fields"):
             delattr(self, "_fields")
+        self._index = None
 
     def get_label(self):
-        if hasattr(self, "_label"):
-            return getattr(self, "_label")
+        return getattr(self, "_label", None)
 
     def set_label(self, value):
         if isinstance(value, str):
-            setattr(self, "_label", value)
+            self._label = value
         else:
             raise ValueError("total property can only be an integer")
 
@@ -357,12 +668,11 @@ class IIIFMetadataBoxFromMarc:
             del self._fields 
 
     def get_description(self):
-        if hasattr(self, "_description"):
-            return getattr(self, "_description")
+        return getattr(self, "_description", None)
 
     def set_description(self, value):
         if isinstance(value, str):
-            setattr(self, "_description", value)
+            self._description = value
 
     def del_description(self):
         if hasattr(self, "_description"):
@@ -383,11 +693,10 @@ class IIIFMetadataBoxFromMarc:
             delattr(self, "_total")
 
     def set_identifier(self, value):
-            setattr(self, '_identifier', value)
+            self._identifier = value
 
     def get_identifier(self):
-        if hasattr(self, '_identifier'):
-            return getattr(self, '_identifier')
+        return getattr(self, '_identifier', None)
    
     def del_identifier(self):
         if hasattr(self, '_identifier'):
@@ -399,12 +708,210 @@ class IIIFMetadataBoxFromMarc:
     fields = property(get_fields, set_fields, del_fields)
     total = property(get_total, set_total, del_total)
 
+
+def _lazy_part(name):
+    # wraps one of the slots of IIIFMetadataBoxFromMarc so that it is filled in from the record
+    # on first access; once set or deleted by hand it behaves exactly like the plain slot
+    slot = getattr(IIIFMetadataBoxFromMarc, name)
+
+    def get(self):
+        if name in self._pending:
+            slot.__set__(self, self._resolve(name))
+        return slot.__get__(self)
+
+    def set(self, value):
+        self._pending.discard(name)
+        slot.__set__(self, value)
+
+    def delete(self):
+        self._pending.discard(name)
+        slot.__delete__(self)
+
+    return property(get, set, delete)
+
+
+class LazyIIIFMetadataBoxFromMarc(IIIFMetadataBoxFromMarc):
+    """
+    a class to be used for extracting IIIF metadata from a MARC record only as it is needed
+
+    It keeps a reference to the record and works out the title, the description, the identifier
+    and the metadata fields each on first access, so a job that only needs the label and the
+    identifier never combines the subfields of any other field. Each part gives the same result
+    as IIIFMetadataBoxFromMarc would, and once everything is resolved the record is let go
+    """
+    __name__ = "LazyIIIFMetadataBoxFromMarc"
+    __slots__ = ("_record", "_tagged_fields", "_combine", "_find_subfield", "_dispatch", "_patterns", "_repeated",
+                 "_max_values", "_stats", "_pending")
+
+    _STAGES = {"_label": "extract." + TITLE_ROLE, "_description": "extract." + DESCRIPTION_ROLE,
+               "_identifier": "extract.identifier", "_fields": "extract." + METADATA_ROLE}
+
+    def __init__(self, record, tagged_fields, combine, find_subfield, profile=None, stats=None):
+        """
+        initializes an instance of the class
+
+        :param record: a MARC record, dictified or read by pymarc
+        :param function tagged_fields: a function returning the (MARC field, field) pairs of the
+         record in record order
+        :param function combine: a function merging the subfields of a field into a single string
+        :param function find_subfield: a function returning the first value of a subfield code
+         in a field, or None
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long each part takes to
+         resolve, if anywhere
+
+        :rtype :instance:`LazyIIIFMetadataBoxFromMarc`
+        """
+        self._record = record
+        self._tagged_fields = tagged_fields
+        self._combine = combine
+        self._find_subfield = find_subfield
+        profile = profile or DEFAULT_PROFILE
+        self._dispatch = profile.dispatch
+        self._patterns = profile.identifier_patterns
+        self._repeated = profile.repeated
+        self._max_values = profile.max_values
+        self._stats = stats
+        self._pending = set(self._STAGES)
+        self._index = None
+
+    @classmethod
+    def from_dict(cls, a_dict, profile=None, stats=None):
+        """
+        a classmethod to create an instance of the class from a dictionary without extracting anything yet
+
+        :param dict a_dict: a dictionary containing a MARC record
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long extraction takes, if anywhere
+        """
+        return cls(a_dict, _dict_tagged_fields, _combine_dict_subfields, _dict_subfield, profile, stats)
+
+    @classmethod
+    def from_pymarc(cls, record, profile=None, stats=None):
+        """
+        a classmethod to create an instance of the class from a pymarc Record without extracting anything yet
+
+        :param :instance:`pymarc.Record` record: a MARC record read by pymarc
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long extraction takes, if anywhere
+        """
+        return cls(record, _pymarc_tagged_fields, _combine_pymarc_subfields, _pymarc_subfield, profile, stats)
+
+    def __reduce__(self):
+        # pickled, e.g. to be sent to another process, as the plain box it resolves to
+        return (IIIFMetadataBoxFromMarc, (self.label, self.description, self.identifier,
+                                          [n_field for n_field in self._fields if n_field is not None]))
+
+    @property
+    def resolved(self):
+        """
+        whether every part of the metadata has been extracted from the record
+        """
+        return not self._pending
+
+    def _resolve(self, name):
+        resolver = getattr(self, "_resolve" + name)
+        if self._stats is None:
+            value = resolver()
+        else:
+            with self._stats.time(self._STAGES[name]):
+                value = resolver()
+        self._pending.discard(name)
+        if not self._pending:
+            self._record = None
+        return value
+
+    def _matching(self, role):
+        dispatch_table = self._dispatch
+        for key, a_field in self._tagged_fields(self._record):
+            dispatch = dispatch_table.get(key)
+            if dispatch and dispatch[0] == role:
+                yield key, dispatch[1], a_field
+
+    def _resolve_label(self):
+        # the first occurrence of the last title field seen gives the title
+        title_fields = {}
+        title_tag = None
+        for key, _, a_field in self._matching(TITLE_ROLE):
+            title_tag = key
+            title_fields.setdefault(key, a_field)
+        if title_tag:
+            title = self._find_subfield(title_fields[title_tag], "a")
+            if title is not None:
+                return title
+        return DEFAULT_TITLE
+
+    def _resolve_description(self):
+        # the first occurrence of the last description field seen gives the description
+        description_fields = {}
+        description_tag = None
+        for key, _, a_field in self._matching(DESCRIPTION_ROLE):
+            description_tag = key
+            description_fields.setdefault(key, a_field)
+        if description_tag:
+            return self._combine(description_fields[description_tag])
+        return DEFAULT_DESCRIPTION
+
+    def _resolve_identifier(self):
+        identifier = self._find_identifier()
+        if self._patterns and self._stats is not None:
+            self._stats.add("identifier.matched" if identifier else "identifier.missed", 0.0)
+        return identifier
+
+    def _find_identifier(self):
+        first_values = {}
+        for key, field_label, a_field in self._matching(METADATA_ROLE):
+            if field_label == IDENTIFIER_LABEL:
+                if self._patterns:
+                    identifier = _pattern_identifier(a_field, self._find_subfield, self._patterns)
+                    if identifier:
+                        return identifier
+                    continue
+                if self._repeated != REPEATED_FIRST:
+                    value = self._combine(a_field)
+                elif key in first_values:
+                    value = first_values[key]
+                else:
+                    value = first_values[key] = self._combine(a_field)
+                if value:
+                    return value
+        return ""
+
+    def _resolve_fields(self):
+        repeated_first = self._repeated == REPEATED_FIRST
+        max_values = self._max_values
+        first_values = {}
+        label_counts = {}
+        metadata = []
+        for key, field_label, a_field in self._matching(METADATA_ROLE):
+            if max_values:
+                if label_counts.get(field_label, 0) >= max_values:
+                    continue
+                label_counts[field_label] = label_counts.get(field_label, 0) + 1
+            if not repeated_first:
+                value = self._combine(a_field)
+            elif key in first_values:
+                value = first_values[key]
+            else:
+                value = first_values[key] = self._combine(a_field)
+            metadata.append(IIIFMetadataField(field_label, value))
+        if self._repeated == REPEATED_MERGE:
+            metadata = _merged_fields(metadata)
+        return metadata
+
+    _label = _lazy_part("_label")
+    _description = _lazy_part("_description")
+    _identifier = _lazy_part("_identifier")
+    _fields = _lazy_part("_fields")
+
+
 class IIIFMetadataField:
     """
     a class to be used for extracting IIIF metadata from a Marc record
     """
  
     __name__ = "IIIFMetadataField"
+    __slots__ = ("_label", "_value")
 
     def __init__(self, name, value):
         """
@@ -431,16 +938,18 @@ class IIIFMetadataField:
         """
         gets the value of the label property
         """
-        return getattr(self, "_label")
+        return self._label
 
     def set_label(self, value):
         """
         sets the value of the label property
 
+        Labels come from a small vocabulary so they are interned and shared by every field
+
         :param str value: the value to set on the property
         """
         if isinstance(value, str):
-            setattr(self, "_label", value)
+            self._label = intern(value)
         else:
             raise ValueError("field must be a string")
 
@@ -455,7 +964,7 @@ class IIIFMetadataField:
         """
         gets teh value of the value property
         """
-        return getattr(self, "_value")
+        return self._value
 
     def set_value(self, value):
         """
@@ -464,7 +973,7 @@ class IIIFMetadataField:
         :param str value: the value of the value to set
         """
         if isinstance(value, str):
-            setattr(self, "_value", value)
+            self._value = value
         else:
             raise ValueError("value must be a string")
 
@@ -477,3 +986,240 @@ class IIIFMetadataField:
 
     label = property(get_label, set_label, del_label)
     value = property(get_value, set_value, del_value)
+
+
+class MarcFilesReader:
+    """
+    an abstract class to be used for streaming MARC records from one or more files on disk
+
+    Subclasses only need to define read_file, which must yield one dictified MARC record
+    at a time so that a file is never loaded into memory as a whole
+    """
+    __name__ = "MarcFilesReader"
+
+    def __init__(self, file_path, callback=search_for_marc_file, profile=None, stats=None, lazy=False):
+        """
+        initializes an instance of the class
+
+        :param str file_path: a path to a MARC file or a directory tree containing MARC files
+        :param function callback: a function used to decide whether a file in a directory
+         tree should be read
+        :param :instance:`MappingProfile` profile: the field mapping used to convert the records;
+         defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long each stage takes, if anywhere
+        :param bool lazy: whether extractions only extract each part of the metadata when it is used
+
+        :rtype :instance:`MarcFilesReader`
+        """
+        if not isdir(file_path) and not isfile(file_path):
+            msg = "{} is neither a directory nor a regular file on this disk!".format(file_path)
+            raise ValueError(msg)
+        self.file_path = file_path
+        self.callback = callback
+        self.profile = profile
+        self.stats = stats
+        self.lazy = lazy
+
+    def __repr__(self):
+        return self.__name__ + " reading " + self.file_path
+
+    def __iter__(self):
+        """
+        a method to iterate through the dictified records in the instance
+
+        :rtype generator
+        :returns a generator of dictionaries in the format expected by
+         IIIFDataExtractionFromMarc.from_dict
+        """
+        for a_file in self.files():
+            yield from self.read_file(a_file)
+
+    def files(self):
+        """
+        a method to find every file this instance will read, in sorted order
+
+        :rtype generator
+        :returns a generator of file paths
+        """
+        if isfile(self.file_path):
+            yield self.file_path
+        else:
+            yield from self._walk(self.file_path)
+
+    def _walk(self, a_path):
+        entries = sorted(scandir(a_path), key=lambda x: x.name)
+        for n_item in entries:
+            if n_item.is_dir():
+                yield from self._walk(n_item.path)
+            elif n_item.is_file() and self.callback(n_item.path):
+                yield n_item.path
+
+    def read_file(self, a_file):
+        """
+        a method to read the MARC records out of a single file
+
+        :param str a_file: a path to a file containing MARC records
+
+        :rtype generator
+        :returns a generator of dictified MARC records
+        """
+        raise NotImplementedError
+
+    def extractions(self):
+        """
+        a method to convert each record read into an IIIFDataExtractionFromMarc
+
+        :rtype generator
+        :returns a generator of :instance:`IIIFDataExtractionFromMarc`
+        """
+        for record in self:
+            yield IIIFDataExtractionFromMarc.from_dict(record, profile=self.profile, stats=self.stats, lazy=self.lazy)
+
+    def manifests(self):
+        """
+        a method to convert each record read into a IIIF manifest dictionary
+
+        :rtype generator
+        :returns a generator of IIIF valid dicts
+        """
+        stats = self.stats
+        for an_extraction in self.extractions():
+            if stats is None:
+                yield an_extraction.to_dict()
+            else:
+                with stats.time("to_dict"):
+                    manifest = an_extraction.to_dict()
+                yield manifest
+
+
+class MarcFilesFromDisk(MarcFilesReader):
+    """
+    a class to be used for streaming records from binary MARC files on disk
+    """
+    __name__ = "MarcFilesFromDisk"
+
+    def __init__(self, file_path, callback=search_for_marc_file, profile=None, stats=None, lazy=False,
+                 duplicates=None):
+        """
+        initializes an instance of the class
+
+        :param str file_path: a path to a MARC file or a directory tree containing MARC files
+        :param function callback: a function used to decide whether a file in a directory
+         tree should be read
+        :param :instance:`MappingProfile` profile: the field mapping used to convert the records;
+         defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long each stage takes, if anywhere
+        :param bool lazy: whether extractions only extract each part of the metadata when it is used
+        :param :instance:`marc2iiif.dedup.DuplicateFilter` duplicates: a filter to skip every record
+         already read, from this or any other reader sharing it, before it is parsed
+
+        :rtype :instance:`MarcFilesFromDisk`
+        """
+        super().__init__(file_path, callback=callback, profile=profile, stats=stats, lazy=lazy)
+        self.duplicates = duplicates
+        self.errors = []
+
+    def read_file(self, a_file):
+        """
+        a method to read the records of a binary MARC file one at a time
+
+        Records that pymarc cannot decode are skipped
+
+        :param str a_file: a path to a binary MARC file
+
+        :rtype generator
+        :returns a generator of dictified MARC records
+        """
+        stats = self.stats
+        for record in self.read_pymarc_file(a_file):
+            if stats is None:
+                yield record.as_dict()
+            else:
+                with stats.time("dictify"):
+                    dictified = record.as_dict()
+                yield dictified
+
+    def read_pymarc_file(self, a_file):
+        """
+        a method to read the records of a binary MARC file one at a time as pymarc Records
+
+        Records that pymarc cannot decode are skipped, as are duplicates when the instance has
+        a duplicate filter. Undecodable records, and a damaged record length that ends the file
+        early, are added to errors as (path, byte offset, message) tuples
+
+        :param str a_file: a path to a binary MARC file
+
+        :rtype generator
+        :returns a generator of :instance:`pymarc.Record`
+        """
+        yield from timed(self._read_records(a_file), self.stats, "read")
+
+    def _read_records(self, a_file):
+        # pymarc is only imported once a binary MARC file is actually read
+        from pymarc import Record
+        position = 0
+        try:
+            with open(a_file, 'rb') as a_stream:
+                raw_records = iter_raw_marc(a_stream)
+                if self.duplicates is not None:
+                    raw_records = self.duplicates.filter(raw_records)
+                for offset, raw_record in raw_records:
+                    position = offset + len(raw_record)
+                    try:
+                        record = Record(data=raw_record)
+                    except Exception as an_error:
+                        self.errors.append((a_file, offset, "{}: {}".format(type(an_error).__name__, an_error)))
+                        continue
+                    yield record
+        except ValueError as an_error:
+            # the records after a damaged record length cannot be found
+            self.errors.append((a_file, position, "{}: {}".format(type(an_error).__name__, an_error)))
+
+    def extractions(self):
+        """
+        a method to convert each record read into an IIIFDataExtractionFromMarc
+
+        The pymarc records are converted directly, without dictifying them first
+
+        :rtype generator
+        :returns a generator of :instance:`IIIFDataExtractionFromMarc`
+        """
+        for a_file in self.files():
+            for record in self.read_pymarc_file(a_file):
+                yield IIIFDataExtractionFromMarc.from_pymarc(record, profile=self.profile, stats=self.stats,
+                                                             lazy=self.lazy)
+
+
+class MarcXMLFilesFromDisk(MarcFilesReader):
+    """
+    a class to be used for streaming records from MARCXML files on disk
+    """
+    __name__ = "MarcXMLFilesFromDisk"
+
+    def __init__(self, file_path, callback=search_for_marcxml_file, profile=None, stats=None, lazy=False):
+        """
+        initializes an instance of the class
+
+        :param str file_path: a path to a MARCXML file or a directory tree containing MARCXML files
+        :param function callback: a function used to decide whether a file in a directory
+         tree should be read
+        :param :instance:`MappingProfile` profile: the field mapping used to convert the records;
+         defaults to constants.py
+        :param :instance:`PipelineStats` stats: where to record how long each stage takes, if anywhere
+        :param bool lazy: whether extractions only extract each part of the metadata when it is used
+
+        :rtype :instance:`MarcXMLFilesFromDisk`
+        """
+        super().__init__(file_path, callback=callback, profile=profile, stats=stats, lazy=lazy)
+
+    def read_file(self, a_file):
+        """
+        a method to incrementally parse the records of a MARCXML file one at a time
+
+        :param str a_file: a path to a MARCXML file
+
+        :rtype generator
+        :returns a generator of dictified MARC records
+        """
+        with open(a_file, 'rb') as a_stream:
+            yield from timed(iter_marcxml_records(a_stream), self.stats, "read")
@@ -0,0 +1,237 @@
+"""
+column oriented extraction of IIIF metadata from whole batches of MARC records
+
+For analytics over a catalog only a handful of values per record are wanted, so instead of
+building a IIIFDataExtractionFromMarc per record the batch is turned straight into one list
+per column: the identifier, the label and the description of each record, and one column per
+metadata label of the mapping profile. The tags to look at are worked out once per batch from
+the columns asked for; every other field is skipped without being read, and no metadata box
+or field objects are made.
+
+    >>> records = MarcFilesFromDisk("/path/to/dump.mrc").read_pymarc_file("/path/to/dump.mrc")
+    >>> columns = MetadataColumns.from_pymarc(records, names=["identifier", "label", "Local Subject"])
+    >>> columns.to_csv(open("/tmp/catalog.csv", "w", newline=""))
+"""
+
+from array import array
+from csv import writer as csv_writer
+
+from .classes import _combine_dict_subfields, _combine_pymarc_subfields, _dict_subfield, _dict_tagged_fields, \
+    _pattern_identifier, _pymarc_subfield, _pymarc_tagged_fields
+from .constants import DEFAULT_DESCRIPTION, DEFAULT_TITLE, DESCRIPTION_ROLE, IDENTIFIER_LABEL, \
+    MERGED_VALUE_SEPARATOR, METADATA_ROLE, REPEATED_FIRST, REPEATED_MERGE, TITLE_ROLE
+from .profiles import DEFAULT_PROFILE
+
+IDENTIFIER_COLUMN = "identifier"
+LABEL_COLUMN = "label"
+DESCRIPTION_COLUMN = "description"
+RECORD_COLUMNS = (IDENTIFIER_COLUMN, LABEL_COLUMN, DESCRIPTION_COLUMN)
+
+
+def column_names(profile=None):
+    """
+    a function to list every column a batch can be extracted into
+
+    :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+
+    :rtype list
+    :returns the record columns followed by the metadata labels of the profile, in mapping order
+    """
+    profile = profile or DEFAULT_PROFILE
+    return list(RECORD_COLUMNS) + list(dict.fromkeys(profile.label_lookup.values()))
+
+
+class MetadataColumns:
+    """
+    a class to be used for holding the metadata of a batch of records as one list per column
+    """
+    __name__ = "MetadataColumns"
+
+    def __init__(self, columns):
+        """
+        initializes an instance of the class
+
+        :param dict columns: column names mapped to lists of equal length; a value is None when
+         a record has no field for that column, and multiple values of a metadata label are
+         joined by '; '
+
+        :rtype :instance:`MetadataColumns`
+        """
+        self.columns = columns
+        self.names = list(columns)
+
+    def __repr__(self):
+        return "{} of {} records in {} columns".format(self.__name__, len(self), len(self.names))
+
+    def __len__(self):
+        return len(self.columns[self.names[0]]) if self.names else 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def from_dicts(cls, records, names=None, profile=None):
+        """
+        a classmethod to extract the columns of a batch of dictified MARC records
+
+        :param iterable records: dictionaries in the format IIIFDataExtractionFromMarc.from_dict expects
+        :param list names: the columns to extract, from column_names(profile); defaults to all of
+         them, and a name given more than once is only extracted once
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+
+        :rtype :instance:`MetadataColumns`
+        """
+        return cls._extract(records, _dict_tagged_fields, _combine_dict_subfields, _dict_subfield, names, profile)
+
+    @classmethod
+    def from_pymarc(cls, records, names=None, profile=None):
+        """
+        a classmethod to extract the columns of a batch of pymarc Records
+
+        :param iterable records: instances of :instance:`pymarc.Record`
+        :param list names: the columns to extract, from column_names(profile); defaults to all of
+         them, and a name given more than once is only extracted once
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+
+        :rtype :instance:`MetadataColumns`
+        """
+        return cls._extract(records, _pymarc_tagged_fields, _combine_pymarc_subfields, _pymarc_subfield, names,
+                            profile)
+
+    @classmethod
+    def _extract(cls, records, tagged_fields, combine, find_subfield, names, profile):
+        # every value matches what IIIFMetadataBoxFromMarc would extract for the same record and profile
+        profile = profile or DEFAULT_PROFILE
+        available = column_names(profile)
+        # a column asked for twice is extracted once
+        names = available if names is None else list(dict.fromkeys(names))
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValueError("no column named {}".format(", ".join(unknown)))
+        wanted = set(names)
+        want_identifier = IDENTIFIER_COLUMN in wanted
+        patterns = profile.identifier_patterns
+        repeated_first = profile.repeated == REPEATED_FIRST
+        merge = profile.repeated == REPEATED_MERGE
+        max_values = profile.max_values
+        # the batch dispatch table only holds the tags some wanted column needs
+        dispatch = {}
+        for tag, (role, label) in profile.dispatch.items():
+            if role == TITLE_ROLE and LABEL_COLUMN in wanted:
+                dispatch[tag] = (role, None, False)
+            elif role == DESCRIPTION_ROLE and DESCRIPTION_COLUMN in wanted:
+                dispatch[tag] = (role, None, False)
+            elif role == METADATA_ROLE:
+                identifying = want_identifier and label == IDENTIFIER_LABEL
+                if label in wanted or identifying:
+                    dispatch[tag] = (role, label if label in wanted else None, identifying)
+        metadata_names = [name for name in names if name not in RECORD_COLUMNS]
+        columns = {name: [] for name in names}
+        identifiers = columns.get(IDENTIFIER_COLUMN)
+        labels = columns.get(LABEL_COLUMN)
+        descriptions = columns.get(DESCRIPTION_COLUMN)
+        metadata_columns = [(name, columns[name]) for name in metadata_names]
+        for record in records:
+            identifier = ""
+            title_tag = None
+            title_fields = {}
+            description_tag = None
+            description_values = {}
+            first_values = {}
+            values = {}
+            for key, a_field in tagged_fields(record):
+                entry = dispatch.get(key)
+                if entry is None:
+                    continue
+                role, label, identifying = entry
+                if role == TITLE_ROLE:
+                    title_tag = key
+                    if key not in title_fields:
+                        title_fields[key] = a_field
+                elif role == DESCRIPTION_ROLE:
+                    description_tag = key
+                    if key not in description_values:
+                        description_values[key] = combine(a_field)
+                else:
+                    kept = values.get(label) if label is not None else None
+                    wanted_value = label is not None and (not max_values or kept is None or len(kept) < max_values)
+                    value = None
+                    if wanted_value or (identifying and not identifier and not patterns):
+                        if not repeated_first:
+                            value = combine(a_field)
+                        elif key in first_values:
+                            value = first_values[key]
+                        else:
+                            value = first_values[key] = combine(a_field)
+                        if wanted_value:
+                            if kept is None:
+                                values[label] = [value]
+                            else:
+                                kept.append(value)
+                    if identifying and not identifier:
+                        identifier = _pattern_identifier(a_field, find_subfield, patterns) if patterns else value
+            if identifiers is not None:
+                identifiers.append(identifier)
+            if labels is not None:
+                title = find_subfield(title_fields[title_tag], "a") if title_tag else None
+                labels.append(DEFAULT_TITLE if title is None else title)
+            if descriptions is not None:
+                descriptions.append(description_values[description_tag] if description_tag else DEFAULT_DESCRIPTION)
+            for name, column in metadata_columns:
+                kept = values.get(name)
+                if kept is None:
+                    column.append(None)
+                elif merge:
+                    column.append(MERGED_VALUE_SEPARATOR.join(dict.fromkeys(x for x in kept if x)) or None)
+                else:
+                    column.append(kept[0] if len(kept) == 1 else MERGED_VALUE_SEPARATOR.join(kept))
+        return cls(columns)
+
+    def rows(self):
+        """
+        a method to go through the batch one record at a time
+
+        :rtype iterator
+        :returns tuples of values in the order of names
+        """
+        return zip(*[self.columns[name] for name in self.names])
+
+    def to_csv(self, a_stream):
+        """
+        a method to write the batch as CSV with a header row of column names
+
+        Missing values are written as empty strings
+
+        :param a_stream: a text file object opened for writing with newline=''
+        """
+        out = csv_writer(a_stream)
+        out.writerow(self.names)
+        out.writerows(self.rows())
+
+    def to_buffers(self):
+        """
+        a method to lay out every column the way Arrow lays out a large_string array
+
+        Each column becomes a validity bitmap with a bit set for every record that has a value,
+        an array of len(self) + 1 64 bit offsets into the data and the UTF-8 data itself, which
+        can be handed to, e.g., pyarrow.Array.from_buffers without copying any values
+
+        :rtype dict
+        :returns column names mapped to (validity bytes, offsets array, data bytes) tuples
+        """
+        buffers = {}
+        for name in self.names:
+            column = self.columns[name]
+            validity = bytearray((len(column) + 7) // 8)
+            offsets = array("q", [0])
+            encoded = []
+            position = 0
+            for n, value in enumerate(column):
+                if value is not None:
+                    validity[n >> 3] |= 1 << (n & 7)
+                    data = value.encode("utf-8")
+                    encoded.append(data)
+                    position += len(data)
+                offsets.append(position)
+            buffers[name] = (bytes(validity), offsets, b"".join(encoded))
+        return buffers
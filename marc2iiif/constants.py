@@ -7,6 +7,23 @@ TITLE_LOOKUPS is a list of MARC fields that could be classified as giving title
 
 LABEL_LOOKUPS is a a dictionary where the key is the MARC field and the value is the human 
 interpretable string explaining what that field is
+
+MANIFEST_CONTEXT, MANIFEST_ID_PREFIX and MANIFEST_TYPE are the fixed parts of every IIIF manifest
+that gets output
+
+DEFAULT_TITLE and DEFAULT_DESCRIPTION are used for records without a title or description field,
+and the first metadata field labelled IDENTIFIER_LABEL gives a record its identifier
+
+IDENTIFIER_PATTERNS is a list of regular expressions whose first group is the identifier in a
+pi.lib URL; a mapping profile can use them to take identifiers from subfield u of those fields
+
+REPEATED_ALL, REPEATED_FIRST and REPEATED_MERGE are the ways a mapping profile can treat a
+metadata field occurring more than once: one metadata field per occurrence with its own value,
+one per occurrence all with the value of the first, or a single field per label holding every
+distinct value joined by MERGED_VALUE_SEPARATOR
+
+TAG_DISPATCH is a dictionary built once at import time from the three lookups above where the key
+is the MARC field and the value is a (role, label) tuple telling the extractor what to do with it
 """
 
 DESCRIPTION_LOOKUPS = [
@@ -179,3 +196,57 @@ LABEL_LOOKUP = {
 TITLE_LOOKUPS = [
     "245"
 ]
+
+MANIFEST_CONTEXT = "http://iiif.io/api/presentation/2/context.json"
+
+MANIFEST_ID_PREFIX = "https://iiif-manifest.lib.uchicago.edu/"
+
+MANIFEST_TYPE = "sc:Manifest"
+
+DEFAULT_TITLE = "An untitled Cultural Heritage Object"
+
+DEFAULT_DESCRIPTION = "This Cultural Heritage Object does not have a description"
+
+IDENTIFIER_LABEL = "Electronic Location and Access"
+
+IDENTIFIER_PATTERNS = [
+    r"^https?://pi\.lib\.uchicago\.edu/1001/(.+)$"
+]
+
+REPEATED_ALL = "all"
+REPEATED_FIRST = "first"
+REPEATED_MERGE = "merge"
+REPEATED_FIELD_MODES = (REPEATED_ALL, REPEATED_FIRST, REPEATED_MERGE)
+
+MERGED_VALUE_SEPARATOR = "; "
+
+TITLE_ROLE = "title"
+DESCRIPTION_ROLE = "description"
+METADATA_ROLE = "metadata"
+
+
+def build_tag_dispatch(title_lookups, description_lookups, label_lookup):
+    """
+    a function to compile the lookup lists into a single tag to role dispatch table
+
+    A tag that shows up in more than one lookup is resolved as title first, then description,
+    then metadata field
+
+    :param list title_lookups: MARC fields to be used as the title
+    :param list description_lookups: MARC fields to be used as the description
+    :param dict label_lookup: MARC fields to be used as metadata fields and their labels
+
+    :rtype dict
+    :returns a dictionary of MARC field to a (role, label) tuple
+    """
+    dispatch = {}
+    for tag, label in label_lookup.items():
+        dispatch[tag] = (METADATA_ROLE, label)
+    for tag in description_lookups:
+        dispatch[tag] = (DESCRIPTION_ROLE, None)
+    for tag in title_lookups:
+        dispatch[tag] = (TITLE_ROLE, None)
+    return dispatch
+
+
+TAG_DISPATCH = build_tag_dispatch(TITLE_LOOKUPS, DESCRIPTION_LOOKUPS, LABEL_LOOKUP)
@@ -0,0 +1,243 @@
+"""
+skipping records that appear more than once across overlapping MARC exports
+
+Records are keyed straight from their bytes, before anything is parsed, either on their
+control number or on a hash of their content. Keys go through a Bloom filter, so a record
+that has not been seen before, the common case, is let through after a few bit lookups. Only
+when the filter says a key may have been seen is it checked against an exact store of keys,
+which is kept in a SQLite database on disk so memory use stays bounded by the size of the
+filter: a temporary one by default, or a file that outlives the run.
+
+    >>> with DuplicateFilter() as duplicates:
+    ...     reader = MarcFilesFromDisk("/path/to/overlapping/exports", duplicates=duplicates)
+    ...     ShardedManifestWriter("/path/to/manifests").write_all(reader.extractions())
+"""
+
+from hashlib import blake2b
+from math import ceil, log
+import sqlite3
+
+from .utils import iter_raw_fields
+
+CONTROL_NUMBER_KEY = "control_number"
+CONTENT_KEY = "content"
+DEFAULT_CAPACITY = 1000000
+DEFAULT_ERROR_RATE = 0.001
+
+# fields that change every time a record is exported without its content changing
+VOLATILE_FIELDS = frozenset([b"005"])
+
+
+def _digest(data):
+    return blake2b(data, digest_size=16).digest()
+
+
+def content_key(raw_record):
+    """
+    a function to hash the content of a binary MARC record
+
+    The leader and the volatile fields, such as the 005 transaction date, are left out so the
+    same bib exported at different times gets the same key
+
+    :param bytes raw_record: a complete binary MARC record
+
+    :rtype bytes
+    :returns a 16 byte digest
+    """
+    digest = blake2b(digest_size=16)
+    for tag, data in iter_raw_fields(raw_record):
+        if tag not in VOLATILE_FIELDS:
+            digest.update(tag)
+            digest.update(data.strip())
+            digest.update(b"\x1e")
+    return digest.digest()
+
+
+def control_number_key(raw_record):
+    """
+    a function to key a binary MARC record on its control number
+
+    The control number (field 001) is used when there is one, then subfield a of the first
+    system control number (field 035), then the content of the record
+
+    :param bytes raw_record: a complete binary MARC record
+
+    :rtype bytes
+    :returns a 16 byte digest
+    """
+    system_number = None
+    for tag, data in iter_raw_fields(raw_record):
+        if tag == b"001":
+            value = data.strip()
+            if value:
+                return _digest(b"001" + value)
+        elif tag == b"035" and system_number is None:
+            for subfield in data.split(b"\x1f")[1:]:
+                if subfield[:1] == b"a" and subfield[1:].strip():
+                    system_number = subfield[1:].strip()
+                    break
+    if system_number is not None:
+        return _digest(b"035" + system_number)
+    return content_key(raw_record)
+
+
+class BloomFilter:
+    """
+    a class to be used for remembering a large number of keys in a fixed amount of memory
+
+    It can say a key was added when it was not, at about error_rate until capacity keys have
+    been added, but never the other way around
+    """
+    __name__ = "BloomFilter"
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE):
+        """
+        initializes an instance of the class
+
+        :param int capacity: the number of keys expected
+        :param float error_rate: the false positive rate wanted at capacity
+
+        :rtype :instance:`BloomFilter`
+        """
+        if capacity < 1 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate between 0 and 1")
+        self.size = max(8, int(ceil(-capacity * log(error_rate) / (log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / capacity * log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __repr__(self):
+        return "{} of {} bits with {} hashes holding {} keys".format(self.__name__, self.size, self.hashes,
+                                                                     self.count)
+
+    def _positions(self, digest):
+        # double hashing over the two halves of a 16 byte digest
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:16], "little") | 1
+        size = self.size
+        return [(first + n * second) % size for n in range(self.hashes)]
+
+    def __contains__(self, digest):
+        bits = self.bits
+        return all(bits[x >> 3] & (1 << (x & 7)) for x in self._positions(digest))
+
+    def add(self, digest):
+        """
+        a method to add a key
+
+        :param bytes digest: a key of at least 16 well mixed bytes, such as a blake2b digest
+
+        :rtype Boolean
+        :returns whether the key may have been added before
+        """
+        bits = self.bits
+        seen = True
+        for position in self._positions(digest):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                seen = False
+        if not seen:
+            self.count += 1
+        return seen
+
+
+class DuplicateFilter:
+    """
+    a class to be used for letting through only the first copy of each record
+    """
+    __name__ = "DuplicateFilter"
+
+    def __init__(self, key=CONTROL_NUMBER_KEY, capacity=DEFAULT_CAPACITY, error_rate=DEFAULT_ERROR_RATE,
+                 exact=True, exact_path=None):
+        """
+        initializes an instance of the class
+
+        :param str key: what makes two records the same, either "control_number" (field 001,
+         then 035, then the content) or "content"
+        :param int capacity: the number of distinct records expected
+        :param float error_rate: the rate at which the Bloom filter mistakes a new record for a
+         duplicate at capacity
+        :param bool exact: whether to confirm every possible duplicate against every key seen so
+         that no record is ever dropped by mistake; without it no keys are stored at all and
+         about error_rate of the unique records are skipped
+        :param str exact_path: a path to a SQLite database to keep the exact keys in; it is
+         created if it does not exist and keys already in it count as seen. By default they
+         are kept in a temporary database on disk that is deleted on close
+
+        :rtype :instance:`DuplicateFilter`
+        """
+        if key not in (CONTROL_NUMBER_KEY, CONTENT_KEY):
+            raise ValueError("key must be one of {}".format((CONTROL_NUMBER_KEY, CONTENT_KEY)))
+        self.key = key
+        self._key_for = control_number_key if key == CONTROL_NUMBER_KEY else content_key
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.exact = exact
+        self.checked = 0
+        self.duplicates = 0
+        self.false_positives = 0
+        self._connection = None
+        if exact:
+            # an empty name makes SQLite create a private database on disk, deleted on close
+            self._connection = sqlite3.connect(exact_path or "")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS seen (digest BLOB PRIMARY KEY)")
+            for (digest,) in self._connection.execute("SELECT digest FROM seen"):
+                self.bloom.add(digest)
+
+    def __repr__(self):
+        return "{} on {} that skipped {} of {} records".format(self.__name__, self.key, self.duplicates, self.checked)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _seen_exactly(self, digest):
+        return self._connection.execute("SELECT 1 FROM seen WHERE digest = ?", (digest,)).fetchone() is not None
+
+    def _remember(self, digest):
+        if self._connection is not None:
+            self._connection.execute("INSERT OR IGNORE INTO seen VALUES (?)", (digest,))
+
+    def is_duplicate(self, raw_record):
+        """
+        a method to check a record against every record checked before, and remember it
+
+        :param bytes raw_record: a complete binary MARC record
+
+        :rtype Boolean
+        :returns whether a record with the same key has already been checked
+        """
+        self.checked += 1
+        digest = self._key_for(raw_record)
+        if self.bloom.add(digest):
+            if not self.exact or self._seen_exactly(digest):
+                self.duplicates += 1
+                return True
+            self.false_positives += 1
+        self._remember(digest)
+        return False
+
+    def filter(self, raw_records):
+        """
+        a method to drop the records that have already been seen from a stream of raw records
+
+        :param iterable raw_records: (byte offset, record bytes) tuples as yielded by
+         :func:`marc2iiif.utils.iter_raw_marc`
+
+        :rtype generator
+        :returns a generator of the same tuples, without the duplicates
+        """
+        for item in raw_records:
+            if not self.is_duplicate(item[1]):
+                yield item
+
+    def close(self):
+        """
+        a method to save and close the exact store, deleting it unless it was given a path
+        """
+        if self._connection is not None:
+            self._connection.commit()
+            self._connection.close()
+            self._connection = None
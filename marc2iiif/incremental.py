@@ -0,0 +1,185 @@
+"""
+incremental conversion of binary MARC files that only reconverts records that changed
+
+A local SQLite index remembers, for every control number, a hash of the record bytes, a hash
+of the manifest it produced and a fingerprint of the field mapping profile. A record is only
+run through the extraction again when its bytes or the mapping have changed.
+"""
+
+from hashlib import sha1
+import sqlite3
+
+from .classes import IIIFDataExtractionFromMarc, MarcFilesFromDisk
+from .instrumentation import timed
+from .profiles import DEFAULT_PROFILE
+from .utils import iter_raw_marc, raw_control_number
+
+
+class ConversionIndex:
+    """
+    a class to be used for remembering which records have already been converted
+    """
+    __name__ = "ConversionIndex"
+
+    def __init__(self, path, profile=None):
+        """
+        initializes an instance of the class
+
+        :param str path: the path of the SQLite database, which is created if it does not exist
+        :param :instance:`MappingProfile` profile: the field mapping records are converted with;
+         defaults to the mapping in constants.py
+
+        :rtype :instance:`ConversionIndex`
+        """
+        self.path = path
+        self.profile = profile or DEFAULT_PROFILE
+        self.mapping = self.profile.fingerprint
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS records ("
+                                 "control_number TEXT PRIMARY KEY, "
+                                 "source_hash TEXT NOT NULL, "
+                                 "manifest_hash TEXT NOT NULL, "
+                                 "mapping TEXT NOT NULL)")
+        self._connection.commit()
+
+    def __repr__(self):
+        return self.__name__ + " at " + self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            # updates made since the last commit may describe manifests that were never written
+            self._connection.rollback()
+        self.close()
+
+    def is_current(self, control_number, source_hash):
+        """
+        a method to check whether a record has already been converted with the current mapping
+
+        :param str control_number: the control number of the record
+        :param str source_hash: the hash of the bytes of the record
+
+        :rtype Boolean
+        :returns whether the record can be skipped
+        """
+        row = self._connection.execute("SELECT source_hash, mapping FROM records WHERE control_number = ?",
+                                       (control_number,)).fetchone()
+        return row == (source_hash, self.mapping)
+
+    def get(self, control_number):
+        """
+        a method to look up what the index knows about a record
+
+        :param str control_number: the control number of the record
+
+        :rtype tuple
+        :returns a (source hash, manifest hash, mapping) tuple or None if the record is unknown
+        """
+        return self._connection.execute("SELECT source_hash, manifest_hash, mapping FROM records "
+                                        "WHERE control_number = ?", (control_number,)).fetchone()
+
+    def update(self, control_number, source_hash, manifest_hash):
+        """
+        a method to remember that a record has been converted
+
+        The change is only made permanent by the next call to commit
+
+        :param str control_number: the control number of the record
+        :param str source_hash: the hash of the bytes of the record
+        :param str manifest_hash: the hash of the manifest json produced for the record
+        """
+        self._connection.execute("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?)",
+                                 (control_number, source_hash, manifest_hash, self.mapping))
+
+    def commit(self):
+        """
+        a method to make every pending update permanent
+        """
+        self._connection.commit()
+
+    def close(self):
+        """
+        a method to commit pending updates and close the database
+
+        Used as a context manager, pending updates are rolled back instead when the block raises
+        """
+        self._connection.commit()
+        self._connection.close()
+
+
+def convert_incrementally(file_path, index, writer, checkpoint=1000, stats=None, duplicates=None):
+    """
+    a function to convert only the new and changed records in a MARC file or directory tree
+
+    Records are hashed straight from their bytes; unchanged records are neither parsed nor
+    converted. The writer is flushed before every index commit so the index never claims a
+    manifest that was not written. Records without a control number are always converted, and
+    records that cannot be parsed or converted are reported and left out of the index so the
+    next run tries them again. A file that cannot be read past a damaged record length is
+    reported at the offset of that record and the run goes on with the next file
+
+    :param str file_path: a binary MARC file or a directory tree containing them
+    :param :instance:`ConversionIndex` index: the index of previously converted records; records
+     are converted with the mapping profile of the index
+    :param writer: an object with write(extraction) and flush() methods, such as
+     :instance:`marc2iiif.writers.ShardedManifestWriter`; the manifest is hashed from its
+     last_manifest attribute when it has one rather than serialized again
+    :param int checkpoint: the number of converted records between index commits
+    :param :instance:`PipelineStats` stats: where to record how long each stage takes, if anywhere
+    :param :instance:`marc2iiif.dedup.DuplicateFilter` duplicates: a filter skipping every copy of a
+     record after the first before it is hashed, if any; skipped copies are not counted
+
+    :rtype tuple
+    :returns the numbers of records converted and unchanged and a list of (path, byte offset,
+     message) errors
+    """
+    from pymarc import Record
+    converted = 0
+    unchanged = 0
+    errors = []
+    try:
+        for a_file in MarcFilesFromDisk(file_path).files():
+            position = 0
+            try:
+                with open(a_file, 'rb') as a_stream:
+                    raw_records = iter_raw_marc(a_stream)
+                    if duplicates is not None:
+                        raw_records = duplicates.filter(raw_records)
+                    for offset, raw_record in timed(raw_records, stats, "read"):
+                        position = offset + len(raw_record)
+                        control_number = raw_control_number(raw_record)
+                        source_hash = sha1(raw_record).hexdigest()
+                        if control_number and index.is_current(control_number, source_hash):
+                            unchanged += 1
+                            continue
+                        try:
+                            if stats is None:
+                                record = Record(data=raw_record)
+                            else:
+                                with stats.time("parse"):
+                                    record = Record(data=raw_record)
+                            an_extraction = IIIFDataExtractionFromMarc.from_pymarc(record, profile=index.profile,
+                                                                                   stats=stats)
+                            writer.write(an_extraction)
+                        except Exception as an_error:
+                            errors.append((a_file, offset, "{}: {}".format(type(an_error).__name__, an_error)))
+                            continue
+                        if control_number:
+                            data = getattr(writer, "last_manifest", None)
+                            if data is None:
+                                data = an_extraction.to_json().encode("utf-8")
+                            index.update(control_number, source_hash, sha1(data).hexdigest())
+                        converted += 1
+                        if converted % checkpoint == 0:
+                            writer.flush()
+                            index.commit()
+            except (OSError, ValueError) as an_error:
+                # a file that cannot be opened or split into records ends there; the next file is read
+                errors.append((a_file, position, "{}: {}".format(type(an_error).__name__, an_error)))
+    finally:
+        # the index is only ever committed after the manifests it describes have been written
+        writer.flush()
+    index.commit()
+    return converted, unchanged, errors
@@ -0,0 +1,168 @@
+"""
+optional per stage timing of the conversion pipeline
+
+Every part of the pipeline that supports instrumentation takes a stats argument that defaults
+to None. When it is None nothing is timed, so the only cost left is a single check; when it is
+a PipelineStats the time spent in and the number of items through each stage are added up.
+
+The stages are
+
+- read: pulling the next record out of a MARC or MARCXML file
+- parse: decoding the bytes of a binary record into a pymarc Record
+- dictify: turning a pymarc Record into the dict from_dict expects
+- extract: the whole of from_dict or from_pymarc, split into
+  extract.match (looking MARC fields up in the mapping), extract.title,
+  extract.description and extract.metadata; a lazily extracted record times each part,
+  including extract.identifier, when it is first used instead
+- to_dict: IIIFDataExtractionFromMarc.to_dict
+- serialize: turning a manifest into json
+- write: writing manifest files to disk
+
+With a mapping profile that has identifier patterns, identifier.matched and identifier.missed
+also count the records whose identifier was or was not found, without any time
+"""
+
+from collections import defaultdict
+from time import perf_counter
+
+
+class _StageTimer:
+    __slots__ = ("stats", "stage", "count", "start")
+
+    def __init__(self, stats, stage, count):
+        self.stats = stats
+        self.stage = stage
+        self.count = count
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stats.add(self.stage, perf_counter() - self.start, self.count)
+
+
+class PipelineStats:
+    """
+    a class to be used for collecting the time spent in each stage of a conversion run
+    """
+    __name__ = "PipelineStats"
+
+    def __init__(self, callback=None):
+        """
+        initializes an instance of the class
+
+        :param function callback: an optional function called as callback(stage, seconds, count)
+         every time a measurement is added
+
+        :rtype :instance:`PipelineStats`
+        """
+        self.callback = callback
+        self.seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+
+    def __repr__(self):
+        return self.__name__ + " for " + str(len(self.counts)) + " stages"
+
+    def __str__(self):
+        output = "{:<22} {:>10} {:>12} {:>12}\n".format("stage", "count", "seconds", "us/item")
+        for stage, values in self.to_dict().items():
+            output += "{:<22} {:>10} {:>12.3f} {:>12.1f}\n".format(stage, values["count"], values["seconds"],
+                                                                   values["microseconds_per_item"])
+        return output
+
+    def add(self, stage, seconds, count=1):
+        """
+        a method to add a measurement to a stage
+
+        :param str stage: the name of the stage
+        :param float seconds: the time spent in the stage
+        :param int count: the number of items that went through the stage
+        """
+        self.seconds[stage] += seconds
+        self.counts[stage] += count
+        if self.callback is not None:
+            self.callback(stage, seconds, count)
+
+    def time(self, stage, count=1):
+        """
+        a method to time a block of code as a stage
+
+        :param str stage: the name of the stage
+        :param int count: the number of items the block handles
+
+        :rtype context manager
+        """
+        return _StageTimer(self, stage, count)
+
+    def timed(self, iterable, stage):
+        """
+        a method to time how long it takes to pull each item out of an iterable
+
+        :param iterable iterable: the iterable to time
+        :param str stage: the name of the stage
+
+        :rtype generator
+        :returns the items of the iterable
+        """
+        iterator = iter(iterable)
+        while True:
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.add(stage, perf_counter() - start)
+            yield item
+
+    def merge(self, other):
+        """
+        a method to add up the measurements of another instance, e.g. from a worker process
+
+        The callback is not called for merged measurements
+
+        :param :instance:`PipelineStats` other: the measurements to add
+        """
+        for stage, seconds in other.seconds.items():
+            self.seconds[stage] += seconds
+        for stage, count in other.counts.items():
+            self.counts[stage] += count
+
+    def to_dict(self):
+        """
+        a method to output the measurements of every stage
+
+        :rtype dict
+        :returns a dict of stage to count, seconds and microseconds_per_item
+        """
+        out = {}
+        for stage in sorted(self.counts):
+            count = self.counts[stage]
+            seconds = self.seconds[stage]
+            out[stage] = {"count": count, "seconds": seconds,
+                          "microseconds_per_item": seconds * 1e6 / count if count else 0.0}
+        return out
+
+    def __getstate__(self):
+        return {"callback": None, "seconds": dict(self.seconds), "counts": dict(self.counts)}
+
+    def __setstate__(self, state):
+        self.callback = state["callback"]
+        self.seconds = defaultdict(float, state["seconds"])
+        self.counts = defaultdict(int, state["counts"])
+
+
+def timed(iterable, stats, stage):
+    """
+    a function to time an iterable only when instrumentation is turned on
+
+    :param iterable iterable: the iterable to time
+    :param :instance:`PipelineStats` stats: the stats to add to, or None
+    :param str stage: the name of the stage
+
+    :rtype iterable
+    :returns the iterable itself when stats is None, otherwise a timing generator over it
+    """
+    if stats is None:
+        return iterable
+    return stats.timed(iterable, stage)
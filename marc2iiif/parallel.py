@@ -0,0 +1,228 @@
+"""
+process pool conversion of directory trees of binary MARC files into IIIF manifests
+
+Files are cut into shards along record boundaries so that a single very large dump can be
+spread across several worker processes. Each shard is converted and written by one worker
+and the results come back in the same order as the shards were planned.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from os import getpid, remove, replace
+from os.path import getsize, join
+from urllib.parse import quote
+
+from .classes import IIIFDataExtractionFromMarc, MarcFilesFromDisk
+from .instrumentation import PipelineStats, timed
+from .utils import pymarc_control_number
+
+DEFAULT_SHARD_SIZE = 64 * 1024 * 1024
+
+Shard = namedtuple("Shard", ["path", "start", "end"])
+ShardResult = namedtuple("ShardResult", ["shard", "converted", "errors", "stats", "names"])
+
+
+def plan_shards(paths, shard_size=DEFAULT_SHARD_SIZE):
+    """
+    a function to cut a list of binary MARC files into shards of roughly shard_size bytes
+
+    Shard boundaries always fall between two records; they are found by hopping from one
+    record leader to the next without parsing the records themselves
+
+    :param list paths: paths to binary MARC files
+    :param int shard_size: the approximate number of bytes of MARC data per shard
+
+    :rtype list
+    :returns a list of :instance:`Shard`
+    """
+    shards = []
+    for a_path in paths:
+        size = getsize(a_path)
+        if size <= shard_size:
+            shards.append(Shard(a_path, 0, size))
+            continue
+        start = position = 0
+        with open(a_path, 'rb') as a_stream:
+            while position < size:
+                a_stream.seek(position)
+                length = a_stream.read(5)
+                if not length.isdigit() or int(length) == 0:
+                    # a damaged leader; the rest of the file becomes a single shard
+                    position = size
+                    break
+                position += int(length)
+                if position - start >= shard_size:
+                    shards.append(Shard(a_path, start, min(position, size)))
+                    start = position
+        if start < size:
+            shards.append(Shard(a_path, start, size))
+    return shards
+
+
+def manifest_file_name(an_extraction, a_control_number=None):
+    """
+    a function to pick a file name for the manifest of a record
+
+    The IIIF identifier is used when the record has one, otherwise the MARC control number
+
+    :param :instance:`IIIFDataExtractionFromMarc` an_extraction: the converted record
+    :param str a_control_number: the control number (field 001) of the record
+
+    :rtype str
+    :returns a file name safe to use in a single directory, or None if the record cannot be named
+    """
+    name = an_extraction.metadata.identifier or a_control_number
+    if name:
+        return quote(name, safe='') + ".json"
+    return None
+
+
+def _write_manifest(an_extraction, path, stats):
+    # writes through a temporary file and a rename so a manifest is never seen half written
+    temporary = "{}.{}.tmp".format(path, getpid())
+    try:
+        if stats is None:
+            with open(temporary, 'w') as out:
+                an_extraction.write_to(out)
+        else:
+            with stats.time("serialize"):
+                data = an_extraction.to_json()
+            with stats.time("write"):
+                with open(temporary, 'w') as out:
+                    out.write(data)
+        replace(temporary, path)
+    except BaseException:
+        try:
+            remove(temporary)
+        except OSError:
+            pass
+        raise
+
+
+def convert_shard(shard, output_directory, profile=None, stats=None):
+    """
+    a function to convert every record in one shard and write its manifests
+
+    Errors are collected rather than raised so that one bad record, or one unreadable file,
+    never takes down the rest of a run. Each manifest is written to a temporary file and
+    renamed into place, and a record whose file name was already used earlier in the shard is
+    reported as an error instead of overwriting that manifest. Names shared with other shards
+    are only found by convert_tree
+
+    :param :instance:`Shard` shard: the byte range of a MARC file to convert
+    :param str output_directory: the directory to write manifests into
+    :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+    :param :instance:`PipelineStats` stats: where to record how long each stage takes, if anywhere
+
+    :rtype :instance:`ShardResult`
+    :returns the number of manifests written, a list of (byte offset, message) errors, the stats
+     and the file name of each manifest written mapped to the byte offset of its record
+    """
+    from pymarc import MARCReader
+    converted = 0
+    errors = []
+    file_names = {}
+    try:
+        with open(shard.path, 'rb') as a_stream:
+            a_stream.seek(shard.start)
+            reader = MARCReader(a_stream, permissive=True)
+            position = shard.start
+            records = iter(timed(reader, stats, "read"))
+            while position < shard.end:
+                try:
+                    record = next(records)
+                except StopIteration:
+                    break
+                try:
+                    if record is None:
+                        raise ValueError(str(getattr(reader, "current_exception", None)
+                                             or "could not decode record"))
+                    an_extraction = IIIFDataExtractionFromMarc.from_pymarc(record, profile=profile, stats=stats)
+                    file_name = manifest_file_name(an_extraction, pymarc_control_number(record))
+                    if not file_name:
+                        raise ValueError("record has neither an identifier nor a control number")
+                    if file_name in file_names:
+                        raise ValueError("another record in the shard was already written to " + file_name)
+                    _write_manifest(an_extraction, join(output_directory, file_name), stats)
+                    file_names[file_name] = position
+                    converted += 1
+                except Exception as an_error:
+                    errors.append((position, "{}: {}".format(type(an_error).__name__, an_error)))
+                position = a_stream.tell()
+    except Exception as an_error:
+        errors.append((shard.start, "{}: {}".format(type(an_error).__name__, an_error)))
+    return ShardResult(shard, converted, errors, stats, file_names)
+
+
+def _convert_shard_args(args):
+    return convert_shard(*args)
+
+
+def _rewrite_manifest(path, offset, output_directory, profile):
+    # writes the manifest of the record at offset again, so it is the copy left on disk
+    from pymarc import Record
+    with open(path, 'rb') as a_stream:
+        a_stream.seek(offset)
+        length = a_stream.read(5)
+        record = Record(data=length + a_stream.read(int(length) - 5))
+    an_extraction = IIIFDataExtractionFromMarc.from_pymarc(record, profile=profile)
+    file_name = manifest_file_name(an_extraction, pymarc_control_number(record))
+    _write_manifest(an_extraction, join(output_directory, file_name), None)
+
+
+def _settle_name_collisions(results, output_directory, profile):
+    # the first record in file and byte order keeps a name used by several shards; the others
+    # become errors of their shards
+    owners = {}
+    collided = set()
+    settled = []
+    for result in results:
+        errors = list(result.errors)
+        converted = result.converted
+        for file_name, offset in result.names.items():
+            owner = owners.get(file_name)
+            if owner is None:
+                owners[file_name] = (result.shard.path, offset)
+                continue
+            collided.add(file_name)
+            converted -= 1
+            errors.append((offset, "ValueError: the record at byte {} of {} was already written to {}".format(
+                owner[1], owner[0], file_name)))
+        settled.append(result._replace(converted=converted, errors=sorted(errors)))
+    for file_name in sorted(collided):
+        _rewrite_manifest(owners[file_name][0], owners[file_name][1], output_directory, profile)
+    return settled
+
+
+def convert_tree(file_path, output_directory, workers=None, shard_size=DEFAULT_SHARD_SIZE, profile=None,
+                 stats=None):
+    """
+    a function to convert a MARC file or a directory tree of MARC files with a pool of processes
+
+    When records in different shards would be written to the same file name, the first of them
+    in file and byte order is the one left on disk and the others are reported as errors, so
+    the output does not depend on the order the workers finish in
+
+    :param str file_path: a binary MARC file or a directory tree containing them
+    :param str output_directory: an existing directory to write manifests into
+    :param int workers: the number of worker processes; defaults to the number of CPUs
+    :param int shard_size: the approximate number of bytes of MARC data given to a worker at a time
+    :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+    :param :instance:`PipelineStats` stats: where to add up how long each stage takes across every
+     worker, if anywhere
+
+    :rtype list
+    :returns a list of :instance:`ShardResult` in file and byte order
+    """
+    shards = plan_shards(MarcFilesFromDisk(file_path).files(), shard_size=shard_size)
+    jobs = [(shard, output_directory, profile, None if stats is None else PipelineStats()) for shard in shards]
+    if workers == 1:
+        results = [_convert_shard_args(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_convert_shard_args, jobs))
+    results = _settle_name_collisions(results, output_directory, profile)
+    if stats is not None:
+        for result in results:
+            stats.merge(result.stats)
+    return results
@@ -0,0 +1,177 @@
+"""
+declarative patches for correcting the metadata of many IIIF records at once
+
+A patch is a list of operations, each a dictionary with an "op" key:
+
+- {"op": "add", "label": ..., "value": ...} adds a metadata field
+- {"op": "replace", "label": ..., "value": ..., "new_value": ...} changes the value of every
+  metadata field with that label and value
+- {"op": "remove", "label": ..., "value": ...} removes every metadata field with that label
+  and value
+- {"op": "retitle", "title": ...} changes the title
+- {"op": "describe", "description": ...} changes the description
+
+Any operation can also have an "identifier" key, in which case it only applies to the record
+with that identifier. No two replace or remove operations may edit the same label and value
+where they could apply to the same record. A patch is checked and compiled into lookup tables once, and then
+every record it is applied to is edited in a single pass over its metadata fields.
+"""
+
+from json import load
+
+from .classes import IIIFMetadataField
+
+OPERATIONS = ("add", "replace", "remove", "retitle", "describe")
+
+
+class _Scope:
+    __slots__ = ("edits", "edit_operations", "adds", "title", "description")
+
+    def __init__(self):
+        self.edits = {}
+        self.edit_operations = {}
+        self.adds = []
+        self.title = None
+        self.description = None
+
+
+def _required_string(operation, key):
+    value = operation.get(key)
+    if not isinstance(value, str):
+        raise TypeError("the {} operation needs a string {}".format(operation.get("op"), key))
+    return value
+
+
+class MetadataPatch:
+    """
+    a class to be used for applying one set of metadata corrections to a stream of records
+    """
+    __name__ = "MetadataPatch"
+
+    def __init__(self, operations):
+        """
+        initializes an instance of the class
+
+        :param list operations: a list of operation dictionaries as described in the module
+
+        :rtype :instance:`MetadataPatch`
+        """
+        if not isinstance(operations, list):
+            raise TypeError("a patch must be a list of operations")
+        self.operations = operations
+        self.matches = [0] * len(operations)
+        self.records_seen = 0
+        self.records_changed = 0
+        self._global = _Scope()
+        self._scoped = {}
+        for position, operation in enumerate(operations):
+            self._compile(position, operation)
+
+    def __repr__(self):
+        return self.__name__ + " with " + str(len(self.operations)) + " operations"
+
+    def _compile(self, position, operation):
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise ValueError("operation {} must be a dict with op set to one of {}".format(position, OPERATIONS))
+        identifier = operation.get("identifier")
+        if identifier is None:
+            scope = self._global
+        else:
+            scope = self._scoped.setdefault(identifier, _Scope())
+        op = operation["op"]
+        if op == "retitle":
+            scope.title = (_required_string(operation, "title"), position)
+        elif op == "describe":
+            scope.description = (_required_string(operation, "description"), position)
+        elif op == "add":
+            scope.adds.append((_required_string(operation, "label"), _required_string(operation, "value"), position))
+        else:
+            key = (_required_string(operation, "label"), _required_string(operation, "value"))
+            # a field edited by a global operation cannot also be edited for a single record,
+            # since only one edit can be made to each field
+            others = list(self._scoped.values()) if identifier is None else [self._global]
+            for other in [scope] + others:
+                if key in other.edits:
+                    raise ValueError("operation {} edits the same field as operation {}".format(
+                        position, other.edit_operations[key]))
+            scope.edits[key] = _required_string(operation, "new_value") if op == "replace" else None
+            scope.edit_operations[key] = position
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        a classmethod to load a patch from a json file
+
+        :param str path: a path to a json file holding a list of operations
+
+        :rtype :instance:`MetadataPatch`
+        """
+        with open(path, "r") as a_stream:
+            return cls(load(a_stream))
+
+    def apply_to(self, an_extraction):
+        """
+        a method to apply the patch to a single record
+
+        :param :instance:`IIIFDataExtractionFromMarc` an_extraction: the record to edit in place
+
+        :rtype Boolean
+        :returns whether the record was changed
+        """
+        metadata = an_extraction.metadata
+        scopes = [self._global]
+        scoped = self._scoped.get(metadata.identifier)
+        if scoped is not None:
+            scopes.append(scoped)
+        if len(scopes) == 1:
+            edits, edit_operations = scopes[0].edits, scopes[0].edit_operations
+        else:
+            edits = dict(self._global.edits)
+            edits.update(scoped.edits)
+            edit_operations = dict(self._global.edit_operations)
+            edit_operations.update(scoped.edit_operations)
+        changed = False
+        if edits:
+            for key, count in metadata._bulk_edit(edits).items():
+                self.matches[edit_operations[key]] += count
+                changed = True
+        for scope in scopes:
+            for label, value, position in scope.adds:
+                metadata.add_field(IIIFMetadataField(label, value))
+                self.matches[position] += 1
+                changed = True
+            if scope.title is not None:
+                metadata.label = scope.title[0]
+                self.matches[scope.title[1]] += 1
+                changed = True
+            if scope.description is not None:
+                metadata.description = scope.description[0]
+                self.matches[scope.description[1]] += 1
+                changed = True
+        self.records_seen += 1
+        if changed:
+            self.records_changed += 1
+        return changed
+
+    def apply(self, extractions):
+        """
+        a method to apply the patch to every record of a stream
+
+        :param iterable extractions: instances of :instance:`IIIFDataExtractionFromMarc`
+
+        :rtype generator
+        :returns a generator of the same records, edited in place
+        """
+        for an_extraction in extractions:
+            self.apply_to(an_extraction)
+            yield an_extraction
+
+    def report(self):
+        """
+        a method to report how often each operation matched
+
+        :rtype list
+        :returns a list of dicts with the operation and its number of matches, in patch order
+        """
+        return [{"operation": operation, "matches": count}
+                for operation, count in zip(self.operations, self.matches)]
@@ -0,0 +1,149 @@
+"""
+field mapping profiles telling the extraction which MARC fields become the title, the
+description and the metadata fields of a IIIF manifest
+
+A profile is compiled once, when it is created, into frozen sets and a tag to role dispatch
+table so that the same profile can be shared by every record of a collection at no extra cost.
+"""
+
+from hashlib import sha1
+from json import dumps, load
+from os.path import abspath, getmtime
+
+from .constants import DESCRIPTION_LOOKUPS, LABEL_LOOKUP, REPEATED_ALL, REPEATED_FIELD_MODES, REPEATED_FIRST, \
+    TITLE_LOOKUPS, build_tag_dispatch
+from .utils import compile_identifier_patterns
+
+_LOADED_PROFILES = {}
+
+
+def mapping_fingerprint(title_lookups=TITLE_LOOKUPS, description_lookups=DESCRIPTION_LOOKUPS,
+                        label_lookup=LABEL_LOOKUP, identifier_patterns=(), repeated=REPEATED_ALL, max_values=None):
+    """
+    a function to compute a fingerprint of a field mapping
+
+    :param list title_lookups: MARC fields to be used as the title
+    :param list description_lookups: MARC fields to be used as the description
+    :param dict label_lookup: MARC fields to be used as metadata fields and their labels
+    :param list identifier_patterns: regular expressions finding identifiers in URLs, in order
+    :param str repeated: how metadata fields occurring more than once are treated
+    :param int max_values: the most metadata fields kept per label, if limited
+
+    :rtype str
+    :returns a hex digest that changes whenever the mapping changes
+    """
+    mapping = [sorted(title_lookups), sorted(description_lookups), sorted(label_lookup.items())]
+    if identifier_patterns:
+        mapping.append(list(identifier_patterns))
+    if repeated != REPEATED_FIRST or max_values:
+        mapping.append({"repeated": repeated, "max_values": max_values})
+    return sha1(dumps(mapping).encode("utf-8")).hexdigest()
+
+
+class MappingProfile:
+    """
+    a class to be used for holding a compiled field mapping
+    """
+    __name__ = "MappingProfile"
+
+    def __init__(self, title_lookups, description_lookups, label_lookup, name="default", identifier_patterns=None,
+                 repeated=REPEATED_ALL, max_values=None):
+        """
+        initializes an instance of the class
+
+        :param list title_lookups: MARC fields to be used as the title
+        :param list description_lookups: MARC fields to be used as the description
+        :param dict label_lookup: MARC fields to be used as metadata fields and their labels;
+         control fields (001 to 009) cannot be used anywhere
+        :param str name: a name for the profile
+        :param list identifier_patterns: regular expressions, tried in order, whose first group is
+         the identifier in subfield u of the 'Electronic Location and Access' fields; without
+         them the whole value of the first of those fields is the identifier
+        :param str repeated: how metadata fields occurring more than once are treated: "all" gives
+         each occurrence its own value, "first" gives each occurrence the value of the first one
+         and "merge" gives one field per label with every distinct value
+        :param int max_values: the most metadata fields used per label, so that a record with
+         thousands of subjects cannot blow up its manifest; unlimited when None
+
+        :rtype :instance:`MappingProfile`
+        """
+        # a single tag given as a string would otherwise become a set of its characters
+        if isinstance(title_lookups, (str, bytes)) or isinstance(description_lookups, (str, bytes)):
+            raise ValueError("title_lookups and description_lookups must be lists of MARC tags, not strings")
+        if not isinstance(label_lookup, dict):
+            raise ValueError("label_lookup must be a dict of MARC tags to labels")
+        title_lookups, description_lookups = frozenset(title_lookups), frozenset(description_lookups)
+        tags = title_lookups | description_lookups | set(label_lookup)
+        if not all(isinstance(tag, str) for tag in tags):
+            raise ValueError("MARC tags must be strings")
+        # control fields (00X) have data but no subfields to combine or take a title from
+        control_tags = sorted(tag for tag in tags if tag.startswith("00"))
+        if control_tags:
+            raise ValueError("control fields cannot be mapped: {}".format(", ".join(control_tags)))
+        self.name = name
+        self.title_lookups = title_lookups
+        self.description_lookups = description_lookups
+        self.label_lookup = dict(label_lookup)
+        self.dispatch = build_tag_dispatch(self.title_lookups, self.description_lookups, self.label_lookup)
+        self.identifier_patterns = compile_identifier_patterns(identifier_patterns or ())
+        if repeated not in REPEATED_FIELD_MODES:
+            raise ValueError("repeated must be one of {}".format(REPEATED_FIELD_MODES))
+        if max_values is not None and (not isinstance(max_values, int) or max_values < 1):
+            raise ValueError("max_values must be a positive integer or None")
+        self.repeated = repeated
+        self.max_values = max_values
+        self.fingerprint = mapping_fingerprint(self.title_lookups, self.description_lookups, self.label_lookup,
+                                               [x.pattern for x in self.identifier_patterns], repeated, max_values)
+
+    def __repr__(self):
+        return "{} {} with {} mapped MARC fields".format(self.__name__, self.name, len(self.dispatch))
+
+    def __eq__(self, other):
+        return isinstance(other, MappingProfile) and self.fingerprint == other.fingerprint
+
+    def __hash__(self):
+        return hash(self.fingerprint)
+
+    @classmethod
+    def from_dict(cls, a_dict, name="default"):
+        """
+        a classmethod to create a profile from a dictionary
+
+        The dictionary can have the keys title_lookups, description_lookups and label_lookup;
+        any that are missing are taken from constants.py. It can also have identifier_patterns,
+        repeated and max_values
+
+        :param dict a_dict: a dictionary describing the mapping
+        :param str name: a name for the profile
+
+        :rtype :instance:`MappingProfile`
+        """
+        if not isinstance(a_dict, dict):
+            raise ValueError("can only instantiate class from a dict")
+        return cls(a_dict.get("title_lookups", TITLE_LOOKUPS),
+                   a_dict.get("description_lookups", DESCRIPTION_LOOKUPS),
+                   a_dict.get("label_lookup", LABEL_LOOKUP),
+                   name=a_dict.get("name", name),
+                   identifier_patterns=a_dict.get("identifier_patterns"),
+                   repeated=a_dict.get("repeated", REPEATED_ALL),
+                   max_values=a_dict.get("max_values"))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        a classmethod to load a profile from a json file
+
+        Profiles are cached, so loading the same unchanged file again returns the same instance
+
+        :param str path: a path to a json file holding a dictionary as described in from_dict
+
+        :rtype :instance:`MappingProfile`
+        """
+        key = (abspath(path), getmtime(path))
+        if key not in _LOADED_PROFILES:
+            with open(path, "r") as a_stream:
+                _LOADED_PROFILES[key] = cls.from_dict(load(a_stream), name=path)
+        return _LOADED_PROFILES[key]
+
+
+DEFAULT_PROFILE = MappingProfile(TITLE_LOOKUPS, DESCRIPTION_LOOKUPS, LABEL_LOOKUP)
@@ -0,0 +1,222 @@
+"""
+random access to the records of a binary MARC file by control number or IIIF identifier
+
+The file is scanned once, hopping from one record to the next with the record length at the
+start of each leader, to build an index of control number (field 001), or of the identifier
+the manifest of the record will have, to byte offset and length. After that any record is
+served straight out of a memory map of the file, so regenerating the manifest of one record
+never means reading the dump from the start.
+"""
+
+from json import dump, load
+from mmap import ACCESS_READ, mmap
+from os import replace, stat
+
+from .classes import IIIFDataExtractionFromMarc
+from .constants import IDENTIFIER_LABEL, METADATA_ROLE, REPEATED_FIRST
+from .profiles import DEFAULT_PROFILE
+from .utils import identifier_from_url, iter_raw_fields, raw_control_number
+
+CONTROL_NUMBER_KEY = "control_number"
+IDENTIFIER_KEY = "identifier"
+
+
+def _raw_subfields(data):
+    # the (code, value) pairs of a UTF-8 data field, after its two indicators
+    return [(chunk[:1].decode("utf-8"), chunk[1:].decode("utf-8")) for chunk in data.split(b"\x1f")[1:] if chunk]
+
+
+def raw_identifier(raw_record, profile=None):
+    """
+    a function to work out the IIIF identifier of a binary MARC record without converting it
+
+    The identifier is the one IIIFDataExtractionFromMarc would give the record with the same
+    profile. UTF-8 records are read straight from their bytes; MARC-8 records are parsed by
+    pymarc and only their identifier is extracted
+
+    :param bytes raw_record: a complete binary MARC record
+    :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+
+    :rtype str
+    :returns the identifier, which is empty when the record does not have one
+    """
+    profile = profile or DEFAULT_PROFILE
+    if raw_record[9:10] != b"a":
+        from pymarc import Record
+        return IIIFDataExtractionFromMarc.from_pymarc(Record(data=raw_record), profile=profile,
+                                                      lazy=True).metadata.identifier
+    dispatch = profile.dispatch
+    patterns = profile.identifier_patterns
+    first_values = {}
+    for tag, data in iter_raw_fields(raw_record):
+        tag = tag.decode("utf-8", "replace")
+        if dispatch.get(tag) != (METADATA_ROLE, IDENTIFIER_LABEL):
+            continue
+        subfields = _raw_subfields(data)
+        if patterns:
+            url = next((value for code, value in subfields if code == "u"), None)
+            identifier = identifier_from_url(url, patterns) if url is not None else None
+        elif profile.repeated != REPEATED_FIRST:
+            identifier = " ".join([value for _, value in subfields]).strip()
+        else:
+            if tag not in first_values:
+                first_values[tag] = " ".join([value for _, value in subfields]).strip()
+            identifier = first_values[tag]
+        if identifier:
+            return identifier
+    return ""
+
+
+class MarcOffsetIndex:
+    """
+    a class to be used for looking up the records of a binary MARC file by control number or identifier
+    """
+    __name__ = "MarcOffsetIndex"
+
+    def __init__(self, path, index_path=None, profile=None, key=CONTROL_NUMBER_KEY):
+        """
+        initializes an instance of the class
+
+        When a key appears more than once the last record with it wins; records without one,
+        or that cannot be read, are counted in unindexed
+
+        :param str path: a path to a binary MARC file
+        :param str index_path: a path to keep the offsets at between runs; they are reused when
+         the MARC file has not changed since they were saved, and saved there otherwise
+        :param :instance:`MappingProfile` profile: the field mapping extractions are made with;
+         defaults to constants.py
+        :param str key: what records are looked up by, either "control_number" (field 001) or
+         "identifier", the identifier their manifests are given under the profile
+
+        :rtype :instance:`MarcOffsetIndex`
+        """
+        if key not in (CONTROL_NUMBER_KEY, IDENTIFIER_KEY):
+            raise ValueError("key must be one of {}".format((CONTROL_NUMBER_KEY, IDENTIFIER_KEY)))
+        self.path = path
+        self.profile = profile
+        self.key = key
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap(self._file.fileno(), 0, access=ACCESS_READ) if stat(path).st_size else b""
+        except Exception:
+            self._file.close()
+            raise
+        self.offsets = None
+        self.unindexed = 0
+        if index_path:
+            self._load(index_path)
+        if self.offsets is None:
+            self._scan()
+            if index_path:
+                self._save(index_path)
+
+    def __repr__(self):
+        return "{} of {} records in {}".format(self.__name__, len(self), self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def _signature(self):
+        info = stat(self.path)
+        if self.key == CONTROL_NUMBER_KEY:
+            return [info.st_size, info.st_mtime_ns]
+        return [info.st_size, info.st_mtime_ns, self.key, (self.profile or DEFAULT_PROFILE).fingerprint]
+
+    def _scan(self):
+        offsets = {}
+        unindexed = 0
+        data = self._map
+        size = len(data)
+        position = 0
+        while position < size:
+            length = data[position:position + 5]
+            if not length.isdigit() or int(length) < 5:
+                raise ValueError("invalid record length {!r} at byte {}".format(length, position))
+            length = int(length)
+            if self.key == CONTROL_NUMBER_KEY:
+                key = raw_control_number(data[position:position + length])
+            else:
+                try:
+                    key = raw_identifier(data[position:position + length], self.profile)
+                except Exception:
+                    key = None
+            if key:
+                offsets[key] = (position, length)
+            else:
+                unindexed += 1
+            position += length
+        self.offsets = offsets
+        self.unindexed = unindexed
+
+    def _load(self, index_path):
+        try:
+            with open(index_path, 'r') as a_stream:
+                saved = load(a_stream)
+        except (OSError, ValueError):
+            return
+        if saved.get("signature") == self._signature():
+            self.offsets = {key: tuple(value) for key, value in saved["offsets"].items()}
+            self.unindexed = saved["unindexed"]
+
+    def _save(self, index_path):
+        temporary = index_path + ".tmp"
+        with open(temporary, 'w') as a_stream:
+            dump({"signature": self._signature(), "unindexed": self.unindexed, "offsets": self.offsets}, a_stream)
+        replace(temporary, index_path)
+
+    def raw(self, key):
+        """
+        a method to get the bytes of a record
+
+        :param str key: the control number or the identifier of the record, as the index is keyed
+
+        :rtype bytes
+        :returns the complete binary MARC record
+        """
+        try:
+            offset, length = self.offsets[key]
+        except KeyError:
+            raise KeyError("no record with {} {}".format(self.key.replace("_", " "), key)) from None
+        return self._map[offset:offset + length]
+
+    def record(self, key):
+        """
+        a method to get a record parsed by pymarc
+
+        :param str key: the control number or the identifier of the record, as the index is keyed
+
+        :rtype :instance:`pymarc.Record`
+        """
+        from pymarc import Record
+        return Record(data=self.raw(key))
+
+    def extraction(self, key, lazy=False):
+        """
+        a method to get the IIIF metadata of a record
+
+        :param str key: the control number or the identifier of the record, as the index is keyed
+        :param bool lazy: whether to extract each part of the metadata only when it is first used
+
+        :rtype :instance:`IIIFDataExtractionFromMarc`
+        """
+        return IIIFDataExtractionFromMarc.from_pymarc(self.record(key), profile=self.profile, lazy=lazy)
+
+    def close(self):
+        """
+        a method to unmap and close the MARC file
+        """
+        if isinstance(self._map, mmap):
+            self._map.close()
+        self._file.close()
@@ -0,0 +1,304 @@
+"""
+a small HTTP service generating IIIF manifests from local binary MARC files on request
+
+Manifests are served at /<identifier>/manifest.json and at /<identifier>, the path of the @id
+they carry, where the identifier is the one the manifest is given under the mapping profile.
+Records are found through a MarcOffsetIndex keyed on identifiers over every MARC file given,
+converted on the first request and kept as json bytes in a size-bounded LRU cache, so only the
+manifests that are actually requested are ever generated. Responses carry an ETag and
+conditional requests with If-None-Match get a 304. With an index directory the offsets of each
+MARC file are saved there and reused on the next start while the file is unchanged.
+
+    python -m marc2iiif.server /path/to/marc/dumps --port 8000 --workers 8 --profile maps.json \
+        --index-directory /var/cache/marc2iiif
+"""
+
+from argparse import ArgumentParser
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha1
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os import makedirs
+from os.path import abspath, join
+from threading import Lock
+from urllib.parse import unquote, urlsplit
+
+from .classes import MarcFilesFromDisk
+from .profiles import MappingProfile
+from .random_access import IDENTIFIER_KEY, MarcOffsetIndex
+
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+MANIFEST_FILE_NAME = "manifest.json"
+OFFSETS_SUFFIX = ".offsets"
+
+
+class ManifestCache:
+    """
+    a class to be used for keeping the most recently used manifests up to a total number of bytes
+    """
+    __name__ = "ManifestCache"
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        """
+        initializes an instance of the class
+
+        :param int max_bytes: the most manifest bytes to keep; the least recently used manifests
+         are dropped to stay under it
+
+        :rtype :instance:`ManifestCache`
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __repr__(self):
+        return "{} holding {} manifests in {} bytes".format(self.__name__, len(self._entries), self.size)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        a method to get a cached manifest and mark it as the most recently used
+
+        :param str key: the identifier of the record
+
+        :rtype tuple
+        :returns an (etag, manifest bytes) tuple or None if it is not cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, etag, body):
+        """
+        a method to cache a manifest
+
+        A manifest larger than the whole cache is not kept
+
+        :param str key: the identifier of the record
+        :param str etag: the entity tag of the manifest
+        :param bytes body: the manifest json
+        """
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[1])
+            self._entries[key] = (etag, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self.size -= len(dropped)
+
+
+class ManifestService:
+    """
+    a class to be used for generating the manifests of records on request
+    """
+    __name__ = "ManifestService"
+
+    def __init__(self, file_path, cache_bytes=DEFAULT_CACHE_BYTES, profile=None, use_orjson=False,
+                 index_directory=None):
+        """
+        initializes an instance of the class
+
+        When the same identifier is in more than one file, the last file read wins; records
+        without an identifier cannot be served
+
+        :param str file_path: a binary MARC file or a directory tree containing them
+        :param int cache_bytes: the most manifest bytes to keep in memory
+        :param :instance:`MappingProfile` profile: the field mapping to use; defaults to constants.py
+        :param bool use_orjson: whether to encode manifests with orjson when it is available
+        :param str index_directory: a directory to save the offsets of each MARC file in, so that
+         a restart only scans the files that changed; it is created if it does not exist
+
+        :rtype :instance:`ManifestService`
+        """
+        if index_directory:
+            makedirs(index_directory, exist_ok=True)
+        self.indexes = [MarcOffsetIndex(a_file, index_path=self._index_path(index_directory, a_file), profile=profile,
+                                        key=IDENTIFIER_KEY)
+                        for a_file in MarcFilesFromDisk(file_path).files()]
+        self.use_orjson = use_orjson
+        self.cache = ManifestCache(cache_bytes)
+        self._records = {}
+        for index in self.indexes:
+            self._records.update(dict.fromkeys(index, index))
+
+    def __repr__(self):
+        return "{} for {} records".format(self.__name__, len(self._records))
+
+    def __contains__(self, identifier):
+        return identifier in self._records
+
+    @staticmethod
+    def _index_path(index_directory, a_file):
+        # one offsets file per MARC file, named after the hash of its absolute path
+        if not index_directory:
+            return None
+        return join(index_directory, sha1(abspath(a_file).encode("utf-8")).hexdigest() + OFFSETS_SUFFIX)
+
+    def manifest(self, identifier):
+        """
+        a method to get the manifest of a record, from the cache when it is there
+
+        :param str identifier: the identifier of the record
+
+        :rtype tuple
+        :returns an (etag, manifest bytes) tuple
+        """
+        entry = self.cache.get(identifier)
+        if entry is not None:
+            return entry
+        index = self._records.get(identifier)
+        if index is None:
+            raise KeyError("no record with identifier {}".format(identifier))
+        body = index.extraction(identifier).to_json(use_orjson=self.use_orjson).encode("utf-8")
+        etag = '"' + sha1(body).hexdigest() + '"'
+        self.cache.put(identifier, etag, body)
+        return etag, body
+
+    def close(self):
+        """
+        a method to close every MARC file the service reads from
+        """
+        for index in self.indexes:
+            index.close()
+
+
+class ManifestRequestHandler(BaseHTTPRequestHandler):
+    """
+    a class to be used for answering requests for /<identifier>/manifest.json and /<identifier>
+    """
+    server_version = "marc2iiif"
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _identifier(self):
+        # identifiers can be whole URLs with a query string of their own, so the raw request
+        # path is tried before the same path without its query
+        target = self.path if self.path.startswith("/") else urlsplit(self.path).path
+        candidates = [target]
+        if "?" in target:
+            candidates.append(target.split("?", 1)[0])
+        found = None
+        for candidate in candidates:
+            identifier = unquote(candidate[1:])
+            if identifier.endswith("/" + MANIFEST_FILE_NAME):
+                identifier = identifier[:-len(MANIFEST_FILE_NAME) - 1]
+            if identifier in self.server.service:
+                return identifier
+            if found is None:
+                found = identifier
+        return found
+
+    def _respond(self, send_body):
+        identifier = self._identifier()
+        if not identifier:
+            self.send_error(404)
+            return
+        try:
+            etag, body = self.server.service.manifest(identifier)
+        except KeyError:
+            self.send_error(404)
+            return
+        except Exception as an_error:
+            self.log_error("could not convert %s: %s: %s", identifier, type(an_error).__name__, an_error)
+            self.send_error(500)
+            return
+        if etag in [x.strip() for x in self.headers.get("If-None-Match", "").split(",")]:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class ManifestServer(HTTPServer):
+    """
+    a class to be used for serving manifests with a fixed pool of worker threads
+    """
+    daemon_threads = True
+
+    def __init__(self, address, service, workers=8, quiet=False):
+        """
+        initializes an instance of the class
+
+        :param tuple address: the (host, port) to listen on; port 0 picks a free port
+        :param :instance:`ManifestService` service: where manifests come from
+        :param int workers: the number of requests answered at the same time
+        :param bool quiet: whether to leave requests out of the log on stderr
+
+        :rtype :instance:`ManifestServer`
+        """
+        super().__init__(address, ManifestRequestHandler)
+        self.service = service
+        self.quiet = quiet
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=True)
+
+
+def main():
+    parser = ArgumentParser(description="serve IIIF manifests generated from local binary MARC files")
+    parser.add_argument("file_path", help="a binary MARC file or a directory tree containing them")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--cache-bytes", type=int, default=DEFAULT_CACHE_BYTES)
+    parser.add_argument("--profile", help="a json mapping profile; defaults to constants.py")
+    parser.add_argument("--index-directory", help="a directory to keep the offsets of each MARC file in between runs")
+    args = parser.parse_args()
+    profile = MappingProfile.from_file(args.profile) if args.profile else None
+    service = ManifestService(args.file_path, cache_bytes=args.cache_bytes, profile=profile,
+                              index_directory=args.index_directory)
+    server = ManifestServer((args.host, args.port), service, workers=args.workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
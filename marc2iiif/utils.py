@@ -2,7 +2,16 @@
 utility functions for marc2iiif library
 """
 
-from sys import stderr
+from re import compile as re_compile
+
+from .constants import IDENTIFIER_PATTERNS
+
+MARCXML_NAMESPACE = "{http://www.loc.gov/MARC21/slim}"
+MARCXML_RECORD_TAGS = frozenset([MARCXML_NAMESPACE + "record", "record"])
+SHARED_VALUE_LIMIT = 65536
+
+_SHARED_VALUES = {}
+_shared_value_limit = SHARED_VALUE_LIMIT
 
 def match_single_file(src, pot_match=None):
     """
@@ -30,31 +39,113 @@ def search_for_marc_file(src, pot_match=None):
     else:
         return False
 
+def search_for_marcxml_file(src, pot_match=None):
+    """
+    a function to determine if a file in a directory tree is a MARCXML file
+
+    :param str src: an absolute filepath to a file that may be a MARCXML file
+
+    :rtype Boolean
+    :returns whether or not the file is a MARCXML file
+    """
+    if src.endswith('xml'):
+        return True
+    else:
+        return False
+
+
+def compile_identifier_patterns(patterns):
+    """
+    a function to compile the regular expressions that find identifiers in URLs
+
+    :param list patterns: regular expression strings, each with a group capturing the identifier
+
+    :rtype tuple
+    :returns a tuple of compiled regular expressions, in the order they should be tried
+    """
+    compiled = []
+    for pattern in patterns:
+        a_pattern = re_compile(pattern)
+        if a_pattern.groups < 1:
+            raise ValueError("identifier pattern {} must have a group capturing the identifier".format(pattern))
+        compiled.append(a_pattern)
+    return tuple(compiled)
+
+
+DEFAULT_IDENTIFIER_PATTERNS = compile_identifier_patterns(IDENTIFIER_PATTERNS)
+
+
+def identifier_from_url(value, patterns):
+    """
+    a function to find an identifier in a URL with the first pattern that matches it
+
+    :param str value: a URL, e.g. from subfield u of a MARC 856 field
+    :param tuple patterns: compiled patterns as returned by compile_identifier_patterns
+
+    :rtype str
+    :returns the first group of the first matching pattern, or None if no pattern matches
+    """
+    for a_pattern in patterns:
+        match = a_pattern.search(value)
+        if match:
+            return match.group(1)
+    return None
+
 
 def default_identifier_extraction(value):
     """
-    a function to take a pi.lib URL and return the unique identifier 
-    
-    It splits the URL from the scheme and host name. WARNING: assumes that the scheme is
-    https which is hard-coded into the string
+    a function to take a pi.lib URL and return the unique identifier
+
+    It strips the http or https scheme and the host name from the URL
 
     :param str value: a pi.lib.uchicago.edu URL string
 
+    :rtype tuple
+    :returns (True, the identifier) or (False, None) if the value is not a pi.lib URL
+    """
+    identifier = identifier_from_url(value, DEFAULT_IDENTIFIER_PATTERNS)
+    return (identifier is not None, identifier)
+
+
+def set_shared_value_limit(limit):
+    """
+    a function to change how many distinct field values are shared between records
+
+    Sharing pays off when many extracted records are kept in memory at once; a job that writes
+    each record out and drops it can turn it off by setting the limit to 0
+
+    :param int limit: the number of values to keep before the table starts over
+    """
+    global _shared_value_limit
+    if not isinstance(limit, int) or limit < 0:
+        raise ValueError("the limit must be an integer of 0 or more")
+    _shared_value_limit = limit
+    _SHARED_VALUES.clear()
+
+
+def shared_value(value):
+    """
+    a function to return a single shared copy of a combined field value
+
+    The same values (content, media and carrier types, subject headings, holding institutions)
+    repeat across a whole catalog, so every record holding one of them is given the same string
+    instead of a copy of its own. The table of shared values is bounded and starts over once
+    it is full
+
+    :param str value: a combined field value
+
     :rtype str
-    :returns the actual url without domain implementation details
+    :returns an equal string, shared with every other caller that passed an equal value
     """
-    if 'http' in value:
-        items = value.split("http://pi.lib.uchicago.edu/1001/")
-    elif 'https' in value:
-        items = value.split("https://pi.lib.uchicago.edu/1001/")
-    else:
-        items = []
-        stderr.write("{} is not a valid URL".format(value))
-    if len(items) == 2:
-        out = (True, items[1])
-    else:
-       out = (False, None)
-    return out
+    shared = _SHARED_VALUES.get(value)
+    if shared is None:
+        if len(_SHARED_VALUES) >= _shared_value_limit:
+            _SHARED_VALUES.clear()
+            if not _shared_value_limit:
+                return value
+        _SHARED_VALUES[value] = shared = value
+    return shared
+
 
 def combine_subfields_into_one_value(list_of_dicts):
     """
@@ -63,8 +154,194 @@ def combine_subfields_into_one_value(list_of_dicts):
     :rtype str
     :returns the complete value to be printed in the metadata field
     """
-    single_string = ""
-    for a_dict in list_of_dicts:
-        single_string += " " + a_dict.get(list(a_dict.keys())[0])
-    return single_string.strip()
- 
\ No newline at end of file
+    return shared_value(" ".join([next(iter(a_dict.values())) for a_dict in list_of_dicts]).strip())
+
+
+def control_number(dictified_marc_record):
+    """
+    a function to find the control number (field 001) of a dictified MARC record
+
+    :param dict dictified_marc_record: a dictionary containing a MARC record
+
+    :rtype str
+    :returns the control number of the record or None if it does not have one
+    """
+    for a_field in dictified_marc_record.get("fields") or []:
+        value = a_field.get("001")
+        if value is not None:
+            return value.strip()
+    return None
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def marcxml_record_to_dict(record_element):
+    """
+    a function to convert a MARCXML record element into the dictionary that from_dict expects
+
+    :param :instance:`xml.etree.ElementTree.Element` record_element: a MARCXML record element
+
+    :rtype dict
+    :returns a dictionary shaped like pymarc.Record.as_dict()
+    """
+    leader = ""
+    fields = []
+    for child in record_element:
+        name = _local_name(child.tag)
+        if name == "datafield":
+            subfields = [{subfield.get("code"): subfield.text or ""} for subfield in child]
+            fields.append({child.get("tag"): {"ind1": child.get("ind1", " "),
+                                              "ind2": child.get("ind2", " "),
+                                              "subfields": subfields}})
+        elif name == "controlfield":
+            fields.append({child.get("tag"): child.text or ""})
+        elif name == "leader":
+            leader = child.text or ""
+    return {"leader": leader, "fields": fields}
+
+
+def iter_marcxml_records(source):
+    """
+    a function to stream the records out of a MARCXML document one at a time
+
+    Records are found at any depth, so MARCXML collections and OAI-PMH responses both work.
+    Every element is cleared and detached as soon as it has been consumed so memory use
+    does not grow with the size of the document
+
+    :param source: a path to or a binary file object of a MARCXML document
+
+    :rtype generator
+    :returns a generator of dictified MARC records
+    """
+    from xml.etree.ElementTree import iterparse
+    stack = []
+    open_records = 0
+    for event, element in iterparse(source, events=("start", "end")):
+        if event == "start":
+            stack.append(element)
+            if element.tag in MARCXML_RECORD_TAGS:
+                open_records += 1
+            continue
+        stack.pop()
+        if element.tag in MARCXML_RECORD_TAGS:
+            open_records -= 1
+            if not open_records:
+                yield marcxml_record_to_dict(element)
+        if not open_records:
+            element.clear()
+            if stack:
+                stack[-1].remove(element)
+
+
+def pymarc_control_number(record):
+    """
+    a function to find the control number (field 001) of a pymarc Record
+
+    :param :instance:`pymarc.Record` record: a MARC record read by pymarc
+
+    :rtype str
+    :returns the control number of the record or None if it does not have one
+    """
+    for a_field in record.get_fields("001"):
+        return a_field.data.strip()
+    return None
+
+
+def pymarc_subfield_pairs(a_field):
+    """
+    a function to get the subfields of a pymarc Field as (code, value) pairs
+
+    pymarc 5 stores subfields as Subfield tuples while earlier versions use a flat
+    [code, value, code, value] list
+
+    :param :instance:`pymarc.Field` a_field: a data field read by pymarc
+
+    :rtype iterable
+    :returns (code, value) pairs in field order
+    """
+    subfields = a_field.subfields
+    if subfields and isinstance(subfields[0], str):
+        return zip(subfields[0::2], subfields[1::2])
+    return subfields
+
+
+def iter_raw_marc(a_stream):
+    """
+    a function to split a binary MARC stream into the bytes of each record without parsing them
+
+    Each record is found from the five digit record length at the start of its leader
+
+    :param a_stream: a binary file object positioned at the start of a record
+
+    :rtype generator
+    :returns a generator of (byte offset, record bytes) tuples
+    """
+    offset = a_stream.tell()
+    while True:
+        length = a_stream.read(5)
+        if len(length) < 5:
+            return
+        if not length.isdigit() or int(length) < 5:
+            raise ValueError("invalid record length {!r} at byte {}".format(length, offset))
+        rest = a_stream.read(int(length) - 5)
+        yield offset, length + rest
+        offset += int(length)
+
+
+def raw_control_number(raw_record):
+    """
+    a function to read the control number (field 001) straight out of the bytes of a binary MARC record
+
+    It only looks at the leader and the directory so it is far cheaper than parsing the record
+
+    :param bytes raw_record: a complete binary MARC record
+
+    :rtype str
+    :returns the control number of the record or None if it does not have one
+    """
+    try:
+        base_address = int(raw_record[12:17])
+    except ValueError:
+        return None
+    directory_end = raw_record.find(b"\x1e", 24, base_address or len(raw_record))
+    if directory_end < 0:
+        return None
+    for position in range(24, directory_end - 11, 12):
+        if raw_record[position:position + 3] == b"001":
+            try:
+                length = int(raw_record[position + 3:position + 7])
+                start = base_address + int(raw_record[position + 7:position + 12])
+            except ValueError:
+                return None
+            return raw_record[start:start + length].rstrip(b"\x1e").decode("utf-8", "replace").strip()
+    return None
+
+
+def iter_raw_fields(raw_record):
+    """
+    a function to read the fields straight out of the bytes of a binary MARC record
+
+    Like raw_control_number it only follows the directory, nothing is decoded
+
+    :param bytes raw_record: a complete binary MARC record
+
+    :rtype generator
+    :returns a generator of (tag, field bytes) tuples in directory order, the field bytes
+     without their field terminator
+    """
+    try:
+        base_address = int(raw_record[12:17])
+    except ValueError:
+        return
+    directory_end = raw_record.find(b"\x1e", 24, base_address or len(raw_record))
+    if directory_end < 0:
+        return
+    for position in range(24, directory_end - 11, 12):
+        try:
+            length = int(raw_record[position + 3:position + 7])
+            start = base_address + int(raw_record[position + 7:position + 12])
+        except ValueError:
+            return
+        yield raw_record[position:position + 3], raw_record[start:start + length].rstrip(b"\x1e")
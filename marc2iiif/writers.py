@@ -0,0 +1,441 @@
+"""
+sinks for writing large numbers of IIIF manifests to disk
+"""
+
+import bz2
+from functools import partial
+import gzip
+from hashlib import sha1
+from json import loads
+import lzma
+from operator import itemgetter
+from os import O_DIRECTORY, O_RDONLY, close, fsync, getpid, makedirs, open as os_open, replace
+from os.path import dirname, getsize, join
+from threading import get_ident
+from time import perf_counter
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+# each compression compresses a block on its own, so that any block can be decompressed alone
+COMPRESSIONS = {None: (None, None),
+                "gzip": (partial(gzip.compress, compresslevel=6), gzip.decompress),
+                "bz2": (bz2.compress, bz2.decompress),
+                "lzma": (lzma.compress, lzma.decompress)}
+if zstd is not None:
+    COMPRESSIONS["zstd"] = (zstd.compress, zstd.decompress)
+
+DEFAULT_BLOCK_SIZE = 4 * 1024 * 1024
+INDEX_SUFFIX = ".index"
+
+
+class ShardedManifestWriter:
+    """
+    a class to be used for writing one manifest file per identifier into a hashed directory tree
+
+    A manifest for an identifier is written to <output>/ab/cd/abcd....json where abcd... is the
+    sha1 of the identifier, so no directory ever collects more than a few thousand entries.
+    Manifests are buffered and committed in batches; every file is written to a temporary name
+    and renamed into place, and a file whose content would not change is left alone
+    """
+    __name__ = "ShardedManifestWriter"
+
+    def __init__(self, output_directory, depth=2, width=2, batch_size=1000, durable=False, use_orjson=False,
+                 stats=None):
+        """
+        initializes an instance of the class
+
+        :param str output_directory: the root of the directory tree to write manifests into
+        :param int depth: the number of directory levels between the root and a manifest
+        :param int width: the number of hex digits of the hash used to name each level
+        :param int batch_size: the number of manifests buffered before they are written out
+        :param bool durable: whether to fsync files and their directories when a batch is committed
+        :param bool use_orjson: whether to encode manifests with orjson when it is available
+        :param :instance:`PipelineStats` stats: where to record how long serializing and writing take,
+         if anywhere
+
+        :rtype :instance:`ShardedManifestWriter`
+        """
+        self.output_directory = output_directory
+        self.depth = depth
+        self.width = width
+        self.batch_size = batch_size
+        self.durable = durable
+        self.use_orjson = use_orjson
+        self.stats = stats
+        self.written = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.last_manifest = None
+        self._pending = []
+        self._directories = set()
+
+    def __repr__(self):
+        return self.__name__ + " writing to " + self.output_directory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+    def path_for(self, identifier):
+        """
+        a method to find where the manifest for an identifier is written
+
+        :param str identifier: the IIIF identifier of a record
+
+        :rtype str
+        :returns the path of the manifest file
+        """
+        digest = sha1(identifier.encode("utf-8")).hexdigest()
+        levels = [digest[n * self.width:(n + 1) * self.width] for n in range(self.depth)]
+        return join(self.output_directory, *levels, digest + ".json")
+
+    def write(self, an_extraction):
+        """
+        a method to queue the manifest of a record to be written with the next batch
+
+        Records without an identifier cannot be placed and are counted as skipped. The manifest
+        json is kept in last_manifest until the next call, or None if the record was skipped
+
+        :param :instance:`IIIFDataExtractionFromMarc` an_extraction: the record to write
+
+        :rtype str
+        :returns the path the manifest will be written to, or None if it was skipped
+        """
+        identifier = an_extraction.metadata.identifier
+        if not identifier:
+            self.skipped += 1
+            self.last_manifest = None
+            return None
+        path = self.path_for(identifier)
+        if self.stats is None:
+            data = an_extraction.to_json(use_orjson=self.use_orjson).encode("utf-8")
+        else:
+            with self.stats.time("serialize"):
+                data = an_extraction.to_json(use_orjson=self.use_orjson).encode("utf-8")
+        self.last_manifest = data
+        self._pending.append((path, data))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return path
+
+    def write_all(self, extractions):
+        """
+        a method to write the manifests of every record in an iterable and commit the last batch
+
+        :param iterable extractions: instances of :instance:`IIIFDataExtractionFromMarc`
+
+        :rtype :instance:`ShardedManifestWriter`
+        :returns the instance, whose written, unchanged and skipped counters have been updated
+        """
+        for an_extraction in extractions:
+            self.write(an_extraction)
+        self.flush()
+        return self
+
+    def flush(self):
+        """
+        a method to commit every queued manifest to disk
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        if self.stats is not None:
+            start = perf_counter()
+        # grouping a batch by directory keeps each directory's metadata hot while it is written to
+        pending.sort(key=itemgetter(0))
+        touched = set()
+        for path, data in pending:
+            if self.commit_file(path, data):
+                touched.add(dirname(path))
+                self.written += 1
+            else:
+                self.unchanged += 1
+        if self.durable:
+            self.sync_directories(touched)
+        if self.stats is not None:
+            self.stats.add("write", perf_counter() - start, len(pending))
+
+    def commit_file(self, path, data):
+        """
+        a method to write one manifest through a temporary file and a rename, fsyncing it when
+        the writer is durable
+
+        It is safe to call from several threads at once, and leaves a file whose content would
+        not change alone
+
+        :param str path: the path of the manifest, as given by path_for
+        :param bytes data: the manifest json
+
+        :rtype Boolean
+        :returns whether the file was written
+        """
+        directory = dirname(path)
+        if directory not in self._directories:
+            makedirs(directory, exist_ok=True)
+            self._directories.add(directory)
+        if self._is_unchanged(path, data):
+            return False
+        temporary = "{}.{}.{}.tmp".format(path, getpid(), get_ident())
+        with open(temporary, "wb") as a_stream:
+            a_stream.write(data)
+            if self.durable:
+                a_stream.flush()
+                fsync(a_stream.fileno())
+        replace(temporary, path)
+        return True
+
+    @staticmethod
+    def sync_directories(directories):
+        """
+        a method to fsync directories so the renames of the files committed in them are durable
+
+        :param iterable directories: paths of directories
+        """
+        for directory in directories:
+            descriptor = os_open(directory, O_RDONLY | O_DIRECTORY)
+            try:
+                fsync(descriptor)
+            finally:
+                close(descriptor)
+
+    @staticmethod
+    def _is_unchanged(path, data):
+        try:
+            if getsize(path) != len(data):
+                return False
+            with open(path, "rb") as a_stream:
+                return a_stream.read() == data
+        except OSError:
+            return False
+
+
+class NdjsonManifestWriter:
+    """
+    a class to be used for packing manifests into a single newline delimited json file
+
+    Manifests are buffered into blocks of about block_size bytes; each block is compressed on
+    its own, if at all, and appended to the file. Compressed files are valid concatenated gzip,
+    bz2, lzma or zstd streams, so they can still be streamed with the usual tools. A companion
+    index, <path>.index by default, records the block and position of every manifest so a single
+    one can be read back with :instance:`NdjsonManifestReader` without decompressing the rest
+    """
+    __name__ = "NdjsonManifestWriter"
+
+    def __init__(self, path, compression=None, block_size=DEFAULT_BLOCK_SIZE, index_path=None, use_orjson=False,
+                 stats=None):
+        """
+        initializes an instance of the class
+
+        The file and the index are truncated if they exist
+
+        :param str path: the path of the file to write
+        :param str compression: None, "gzip", "bz2", "lzma" or, on Pythons that have it, "zstd"
+        :param int block_size: the number of uncompressed bytes buffered before a block is written
+        :param str index_path: where to write the index; defaults to path + ".index"
+        :param bool use_orjson: whether to encode manifests with orjson when it is available
+        :param :instance:`PipelineStats` stats: where to record how long serializing and writing take,
+         if anywhere
+
+        :rtype :instance:`NdjsonManifestWriter`
+        """
+        if compression not in COMPRESSIONS:
+            raise ValueError("compression must be one of {}".format(sorted(COMPRESSIONS, key=str)))
+        self.path = path
+        self.index_path = index_path or path + INDEX_SUFFIX
+        self.compression = compression
+        self.block_size = block_size
+        self.use_orjson = use_orjson
+        self.stats = stats
+        self.written = 0
+        self.skipped = 0
+        self.last_manifest = None
+        self._compress = COMPRESSIONS[compression][0]
+        self._buffer = bytearray()
+        self._entries = []
+        self._position = 0
+        self._file = open(path, "wb")
+        # only "\n" ends an index line, so identifiers with any other line break round trip
+        self._index = open(self.index_path, "w", encoding="utf-8", newline="\n")
+        self._index.write("#\t{}\n".format(compression or ""))
+
+    def __repr__(self):
+        return self.__name__ + " writing to " + self.path
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, an_extraction):
+        """
+        a method to add the manifest of a record to the current block
+
+        Records without an identifier, or with one that spans lines, cannot be indexed and are
+        counted as skipped. The manifest json is kept in last_manifest until the next call, or
+        None if the record was skipped
+
+        :param :instance:`IIIFDataExtractionFromMarc` an_extraction: the record to write
+
+        :rtype Boolean
+        :returns whether the manifest was added
+        """
+        identifier = an_extraction.metadata.identifier
+        if not identifier or "\n" in identifier:
+            self.skipped += 1
+            self.last_manifest = None
+            return False
+        if self.stats is None:
+            data = an_extraction.to_json(use_orjson=self.use_orjson).encode("utf-8")
+        else:
+            with self.stats.time("serialize"):
+                data = an_extraction.to_json(use_orjson=self.use_orjson).encode("utf-8")
+        self.last_manifest = data
+        self._entries.append((identifier, len(self._buffer), len(data)))
+        self._buffer += data
+        self._buffer += b"\n"
+        if len(self._buffer) >= self.block_size:
+            self.flush()
+        return True
+
+    def write_all(self, extractions):
+        """
+        a method to write the manifests of every record in an iterable and close the file
+
+        :param iterable extractions: instances of :instance:`IIIFDataExtractionFromMarc`
+
+        :rtype :instance:`NdjsonManifestWriter`
+        :returns the instance, whose written and skipped counters have been updated
+        """
+        for an_extraction in extractions:
+            self.write(an_extraction)
+        self.close()
+        return self
+
+    def flush(self):
+        """
+        a method to write the current block and its index entries
+        """
+        if not self._buffer:
+            return
+        if self.stats is not None:
+            start = perf_counter()
+        block = bytes(self._buffer)
+        if self._compress is not None:
+            block = self._compress(block)
+        self._file.write(block)
+        position, size = self._position, len(block)
+        self._index.write("".join(["{}\t{}\t{}\t{}\t{}\n".format(position, size, offset, length, identifier)
+                                   for identifier, offset, length in self._entries]))
+        self._position += size
+        self.written += len(self._entries)
+        if self.stats is not None:
+            self.stats.add("write", perf_counter() - start, len(self._entries))
+        self._buffer = bytearray()
+        self._entries = []
+
+    def close(self):
+        """
+        a method to write the last block and close the file and its index
+        """
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+
+class NdjsonManifestReader:
+    """
+    a class to be used for reading single manifests out of a file written by NdjsonManifestWriter
+    """
+    __name__ = "NdjsonManifestReader"
+
+    def __init__(self, path, index_path=None):
+        """
+        initializes an instance of the class
+
+        When an identifier was written more than once the last manifest written wins
+
+        :param str path: the path of a file written by :instance:`NdjsonManifestWriter`
+        :param str index_path: the path of its index; defaults to path + ".index"
+
+        :rtype :instance:`NdjsonManifestReader`
+        """
+        self.path = path
+        self.offsets = {}
+        with open(index_path or path + INDEX_SUFFIX, "r", encoding="utf-8", newline="\n") as a_stream:
+            compression = a_stream.readline().rstrip("\n").split("\t", 1)[1] or None
+            if compression not in COMPRESSIONS:
+                raise ValueError("{} is compressed with {}, which is not available".format(path, compression))
+            for line in a_stream:
+                position, size, offset, length, identifier = line.rstrip("\n").split("\t", 4)
+                self.offsets[identifier] = (int(position), int(size), int(offset), int(length))
+        self.compression = compression
+        self._decompress = COMPRESSIONS[compression][1]
+        self._block = (None, None)
+        self._file = open(path, "rb")
+
+    def __repr__(self):
+        return "{} of {} manifests in {}".format(self.__name__, len(self), self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __contains__(self, identifier):
+        return identifier in self.offsets
+
+    def __iter__(self):
+        return iter(self.offsets)
+
+    def raw(self, identifier):
+        """
+        a method to get the json of a manifest
+
+        Only the block holding it is read and decompressed; the last block decompressed is kept
+        so that neighbouring manifests are read without decompressing it again
+
+        :param str identifier: the IIIF identifier of a record
+
+        :rtype bytes
+        :returns the manifest json
+        """
+        try:
+            position, size, offset, length = self.offsets[identifier]
+        except KeyError:
+            raise KeyError("no manifest for identifier {}".format(identifier)) from None
+        if self._decompress is None:
+            self._file.seek(position + offset)
+            return self._file.read(length)
+        if self._block[0] != position:
+            self._file.seek(position)
+            self._block = (position, self._decompress(self._file.read(size)))
+        return self._block[1][offset:offset + length]
+
+    def get(self, identifier):
+        """
+        a method to get a manifest
+
+        :param str identifier: the IIIF identifier of a record
+
+        :rtype dict
+        :returns the IIIF manifest
+        """
+        return loads(self.raw(identifier))
+
+    def close(self):
+        """
+        a method to close the file
+        """
+        self._file.close()
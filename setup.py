@@ -7,14 +7,17 @@ setup(
     version="0.1.0",
     license="LGPL3.0",
     description="An application to convert MARC records into IIIF records",
-    keywords="python3.6 iiif-presentation manifests marc",
+    keywords="python3.9 iiif-presentation manifests marc",
     packages=['marc2iiif'],
+    python_requires=">=3.9",
     classifiers=[
         "License :: OSI Approved :: GNU Library or Lesser " +
         "General Public License (LGPL)",
         "Development Status :: 5 - Alpha/Prototype",
         "Intended Audience :: Education",
         "Operating System :: POSIX :: Linux",
+        "Programming Language :: Python :: 3 :: Only",
+        "Programming Language :: Python :: 3.9",
         "Topic :: Text Processing :: Markup :: XML",
     ],
     dependency_links = [
@@ -0,0 +1,64 @@
+from asyncio import run
+from os import mkdir, walk
+from os.path import join, relpath
+from tempfile import TemporaryDirectory
+import unittest
+
+from marc2iiif.asynchronous import convert_async
+from marc2iiif.classes import MarcFilesFromDisk
+from marc2iiif.instrumentation import PipelineStats
+from marc2iiif.writers import ShardedManifestWriter
+
+from .test_readers import build_record, write_marc_file
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = join(self.tmp.name, 'in')
+        mkdir(self.source)
+        mkdir(join(self.source, 'nested'))
+        write_marc_file(join(self.source, 'a.mrc'), [build_record(str(n), 'Title ' + str(n)) for n in range(25)])
+        write_marc_file(join(self.source, 'nested', 'b.mrc'), [build_record('25', 'Title 25')])
+        with open(join(self.source, 'nested', 'c.mrc'), 'wb') as a_stream:
+            a_stream.write(build_record('26', 'Title 26').as_marc()[:-40] + b'\x1d')
+
+    def read_tree(self, root):
+        out = {}
+        for directory, _, names in walk(root):
+            for name in names:
+                with open(join(directory, name), 'rb') as a_stream:
+                    out[relpath(join(directory, name), root)] = a_stream.read()
+        return out
+
+    def testSameManifestsAsSerialWriter(self):
+        """a test that the async pipeline writes the same files as writing every extraction in turn
+        """
+        expected = join(self.tmp.name, 'expected')
+        ShardedManifestWriter(expected).write_all(MarcFilesFromDisk(self.source).extractions())
+        for workers in (1, 2):
+            output = join(self.tmp.name, 'out' + str(workers))
+            writer = ShardedManifestWriter(output)
+            stats = PipelineStats()
+            converted, errors = run(convert_async(self.source, writer, workers=workers, batch_size=4,
+                                                  queue_size=2, stats=stats))
+            self.assertEqual(converted, 26)
+            self.assertEqual([x[:2] for x in errors], [(join(self.source, 'nested', 'c.mrc'), 0)])
+            self.assertEqual((writer.written, writer.unchanged, writer.skipped), (26, 0, 0))
+            self.assertEqual(self.read_tree(output), self.read_tree(expected))
+            self.assertEqual(stats.counts['extract'], 26)
+            self.assertEqual(stats.counts['write'], 26)
+
+    def testUnchangedManifestsAreLeftAlone(self):
+        """a test that a second run only counts the manifests as unchanged
+        """
+        output = join(self.tmp.name, 'out')
+        run(convert_async(self.source, ShardedManifestWriter(output), workers=1))
+        writer = ShardedManifestWriter(output)
+        converted, _ = run(convert_async(self.source, writer, workers=1))
+        self.assertEqual((converted, writer.written, writer.unchanged), (26, 0, 26))
+
+
+if __name__ == "__main__":
+    unittest.main()
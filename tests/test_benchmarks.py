@@ -0,0 +1,30 @@
+import unittest
+
+from benchmarks.suite import compare, run
+from benchmarks.synthetic import synthetic_records, to_pymarc
+
+
+class Tests(unittest.TestCase):
+    def testSyntheticRecordsAreDeterministic(self):
+        """a test that the same seed always generates the same records
+        """
+        first = synthetic_records(3, fields=10, repeats=2, subfields=4, subfield_size=8, seed=5)
+        self.assertEqual(first, synthetic_records(3, fields=10, repeats=2, subfields=4, subfield_size=8, seed=5))
+        self.assertEqual(len(first[0]['fields']), 13)
+        self.assertEqual(to_pymarc(first[0]).as_dict()['fields'], first[0]['fields'])
+
+    def testSuiteReportsEveryStage(self):
+        """a test that a small run of the suite measures every stage and can be compared
+        """
+        current = run(records=5, fields=5)
+        self.assertEqual(sorted(current['results']),
+                         ['combine_subfields', 'from_dict', 'from_pymarc', 'json_dumps', 'to_dict', 'to_json'])
+        for result in current['results'].values():
+            self.assertGreater(result['records_per_second'], 0)
+        slower = {'results': {'to_json': {'records_per_second': current['results']['to_json']['records_per_second'] * 2}}}
+        self.assertEqual([x[0] for x in compare(current, slower)], ['to_json'])
+        self.assertEqual(compare(current, current), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
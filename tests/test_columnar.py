@@ -0,0 +1,57 @@
+from io import StringIO
+import csv
+import unittest
+
+from benchmarks.synthetic import synthetic_records, to_pymarc
+from marc2iiif.classes import IIIFMetadataBoxFromMarc
+from marc2iiif.columnar import MetadataColumns, column_names
+from marc2iiif.constants import IDENTIFIER_PATTERNS
+from marc2iiif.profiles import MappingProfile
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.records = synthetic_records(30, fields=30, repeats=3, seed=11)
+        self.records.append({'leader': self.records[0]['leader'], 'fields': [{'001': '1'}]})
+
+    def testSameValuesAsExtraction(self):
+        """a test that every column holds what extracting each record on its own would give
+        """
+        for profile in (None, MappingProfile.from_dict({'repeated': 'merge', 'max_values': 2}),
+                        MappingProfile.from_dict({'repeated': 'first', 'identifier_patterns': IDENTIFIER_PATTERNS})):
+            names = column_names(profile)
+            for columns in (MetadataColumns.from_dicts(self.records, profile=profile),
+                            MetadataColumns.from_pymarc([to_pymarc(x) for x in self.records], profile=profile)):
+                self.assertEqual((len(columns), columns.names), (len(self.records), names))
+                for record, row in zip(self.records, columns.rows()):
+                    box = IIIFMetadataBoxFromMarc.from_dict(record, profile=profile)
+                    expected = {'identifier': box.identifier, 'label': box.label, 'description': box.description}
+                    for a_field in box.fields:
+                        if expected.get(a_field['label']) is None:
+                            expected[a_field['label']] = a_field['value']
+                        else:
+                            expected[a_field['label']] += '; ' + a_field['value']
+                    self.assertEqual({name: value for name, value in zip(names, row) if value is not None}, expected)
+
+    def testSelectedColumnsAndExports(self):
+        """a test that only the columns asked for are extracted and that they export to CSV and Arrow style buffers
+        """
+        columns = MetadataColumns.from_dicts(self.records, names=['label', 'Local Subject'])
+        self.assertEqual(columns.names, ['label', 'Local Subject'])
+        self.assertRaises(ValueError, MetadataColumns.from_dicts, self.records, names=['Not A Label'])
+        repeated = MetadataColumns.from_dicts(self.records, names=['label', 'Local Subject', 'label'])
+        self.assertEqual((repeated.names, repeated.columns), (columns.names, columns.columns))
+        out = StringIO()
+        columns.to_csv(out)
+        rows = list(csv.reader(StringIO(out.getvalue())))
+        self.assertEqual(rows[0], ['label', 'Local Subject'])
+        self.assertEqual(rows[1:], [[x or '' for x in row] for row in columns.rows()])
+        validity, offsets, data = columns.to_buffers()['Local Subject']
+        self.assertEqual(len(offsets), len(columns) + 1)
+        for n, value in enumerate(columns['Local Subject']):
+            self.assertEqual(bool(validity[n >> 3] & (1 << (n & 7))), value is not None)
+            self.assertEqual(data[offsets[n]:offsets[n + 1]].decode('utf-8'), value or '')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+from asyncio import run
+from os import mkdir
+from os.path import join
+from tempfile import TemporaryDirectory
+import unittest
+
+from pymarc import Field, Subfield
+
+from marc2iiif.asynchronous import convert_async
+from marc2iiif.classes import MarcFilesFromDisk
+from marc2iiif.dedup import BloomFilter, DuplicateFilter, content_key, control_number_key
+from marc2iiif.writers import ShardedManifestWriter
+
+from .test_readers import build_record, write_marc_file
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = join(self.tmp.name, 'in')
+        mkdir(self.source)
+        write_marc_file(join(self.source, 'a.mrc'), [build_record(str(n), 'Title ' + str(n)) for n in range(20)])
+        write_marc_file(join(self.source, 'b.mrc'), [build_record(str(n), 'Again ' + str(n)) for n in range(15, 30)])
+
+    def testDuplicatesAreSkippedBeforeParsing(self):
+        """a test that only the first copy of each control number is read, whichever way records are converted
+        """
+        for duplicates in (DuplicateFilter(), DuplicateFilter(capacity=2, error_rate=0.5), DuplicateFilter(exact=False),
+                           DuplicateFilter(exact_path=join(self.tmp.name, 'seen.sqlite'))):
+            with duplicates:
+                titles = [x.show_title() for x in MarcFilesFromDisk(self.source, duplicates=duplicates).extractions()]
+            self.assertEqual(titles, ['Title ' + str(n) for n in range(20)] + ['Again ' + str(n) for n in range(20, 30)])
+            self.assertEqual((duplicates.checked, duplicates.duplicates), (35, 5))
+        with DuplicateFilter(exact_path=join(self.tmp.name, 'seen.sqlite')) as duplicates:
+            self.assertEqual(list(MarcFilesFromDisk(self.source, duplicates=duplicates)), [])
+        writer = ShardedManifestWriter(join(self.tmp.name, 'out'))
+        with DuplicateFilter() as duplicates:
+            converted, errors = run(convert_async(self.source, writer, workers=1, duplicates=duplicates))
+        self.assertEqual((converted, errors, writer.written), (30, [], 30))
+
+    def testKeys(self):
+        """a test that records are keyed on 001, then 035, then their content without the volatile fields
+        """
+        record, exported_later = build_record('1', 'A Title'), build_record('1', 'A Title')
+        record.add_ordered_field(Field(tag='005', data='20250101000000.0'))
+        exported_later.add_ordered_field(Field(tag='005', data='20260101000000.0'))
+        self.assertEqual(content_key(record.as_marc()), content_key(exported_later.as_marc()))
+        self.assertNotEqual(content_key(record.as_marc()), content_key(build_record('1', 'Retitled').as_marc()))
+        self.assertEqual(control_number_key(record.as_marc()), control_number_key(build_record('1', 'B').as_marc()))
+        for a_record in (record, exported_later):
+            a_record.remove_fields('001')
+        self.assertEqual(control_number_key(record.as_marc()), content_key(record.as_marc()))
+        record.add_ordered_field(Field(tag='035', indicators=[' ', ' '], subfields=[Subfield('a', '(OCoLC)123')]))
+        exported_later.add_ordered_field(Field(tag='035', indicators=[' ', ' '],
+                                               subfields=[Subfield('a', '(OCoLC)124')]))
+        self.assertNotEqual(control_number_key(record.as_marc()), control_number_key(exported_later.as_marc()))
+        exported_later['035']['a'] = '(OCoLC)123'
+        self.assertEqual(control_number_key(record.as_marc()), control_number_key(exported_later.as_marc()))
+        self.assertRaises(ValueError, DuplicateFilter, key='title')
+
+    def testBloomFilterNeverForgets(self):
+        """a test that a Bloom filter remembers every key added and stays near its error rate
+        """
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        keys = [content_key(build_record(str(n), 'Title').as_marc()) for n in range(2000)]
+        self.assertLess(sum(bloom.add(key) for key in keys[:1000]), 20)
+        self.assertTrue(all(key in bloom for key in keys[:1000]))
+        self.assertLess(sum(key in bloom for key in keys[1000:]), 50)
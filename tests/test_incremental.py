@@ -0,0 +1,92 @@
+from hashlib import sha1
+from os import mkdir
+from os.path import exists, join
+from tempfile import TemporaryDirectory
+import unittest
+
+from marc2iiif.incremental import ConversionIndex, convert_incrementally
+from marc2iiif.profiles import MappingProfile
+from marc2iiif.writers import ShardedManifestWriter
+
+from .test_readers import build_record, write_marc_file
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = join(self.tmp.name, 'dump.mrc')
+        self.index_path = join(self.tmp.name, 'index.sqlite')
+        self.output = join(self.tmp.name, 'out')
+
+    def run_conversion(self, profile=None):
+        with ConversionIndex(self.index_path, profile=profile) as index:
+            return convert_incrementally(self.source, index, ShardedManifestWriter(self.output))
+
+    def testOnlyChangedRecordsAreConverted(self):
+        """a test that a second run only converts new and changed records
+        """
+        write_marc_file(self.source, [build_record(str(n), 'Title ' + str(n)) for n in range(5)])
+        self.assertEqual(self.run_conversion(), (5, 0, []))
+        self.assertEqual(self.run_conversion(), (0, 5, []))
+        records = [build_record(str(n), 'Title ' + str(n)) for n in range(6)]
+        records[2] = build_record('2', 'A corrected title')
+        write_marc_file(self.source, records)
+        self.assertEqual(self.run_conversion(), (2, 4, []))
+
+    def testBadRecordsAreReported(self):
+        """a test that a record that cannot be parsed is reported, retried next time and does not stop the run
+        """
+        records = [build_record(str(n), 'Title ' + str(n)).as_marc() for n in range(3)]
+        broken = bytearray(records[1])
+        broken[12:17] = b'00000'
+        with open(self.source, 'wb') as a_stream:
+            a_stream.write(records[0] + bytes(broken) + records[2])
+        for _ in range(2):
+            converted, unchanged, errors = self.run_conversion()
+            self.assertEqual([(path, offset) for path, offset, _ in errors], [(self.source, len(records[0]))])
+            self.assertTrue(errors[0][2].startswith('BaseAddressNotFound'))
+        self.assertEqual((converted, unchanged), (0, 2))
+        with ConversionIndex(self.index_path) as index:
+            with open(ShardedManifestWriter(self.output).path_for('http://example.org/2'), 'rb') as a_stream:
+                self.assertEqual(index.get('2')[1], sha1(a_stream.read()).hexdigest())
+
+    def testDamagedFileDoesNotLoseManifests(self):
+        """a test that a damaged record length ends only its own file and that nothing unwritten is marked current
+        """
+        source = join(self.tmp.name, 'dumps')
+        mkdir(source)
+        records = [build_record(str(n), 'Title ' + str(n)).as_marc() for n in range(2)]
+        with open(join(source, 'a.mrc'), 'wb') as a_stream:
+            a_stream.write(b''.join(records) + b'garbage')
+        write_marc_file(join(source, 'b.mrc'), [build_record('2', 'Title 2')])
+        for expected in ((3, 0), (0, 3)):
+            with ConversionIndex(self.index_path) as index:
+                writer = ShardedManifestWriter(self.output, batch_size=100)
+                converted, unchanged, errors = convert_incrementally(source, index, writer)
+            self.assertEqual((converted, unchanged), expected)
+            self.assertEqual([(path, offset) for path, offset, _ in errors],
+                             [(join(source, 'a.mrc'), len(b''.join(records)))])
+        for n in range(3):
+            self.assertTrue(exists(writer.path_for('http://example.org/' + str(n))))
+        with self.assertRaises(RuntimeError):
+            with ConversionIndex(self.index_path) as index:
+                index.update('9', 'source', 'manifest')
+                raise RuntimeError('the writer failed')
+        with ConversionIndex(self.index_path) as index:
+            self.assertIsNone(index.get('9'))
+
+    def testMappingChangeReconvertsEverything(self):
+        """a test that changing the field mapping invalidates every indexed record
+        """
+        write_marc_file(self.source, [build_record(str(n), 'Title ' + str(n)) for n in range(3)])
+        self.run_conversion()
+        changed = MappingProfile.from_dict({'label_lookup': {'650': 'Subject'}})
+        self.assertEqual(self.run_conversion(profile=changed), (3, 0, []))
+        self.assertEqual(self.run_conversion(profile=changed), (0, 3, []))
+        with ConversionIndex(self.index_path, profile=changed) as index:
+            self.assertEqual(index.get('1')[2], changed.fingerprint)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+from os import mkdir
+from os.path import join
+from tempfile import TemporaryDirectory
+import pickle
+import unittest
+
+from marc2iiif.classes import IIIFDataExtractionFromMarc, MarcFilesFromDisk
+from marc2iiif.instrumentation import PipelineStats
+from marc2iiif.parallel import convert_tree
+from marc2iiif.writers import ShardedManifestWriter
+
+from .test_readers import build_record, write_marc_file
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = join(self.tmp.name, 'dump.mrc')
+        write_marc_file(self.source, [build_record(str(n), 'Title ' + str(n)) for n in range(4)])
+
+    def testStagesAreCounted(self):
+        """a test that every stage of a read, convert and write run is timed and counted
+        """
+        seen = []
+        stats = PipelineStats(callback=lambda stage, seconds, count: seen.append(stage))
+        reader = MarcFilesFromDisk(self.source, stats=stats)
+        ShardedManifestWriter(join(self.tmp.name, 'out'), stats=stats).write_all(reader.extractions())
+        list(MarcFilesFromDisk(self.source, stats=stats).manifests())
+        list(MarcFilesFromDisk(self.source, stats=stats))
+        counts = {stage: values['count'] for stage, values in stats.to_dict().items()}
+        self.assertEqual(counts['read'], 12)
+        self.assertEqual(counts['extract'], 8)
+        self.assertEqual(counts['extract.title'], 8)
+        self.assertEqual(counts['extract.description'], 8)
+        self.assertEqual(counts['extract.metadata'], 8)
+        self.assertEqual(counts['dictify'], 4)
+        self.assertEqual(counts['to_dict'], 4)
+        self.assertEqual(counts['serialize'], 4)
+        self.assertEqual(counts['write'], 4)
+        self.assertIn('write', seen)
+        self.assertIn('extract.match', str(stats))
+
+    def testDisabledByDefault(self):
+        """a test that nothing is measured when no stats are given
+        """
+        record = build_record('1', 'A title').as_dict()
+        stats = PipelineStats()
+        self.assertEqual(IIIFDataExtractionFromMarc.from_dict(record).to_dict(),
+                         IIIFDataExtractionFromMarc.from_dict(record, stats=stats).to_dict())
+        self.assertEqual(MarcFilesFromDisk(self.source).stats, None)
+
+    def testWorkerStatsAreMerged(self):
+        """a test that stats gathered in worker processes are added up and survive pickling
+        """
+        output = join(self.tmp.name, 'out')
+        mkdir(output)
+        stats = PipelineStats()
+        convert_tree(self.source, output, workers=2, shard_size=200, stats=stats)
+        self.assertEqual(stats.counts['extract'], 4)
+        self.assertEqual(stats.counts['write'], 4)
+        self.assertEqual(pickle.loads(pickle.dumps(stats)).counts['read'], stats.counts['read'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import pickle
+import unittest
+
+from benchmarks.synthetic import synthetic_records, to_pymarc
+from marc2iiif.classes import IIIFDataExtractionFromMarc, IIIFMetadataBoxFromMarc, IIIFMetadataField, \
+    LazyIIIFMetadataBoxFromMarc
+from marc2iiif.instrumentation import PipelineStats
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.records = synthetic_records(20, fields=30, repeats=3, seed=3)
+        self.records.append({'leader': self.records[0]['leader'], 'fields': [{'001': '1'}]})
+
+    def testSameResultAsEagerExtraction(self):
+        """a test that every part of a lazy box matches the eager extraction, whatever order it is read in
+        """
+        for n, record in enumerate(self.records):
+            for build in (lambda x, **kw: IIIFDataExtractionFromMarc.from_dict(x, **kw),
+                          lambda x, **kw: IIIFDataExtractionFromMarc.from_pymarc(to_pymarc(x), **kw)):
+                eager, lazy = build(record), build(record, lazy=True)
+                self.assertIsInstance(lazy.metadata, LazyIIIFMetadataBoxFromMarc)
+                if n % 2:
+                    self.assertEqual(lazy.show_metadata(), eager.show_metadata())
+                self.assertEqual(lazy.metadata.identifier, eager.metadata.identifier)
+                self.assertEqual(lazy.to_json(), eager.to_json())
+                self.assertTrue(lazy.metadata.resolved)
+
+    def testOnlyResolvesWhatIsUsed(self):
+        """a test that reading the label and identifier leaves the description and metadata fields alone
+        """
+        stats = PipelineStats()
+        box = LazyIIIFMetadataBoxFromMarc.from_dict(self.records[0], stats=stats)
+        eager = IIIFMetadataBoxFromMarc.from_dict(self.records[0])
+        self.assertEqual((box.label, box.identifier), (eager.label, eager.identifier))
+        self.assertEqual((box.label, box.identifier), (eager.label, eager.identifier))
+        self.assertEqual(sorted(stats.counts.items()), [('extract.identifier', 1), ('extract.title', 1)])
+        self.assertFalse(box.resolved)
+        self.assertEqual(box.get_fields(), eager.get_fields())
+        self.assertEqual(stats.counts['extract.metadata'], 1)
+
+    def testEditsBeforeResolving(self):
+        """a test that a value set or edited on a lazy box wins over the record
+        """
+        an_extraction = IIIFDataExtractionFromMarc.from_dict(self.records[1], lazy=True)
+        an_extraction.change_title('A new title')
+        an_extraction.metadata.add_field(IIIFMetadataField('Local Subject', 'Added'))
+        first = an_extraction.show_metadata()[0]
+        an_extraction.modify_metadata({first['label']: first['value']}, 'Changed')
+        self.assertEqual(an_extraction.show_title(), 'A new title')
+        self.assertEqual(an_extraction.show_metadata()[-1], {'label': 'Local Subject', 'value': 'Added'})
+        self.assertIn({'label': first['label'], 'value': 'Changed'}, an_extraction.show_metadata())
+        copy = pickle.loads(pickle.dumps(an_extraction))
+        self.assertIs(type(copy.metadata), IIIFMetadataBoxFromMarc)
+        self.assertEqual(copy.to_json(), an_extraction.to_json())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+from os import listdir, mkdir
+from os.path import join
+from tempfile import TemporaryDirectory
+import json
+import unittest
+
+from marc2iiif.parallel import Shard, convert_shard, convert_tree, plan_shards
+
+from .test_readers import build_record, write_marc_file
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = join(self.tmp.name, 'in')
+        self.output = join(self.tmp.name, 'out')
+        mkdir(self.source)
+        mkdir(self.output)
+        mkdir(join(self.source, 'nested'))
+        write_marc_file(join(self.source, 'a.mrc'),
+                        [build_record(str(n), 'Title ' + str(n)) for n in range(10)])
+        write_marc_file(join(self.source, 'nested', 'b.mrc'), [build_record('10', 'Title 10')])
+
+    def testPlanShardsOnRecordBoundaries(self):
+        """a test that large files are cut into shards that start and end between records
+        """
+        path = join(self.source, 'a.mrc')
+        shards = plan_shards([path], shard_size=300)
+        self.assertGreater(len(shards), 1)
+        self.assertEqual(shards[0].start, 0)
+        for before, after in zip(shards, shards[1:]):
+            self.assertEqual(before.end, after.start)
+        with open(path, 'rb') as a_stream:
+            data = a_stream.read()
+        self.assertEqual(shards[-1].end, len(data))
+        for shard in shards:
+            self.assertEqual(data[shard.end - 1:shard.end], b'\x1d')
+
+    def testConvertTreeInOrder(self):
+        """a test that a directory tree is converted with deterministic result ordering
+        """
+        results = convert_tree(self.source, self.output, workers=2, shard_size=300)
+        self.assertEqual(sum(x.converted for x in results), 11)
+        self.assertEqual([x.errors for x in results], [[]] * len(results))
+        self.assertEqual([x.shard for x in results],
+                         plan_shards([join(self.source, 'a.mrc'), join(self.source, 'nested', 'b.mrc')],
+                                     shard_size=300))
+        self.assertEqual(len(listdir(self.output)), 11)
+        with open(join(self.output, 'http%3A%2F%2Fexample.org%2F3.json')) as a_stream:
+            self.assertEqual(json.load(a_stream)['label'], 'Title 3')
+
+    def testErrorsAreIsolated(self):
+        """a test that a damaged record is reported without stopping the rest of the shard
+        """
+        path = join(self.source, 'a.mrc')
+        with open(path, 'rb') as a_stream:
+            data = bytearray(a_stream.read())
+        first_length = int(data[:5])
+        data[first_length + 12:first_length + 17] = b'xxxxx'
+        with open(path, 'wb') as a_stream:
+            a_stream.write(data)
+        result = convert_shard(Shard(path, 0, len(data)), self.output)
+        self.assertEqual(result.converted, 9)
+        self.assertEqual(len(result.errors), 1)
+        self.assertEqual(result.errors[0][0], first_length)
+
+    def testNameCollisionsAreReported(self):
+        """a test that a second record with the same file name in a shard is reported instead of overwriting the first
+        """
+        path = join(self.source, 'same.mrc')
+        write_marc_file(path, [build_record('1', 'First'), build_record('2', 'Second'), build_record('1', 'Third')])
+        result = convert_shard(Shard(path, 0, 10 ** 6), self.output)
+        self.assertEqual(result.converted, 2)
+        self.assertEqual(len(result.errors), 1)
+        self.assertIn('http%3A%2F%2Fexample.org%2F1.json', result.errors[0][1])
+        with open(join(self.output, 'http%3A%2F%2Fexample.org%2F1.json')) as a_stream:
+            self.assertEqual(json.load(a_stream)['label'], 'First')
+        self.assertEqual(sorted(listdir(self.output)), ['http%3A%2F%2Fexample.org%2F1.json',
+                                                        'http%3A%2F%2Fexample.org%2F2.json'])
+
+    def testNameCollisionsAcrossShards(self):
+        """a test that the first record in file order keeps a name shared across shards whichever worker finishes last
+        """
+        source = join(self.tmp.name, 'collide')
+        mkdir(source)
+        write_marc_file(join(source, 'a.mrc'), [build_record('1', 'First'), build_record('2', 'Two')])
+        write_marc_file(join(source, 'b.mrc'), [build_record('3', 'Three'), build_record('1', 'Later')])
+        results = convert_tree(source, self.output, workers=2, shard_size=100)
+        self.assertEqual(sum(x.converted for x in results), 3)
+        errors = [(x.shard.path, error) for x in results for error in x.errors]
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(errors[0][0], join(source, 'b.mrc'))
+        self.assertIn('http%3A%2F%2Fexample.org%2F1.json', errors[0][1][1])
+        with open(join(self.output, 'http%3A%2F%2Fexample.org%2F1.json')) as a_stream:
+            self.assertEqual(json.load(a_stream)['label'], 'First')
+
+    def testUnreadableShard(self):
+        """a test that a missing file becomes an error instead of an exception
+        """
+        result = convert_shard(Shard(join(self.source, 'gone.mrc'), 0, 10), self.output)
+        self.assertEqual(result.converted, 0)
+        self.assertEqual(len(result.errors), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+import json
+import unittest
+
+from marc2iiif.classes import IIIFDataExtractionFromMarc, IIIFMetadataBoxFromMarc, IIIFMetadataField
+from marc2iiif.patches import MetadataPatch
+
+
+def build_extraction(identifier, values):
+    return IIIFDataExtractionFromMarc(IIIFMetadataBoxFromMarc(
+        'Title ' + identifier, 'a description', identifier,
+        [IIIFMetadataField('Local Subject', value) for value in values]))
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.operations = [
+            {'op': 'replace', 'label': 'Local Subject', 'value': 'Chicgao', 'new_value': 'Chicago'},
+            {'op': 'remove', 'label': 'Local Subject', 'value': 'Obsolete'},
+            {'op': 'add', 'label': 'Holding Institution', 'value': 'University of Chicago'},
+            {'op': 'retitle', 'identifier': 'b', 'title': 'A corrected title'},
+        ]
+
+    def testApplyToStream(self):
+        """a test that a patch edits every record of a stream and counts its matches
+        """
+        patch = MetadataPatch(self.operations)
+        records = list(patch.apply([build_extraction('a', ['Chicgao', 'Maps', 'Obsolete', 'Chicgao']),
+                                    build_extraction('b', ['Maps'])]))
+        self.assertEqual(records[0].show_metadata(),
+                         [{'label': 'Local Subject', 'value': 'Chicago'},
+                          {'label': 'Local Subject', 'value': 'Maps'},
+                          {'label': 'Local Subject', 'value': 'Chicago'},
+                          {'label': 'Holding Institution', 'value': 'University of Chicago'}])
+        self.assertEqual(records[0].show_title(), 'Title a')
+        self.assertEqual(records[1].show_title(), 'A corrected title')
+        self.assertEqual([x['matches'] for x in patch.report()], [2, 1, 2, 1])
+        self.assertEqual((patch.records_seen, patch.records_changed), (2, 2))
+
+    def testEditsStayIndexed(self):
+        """a test that single edits still work on a record after a patch was applied to it
+        """
+        record = build_extraction('a', ['Chicgao', 'Maps'])
+        MetadataPatch(self.operations[:1]).apply_to(record)
+        record.modify_metadata({'Local Subject': 'Chicago'}, 'Illinois')
+        record.remove_metadata({'Local Subject': 'Maps'})
+        self.assertEqual(record.show_metadata(), [{'label': 'Local Subject', 'value': 'Illinois'}])
+
+    def testInvalidPatches(self):
+        """a test that malformed patches are refused when they are compiled
+        """
+        self.assertRaises(ValueError, MetadataPatch, [{'op': 'rename'}])
+        self.assertRaises(TypeError, MetadataPatch, [{'op': 'add', 'label': 'Local Subject', 'value': 1}])
+        self.assertRaises(ValueError, MetadataPatch, [self.operations[0],
+                                                      {'op': 'remove', 'label': 'Local Subject', 'value': 'Chicgao'}])
+        scoped = {'op': 'remove', 'label': 'Local Subject', 'value': 'Chicgao', 'identifier': 'http://example.org/1'}
+        self.assertRaises(ValueError, MetadataPatch, [self.operations[0], scoped])
+        self.assertRaises(ValueError, MetadataPatch, [scoped, self.operations[0]])
+        MetadataPatch([scoped, dict(scoped, identifier='http://example.org/2')])
+
+    def testFromFile(self):
+        """a test to load a patch from a json file
+        """
+        with TemporaryDirectory() as tmp:
+            path = join(tmp, 'patch.json')
+            with open(path, 'w') as a_stream:
+                json.dump(self.operations, a_stream)
+            patch = MetadataPatch.from_file(path)
+        self.assertTrue(patch.apply_to(build_extraction('c', [])))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+import json
+import unittest
+
+from benchmarks.synthetic import to_pymarc
+from marc2iiif.classes import IIIFDataExtractionFromMarc
+from marc2iiif.constants import IDENTIFIER_PATTERNS
+from marc2iiif.instrumentation import PipelineStats
+from marc2iiif.profiles import DEFAULT_PROFILE, MappingProfile, mapping_fingerprint
+from marc2iiif.utils import default_identifier_extraction
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.data = {'leader': '00104abc 1234567Az 1234',
+                     'fields': [{'245': {'subfields': [{'a': 'A Title of a CHO'}]}},
+                                {'246': {'subfields': [{'a': 'A Variant Title'}]}},
+                                {'300': {'subfields': [{'a': '1 map'}]}},
+                                {'520': {'subfields': [{'a': 'A summary.'}]}},
+                                {'690': {'subfields': [{'a': 'Test'}, {'b': 'Subject'}]}}]}
+
+    def testDefaultProfileMatchesConstants(self):
+        """a test that leaving out a profile and passing the default one give the same result
+        """
+        implicit = IIIFDataExtractionFromMarc.from_dict(self.data)
+        explicit = IIIFDataExtractionFromMarc.from_dict(self.data, profile=DEFAULT_PROFILE)
+        self.assertEqual(implicit.to_dict(), explicit.to_dict())
+
+    def testCustomProfile(self):
+        """a test that a collection specific profile changes what is extracted
+        """
+        profile = MappingProfile.from_dict({'title_lookups': ['246'],
+                                            'description_lookups': ['300'],
+                                            'label_lookup': {'520': 'Summary'}})
+        test_object = IIIFDataExtractionFromMarc.from_dict(self.data, profile=profile)
+        self.assertEqual(test_object.show_title(), 'A Variant Title')
+        self.assertEqual(test_object.show_description(), '1 map')
+        self.assertEqual(test_object.show_metadata(), [{'label': 'Summary', 'value': 'A summary.'}])
+        self.assertNotEqual(profile, DEFAULT_PROFILE)
+        for bad in ({'title_lookups': '245'}, {'description_lookups': '300'}, {'title_lookups': [245]},
+                    {'label_lookup': ['690']}, {'label_lookup': '690'}, {'label_lookup': {690: 'Subject'}},
+                    {'label_lookup': {'001': 'Control Number'}}, {'title_lookups': ['008']}):
+            self.assertRaises(ValueError, MappingProfile.from_dict, bad)
+
+    def testProfileFromFileIsCached(self):
+        """a test that loading the same profile file twice reuses the compiled profile
+        """
+        with TemporaryDirectory() as tmp:
+            path = join(tmp, 'profile.json')
+            with open(path, 'w') as a_stream:
+                json.dump({'label_lookup': {'690': 'Local Subject'}}, a_stream)
+            first = MappingProfile.from_file(path)
+            self.assertIs(MappingProfile.from_file(path), first)
+        self.assertEqual(first.dispatch['690'], ('metadata', 'Local Subject'))
+        self.assertIn('300', first.description_lookups)
+
+    def testIdentifierPatterns(self):
+        """a test that identifier patterns take the identifier from subfield u and count the records they miss
+        """
+        profile = MappingProfile.from_dict({'identifier_patterns': IDENTIFIER_PATTERNS})
+        self.assertNotEqual(profile.fingerprint, DEFAULT_PROFILE.fingerprint)
+        self.assertEqual(DEFAULT_PROFILE.fingerprint, mapping_fingerprint())
+        link = {'856': {'ind1': '4', 'ind2': '1', 'subfields': [{'3': 'Online map'}, {'u': ''}]}}
+        fields = [{tag: dict(body, ind1=' ', ind2=' ')} for a_field in self.data['fields'] for tag, body in a_field.items()]
+        stats = PipelineStats()
+        identifiers = []
+        for url in ['https://pi.lib.uchicago.edu/1001/maps/chisoc/1', 'http://pi.lib.uchicago.edu/1001/cat/bib/2',
+                    'http://example.org/3']:
+            link['856']['subfields'][1]['u'] = url
+            record = {'leader': self.data['leader'], 'fields': fields + [json.loads(json.dumps(link))]}
+            for lazy in (False, True):
+                eager = IIIFDataExtractionFromMarc.from_dict(record, profile=profile, stats=stats, lazy=lazy)
+                direct = IIIFDataExtractionFromMarc.from_pymarc(to_pymarc(record), profile=profile, lazy=lazy)
+                self.assertEqual(eager.metadata.identifier, direct.metadata.identifier)
+            identifiers.append(eager.metadata.identifier)
+        self.assertEqual(identifiers, ['maps/chisoc/1', 'cat/bib/2', ''])
+        self.assertEqual((stats.counts['identifier.matched'], stats.counts['identifier.missed']), (4, 2))
+        self.assertEqual(default_identifier_extraction('https://pi.lib.uchicago.edu/1001/maps/1'), (True, 'maps/1'))
+        self.assertEqual(default_identifier_extraction('ftp://pi.lib.uchicago.edu/1001/maps/1'), (False, None))
+        self.assertRaises(ValueError, MappingProfile.from_dict, {'identifier_patterns': ['^https?://']})
+
+    def testRepeatedFields(self):
+        """a test that every occurrence of a repeated field is kept, merged or capped as the profile says
+        """
+        subjects = [{'690': {'ind1': ' ', 'ind2': ' ', 'subfields': [{'a': value}]}}
+                    for value in ['Maps', 'Chicago', 'Maps', 'Rivers']]
+        title = {'245': {'ind1': ' ', 'ind2': ' ', 'subfields': [{'a': 'A Title of a CHO'}]}}
+        record = {'leader': self.data['leader'], 'fields': [title] + subjects}
+        expected = {
+            'all': ['Maps', 'Chicago', 'Maps', 'Rivers'],
+            'first': ['Maps', 'Maps', 'Maps', 'Maps'],
+            'merge': ['Maps; Chicago; Rivers'],
+        }
+        fingerprints = set()
+        for repeated, values in expected.items():
+            for max_values in (None, 2):
+                profile = MappingProfile.from_dict({'repeated': repeated, 'max_values': max_values})
+                fingerprints.add(profile.fingerprint)
+                if max_values and repeated != 'merge':
+                    values = values[:max_values]
+                elif max_values:
+                    values = ['Maps; Chicago']
+                for lazy in (False, True):
+                    for an_extraction in (IIIFDataExtractionFromMarc.from_dict(record, profile=profile, lazy=lazy),
+                                          IIIFDataExtractionFromMarc.from_pymarc(to_pymarc(record), profile=profile,
+                                                                                 lazy=lazy)):
+                        self.assertEqual(an_extraction.show_metadata(),
+                                         [{'label': 'Local Subject', 'value': value} for value in values])
+        self.assertEqual(len(fingerprints), 6)
+        self.assertEqual(MappingProfile.from_dict({}).repeated, 'all')
+        self.assertRaises(ValueError, MappingProfile.from_dict, {'repeated': 'some'})
+        self.assertRaises(ValueError, MappingProfile.from_dict, {'max_values': 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+import unittest
+
+from marc2iiif.classes import MarcFilesFromDisk
+from marc2iiif.constants import IDENTIFIER_PATTERNS
+from marc2iiif.profiles import MappingProfile
+from marc2iiif.random_access import MarcOffsetIndex, raw_identifier
+
+from .test_readers import build_record, write_marc_file
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = join(self.tmp.name, 'a.mrc')
+        records = [build_record(str(n), 'Title ' + str(n) * n) for n in range(30)]
+        records.append(build_record('7', 'A newer Title 7'))
+        records[3].remove_fields('001')
+        write_marc_file(self.path, records)
+
+    def testLookups(self):
+        """a test that any record can be fetched by control number and converts like a sequential read does
+        """
+        with MarcOffsetIndex(self.path) as index:
+            self.assertEqual((len(index), index.unindexed), (29, 1))
+            self.assertNotIn('3', index)
+            self.assertEqual(index.extraction('7').show_title(), 'A newer Title 7')
+            self.assertRaises(KeyError, index.raw, 'not there')
+            sequential = {x.metadata.identifier: x.to_json() for x in MarcFilesFromDisk(self.path).extractions()}
+            for control_number in ['0', '12', '29']:
+                an_extraction = index.extraction(control_number, lazy=True)
+                self.assertEqual(an_extraction.to_json(), sequential['http://example.org/' + control_number])
+
+    def testSavedOffsetsAreReused(self):
+        """a test that saved offsets are used while the MARC file is unchanged and rebuilt after it changes
+        """
+        index_path = join(self.tmp.name, 'a.offsets')
+        MarcOffsetIndex(self.path, index_path=index_path).close()
+        with MarcOffsetIndex(self.path, index_path=index_path) as index:
+            self.assertEqual(index.offsets['12'], MarcOffsetIndex(self.path).offsets['12'])
+        write_marc_file(self.path, [build_record('100', 'Only one')])
+        with MarcOffsetIndex(self.path, index_path=index_path) as index:
+            self.assertEqual(list(index), ['100'])
+            self.assertEqual(index.record('100')['245']['a'], 'Only one')
+
+    def testIdentifierKeys(self):
+        """a test that records can be looked up by the identifier their manifests are given
+        """
+        url = 'https://pi.lib.uchicago.edu/1001/maps/chisoc/'
+        records = [build_record(str(n), 'Title ' + str(n)) for n in range(3)]
+        for n, record in enumerate(records):
+            record['856']['u'] = url + str(n)
+        write_marc_file(self.path, records)
+        for profile in (None, MappingProfile.from_dict({'identifier_patterns': IDENTIFIER_PATTERNS}),
+                        MappingProfile.from_dict({'repeated': 'first'})):
+            with MarcOffsetIndex(self.path, profile=profile, key='identifier') as index:
+                for an_extraction in MarcFilesFromDisk(self.path, profile=profile).extractions():
+                    identifier = an_extraction.metadata.identifier
+                    self.assertEqual(raw_identifier(index.raw(identifier), profile), identifier)
+                    self.assertEqual(index.extraction(identifier).to_json(), an_extraction.to_json())
+        self.assertEqual(list(index), [url + str(n) for n in range(3)])
+        self.assertRaises(ValueError, MarcOffsetIndex, self.path, key='title')
+
+
+if __name__ == "__main__":
+    unittest.main()
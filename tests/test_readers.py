@@ -0,0 +1,130 @@
+from os.path import join
+from tempfile import TemporaryDirectory
+import unittest
+
+from pymarc import Field, Record, Subfield, record_to_xml
+
+from marc2iiif.classes import IIIFDataExtractionFromMarc, IIIFMetadataBoxFromMarc, MarcFilesFromDisk, \
+    MarcXMLFilesFromDisk
+from marc2iiif.dedup import DuplicateFilter
+from marc2iiif.utils import iter_marcxml_records
+
+
+def build_record(control_number, title):
+    record = Record()
+    record.add_field(Field(tag='001', data=control_number))
+    record.add_field(Field(tag='245', indicators=['0', '0'],
+                           subfields=[Subfield('a', title), Subfield('c', 'Doe, Jane')]))
+    record.add_field(Field(tag='300', indicators=[' ', ' '],
+                           subfields=[Subfield('a', '1 online resource'), Subfield('b', 'col.')]))
+    record.add_field(Field(tag='856', indicators=['4', '0'],
+                           subfields=[Subfield('u', 'http://example.org/' + control_number)]))
+    return record
+
+
+def write_marc_file(path, records):
+    with open(path, 'wb') as a_stream:
+        for record in records:
+            a_stream.write(record.as_marc())
+
+
+def write_marcxml_file(path, records, oai=False):
+    body = b''.join(record_to_xml(record, namespace=True) for record in records)
+    if oai:
+        body = b''.join(b'<record><header/><metadata>' + record_to_xml(record, namespace=True) +
+                        b'</metadata></record>' for record in records)
+        document = b'<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><ListRecords>' + \
+            body + b'</ListRecords></OAI-PMH>'
+    else:
+        document = b'<collection xmlns="http://www.loc.gov/MARC21/slim">' + body + b'</collection>'
+    with open(path, 'wb') as a_stream:
+        a_stream.write(b'<?xml version="1.0" encoding="UTF-8"?>' + document)
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        write_marc_file(join(self.tmp.name, 'b.mrc'), [build_record('3', 'Third')])
+        write_marc_file(join(self.tmp.name, 'a.mrc'), [build_record('1', 'First'),
+                                                       build_record('2', 'Second')])
+        with open(join(self.tmp.name, 'notes.txt'), 'w') as a_stream:
+            a_stream.write('not a MARC file')
+
+    def testReadSingleFile(self):
+        """a test to stream the records out of one binary MARC file
+        """
+        reader = MarcFilesFromDisk(join(self.tmp.name, 'a.mrc'))
+        titles = [x.show_title() for x in reader.extractions()]
+        self.assertEqual(titles, ['First', 'Second'])
+
+    def testReadDirectory(self):
+        """a test to stream every MARC file in a directory tree in a stable order
+        """
+        reader = MarcFilesFromDisk(self.tmp.name)
+        manifests = list(reader.manifests())
+        self.assertEqual([x['label'] for x in manifests], ['First', 'Second', 'Third'])
+        self.assertEqual(manifests[0]['@id'], 'https://iiif-manifest.lib.uchicago.edu/http://example.org/1')
+
+    def testRecordsMatchFromDictContract(self):
+        """a test that the streamed records can be passed straight to from_dict
+        """
+        record = next(iter(MarcFilesFromDisk(join(self.tmp.name, 'b.mrc'))))
+        self.assertEqual(IIIFDataExtractionFromMarc.from_dict(record).show_description(),
+                         '1 online resource col.')
+
+    def testDamagedRecordsAreReported(self):
+        """a test that undecodable records and a damaged record length are reported the same way with or without a duplicate filter
+        """
+        records = [build_record(str(n), 'Title ' + str(n)).as_marc() for n in range(4)]
+        undecodable = bytearray(records[1])
+        undecodable[12:17] = b'00000'
+        path = join(self.tmp.name, 'damaged.mrc')
+        with open(path, 'wb') as a_stream:
+            a_stream.write(records[0] + bytes(undecodable) + records[2] + b'xxxxx' + records[3])
+        damaged_at = len(records[0]) + len(undecodable) + len(records[2])
+        for duplicates in (None, DuplicateFilter()):
+            reader = MarcFilesFromDisk(path, duplicates=duplicates)
+            self.assertEqual([x.show_title() for x in reader.extractions()], ['Title 0', 'Title 2'])
+            self.assertEqual([(a_file, offset) for a_file, offset, _ in reader.errors],
+                             [(path, len(records[0])), (path, damaged_at)])
+            self.assertIn('invalid record length', reader.errors[1][2])
+
+    def testMissingPath(self):
+        """a test that a path that does not exist is refused
+        """
+        self.assertRaises(ValueError, MarcFilesFromDisk, join(self.tmp.name, 'nope'))
+
+    def testReadMarcXMLDirectory(self):
+        """a test to stream the records of every MARCXML file in a directory tree
+        """
+        write_marcxml_file(join(self.tmp.name, 'c.xml'), [build_record('4', 'Fourth')])
+        write_marcxml_file(join(self.tmp.name, 'd.xml'), [build_record('5', 'Fifth')], oai=True)
+        reader = MarcXMLFilesFromDisk(self.tmp.name)
+        self.assertEqual([x.show_title() for x in reader.extractions()], ['Fourth', 'Fifth'])
+
+    def testMarcXMLMatchesBinaryRecords(self):
+        """a test that a MARCXML record dictifies exactly like the same binary record
+        """
+        record = build_record('6', 'Sixth')
+        path = join(self.tmp.name, 'e.xml')
+        write_marcxml_file(path, [record])
+        with open(path, 'rb') as a_stream:
+            self.assertEqual(list(iter_marcxml_records(a_stream)), [record.as_dict()])
+
+    def testFromPymarcMatchesFromDict(self):
+        """a test that converting a pymarc Record directly gives the same metadata as going through a dict
+        """
+        record = build_record('7', 'Seventh')
+        record.add_field(Field(tag='650', indicators=[' ', '0'],
+                               subfields=[Subfield('a', 'Maps'), Subfield('z', 'Chicago')]))
+        record.add_field(Field(tag='650', indicators=[' ', '0'], subfields=[Subfield('a', 'Atlases')]))
+        record.add_field(Field(tag='500', indicators=[' ', ' '], subfields=[Subfield('a', ' A note. ')]))
+        direct = IIIFMetadataBoxFromMarc.from_pymarc(record)
+        dictified = IIIFMetadataBoxFromMarc.from_dict(record.as_dict())
+        self.assertEqual((direct.label, direct.description, direct.identifier, direct.fields),
+                         (dictified.label, dictified.description, dictified.identifier, dictified.fields))
+
+
+if __name__ == "__main__":
+    unittest.main()
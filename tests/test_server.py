@@ -0,0 +1,121 @@
+from http.client import HTTPConnection
+from json import loads
+from os import listdir
+from os.path import join
+from tempfile import TemporaryDirectory
+from threading import Thread
+import unittest
+
+from marc2iiif.constants import MANIFEST_ID_PREFIX
+from marc2iiif.profiles import MappingProfile
+from marc2iiif.random_access import MarcOffsetIndex
+from marc2iiif.server import ManifestCache, ManifestServer, ManifestService
+
+from .test_readers import build_record, write_marc_file
+
+
+class Tests(unittest.TestCase):
+    def start(self, service):
+        server = ManifestServer(('127.0.0.1', 0), service, workers=2, quiet=True)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(service.close)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        write_marc_file(join(self.tmp.name, 'a.mrc'), [build_record(str(n), 'Title ' + str(n)) for n in range(10)])
+        write_marc_file(join(self.tmp.name, 'b.mrc'), [build_record('a b', 'Spaced')])
+
+    def testManifestsAreServed(self):
+        """a test that manifests are served under the identifier they advertise with working conditional requests
+        """
+        service = ManifestService(self.tmp.name)
+        server = self.start(service)
+        connection = HTTPConnection('127.0.0.1', server.server_address[1])
+        self.addCleanup(connection.close)
+
+        connection.request('GET', '/http%3A%2F%2Fexample.org%2F4/manifest.json')
+        response = connection.getresponse()
+        body = response.read()
+        with MarcOffsetIndex(join(self.tmp.name, 'a.mrc')) as index:
+            self.assertEqual(loads(body), index.extraction('4').to_dict())
+        self.assertEqual((response.status, response.getheader('Content-Type')), (200, 'application/json'))
+        self.assertEqual(loads(body)['@id'], MANIFEST_ID_PREFIX + 'http://example.org/4')
+        etag = response.getheader('ETag')
+
+        connection.request('GET', '/' + loads(body)['@id'][len(MANIFEST_ID_PREFIX):],
+                           headers={'If-None-Match': etag})
+        response = connection.getresponse()
+        self.assertEqual((response.status, response.read()), (304, b''))
+        connection.request('GET', '/http://example.org/a%20b/manifest.json')
+        response = connection.getresponse()
+        self.assertEqual(loads(response.read())['label'], 'Spaced')
+        for path in ['/http://example.org/11/manifest.json', '/4/manifest.json', '/', '/manifest.json']:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            self.assertEqual(response.status, 404)
+        self.assertEqual((service.cache.hits, len(service.cache)), (1, 2))
+
+    def testQueryStringsAndSavedOffsets(self):
+        """a test that identifiers with a query string are served at their @id and that offsets are kept between starts
+        """
+        record = build_record('q', 'Queried')
+        record['856']['u'] = 'http://example.org/view?id=5&page=1'
+        write_marc_file(join(self.tmp.name, 'c.mrc'), [record])
+        offsets = join(self.tmp.name, 'offsets')
+        ManifestService(join(self.tmp.name, 'c.mrc'), index_directory=offsets).close()
+        self.assertEqual(len(listdir(offsets)), 1)
+        service = ManifestService(join(self.tmp.name, 'c.mrc'), index_directory=offsets)
+        server = self.start(service)
+        connection = HTTPConnection('127.0.0.1', server.server_address[1])
+        self.addCleanup(connection.close)
+        for path in ['/http://example.org/view?id=5&page=1', '/http://example.org/view?id=5&page=1/manifest.json',
+                     '/http%3A%2F%2Fexample.org%2Fview%3Fid%3D5%26page%3D1/manifest.json']:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            self.assertEqual((response.status, loads(response.read())['label']), (200, 'Queried'))
+        connection.request('GET', '/http://example.org/view?id=6&page=1')
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 404)
+
+    def testIdentifierPatterns(self):
+        """a test that records are found by the identifier a profile gives them and that failures get a 500
+        """
+        service = ManifestService(self.tmp.name, profile=MappingProfile.from_dict(
+            {'identifier_patterns': ['^https?://example[.]org/(?P<identifier>[^/]+)$']}))
+        server = self.start(service)
+        connection = HTTPConnection('127.0.0.1', server.server_address[1])
+        self.addCleanup(connection.close)
+        self.assertIn('4', service)
+        connection.request('GET', '/4')
+        response = connection.getresponse()
+        self.assertEqual((response.status, loads(response.read())['@id']), (200, MANIFEST_ID_PREFIX + '4'))
+
+        def fail(identifier):
+            raise ValueError('broken record')
+        service.manifest = fail
+        connection.request('GET', '/5/manifest.json')
+        response = connection.getresponse()
+        response.read()
+        self.assertEqual(response.status, 500)
+
+    def testCacheIsBoundedBySize(self):
+        """a test that the cache drops the least recently used manifests to stay under its size
+        """
+        cache = ManifestCache(max_bytes=10)
+        cache.put('a', '"a"', b'aaaa')
+        cache.put('b', '"b"', b'bbbb')
+        cache.get('a')
+        cache.put('c', '"c"', b'cccc')
+        cache.put('d', '"d"', b'd' * 11)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('d')), (('"a"', b'aaaa'), None, None))
+        self.assertEqual(cache.size, 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,11 @@
 
-from io import BytesIO
+from io import BytesIO, StringIO
+import json
+from timeit import repeat
 import unittest
 
 from marc2iiif.classes import IIIFDataExtractionFromMarc, IIIFMetadataBoxFromMarc, IIIFMetadataField
+from marc2iiif.utils import SHARED_VALUE_LIMIT, combine_subfields_into_one_value, set_shared_value_limit
 
 
 class Tests(unittest.TestCase):
@@ -71,6 +74,28 @@ class Tests(unittest.TestCase):
                 break
         self.assertEqual(check, False)
 
+    def testManyEditsKeepFieldOrder(self):
+        """a test that repeated modifications and removals keep the remaining fields in their original order
+        """
+        fields = [IIIFMetadataField("Local Subject", "subject " + str(n % 50)) for n in range(200)]
+        test_object = IIIFDataExtractionFromMarc(IIIFMetadataBoxFromMarc('a label', 'a description', '/foo/bar', fields))
+        expected = [{'label': x.label, 'value': x.value} for x in fields]
+        for n in range(50):
+            test_object.modify_metadata({"Local Subject": "subject " + str(n)}, "changed " + str(n))
+            expected[expected.index({'label': "Local Subject", 'value': "subject " + str(n)})]['value'] = \
+                "changed " + str(n)
+        for n in range(0, 50, 2):
+            for _ in range(3):
+                test_object.remove_metadata({"Local Subject": "subject " + str(n)})
+                expected.remove({'label': "Local Subject", 'value': "subject " + str(n)})
+        test_object.metadata.add_field(IIIFMetadataField("Local Subject", "changed 1"))
+        expected.append({'label': "Local Subject", 'value': "changed 1"})
+        test_object.remove_metadata({"Local Subject": "changed 1"})
+        expected.remove({'label': "Local Subject", 'value': "changed 1"})
+        self.assertEqual(test_object.show_metadata(), expected)
+        self.assertEqual(json.loads(test_object.to_json())['metadata'], expected)
+        self.assertRaises(ValueError, test_object.remove_metadata, {"Local Subject": "not there"})
+
     def testChangeTitle(self):
         """a test to change the title of the IIIF record from original title to new title
         """
@@ -120,6 +145,16 @@ class Tests(unittest.TestCase):
         self.assertEqual(new_object.label, 'a field')
         self.assertEqual(new_object.value, 'a value')
 
+    def testMetadataFieldIsCompact(self):
+        """a test that metadata fields carry no instance dictionary and share their labels
+        """
+        first = IIIFMetadataField("".join(["Local ", "Subject"]), "a value")
+        second = IIIFMetadataField("".join(["Local ", "Sub", "ject"]), "another value")
+        self.assertFalse(hasattr(first, '__weakref__'))
+        self.assertRaises(AttributeError, setattr, first, 'extra', 'value')
+        self.assertIs(first.label, second.label)
+        self.assertRaises(ValueError, setattr, first, 'value', 1)
+
     def testLoadFromDict(self):
         """a test to successfully load an instance of IIIDataExtractionFromMarc from a dictionary containing a MARC record
         """
@@ -130,6 +165,69 @@ class Tests(unittest.TestCase):
         self.assertEqual(test_object.show_metadata(), [{'label': 'Local Subject', 'value': 'Test Subject'},
                                                        {'label': 'Electronic Location and Access', 'value': 'http://example.org/foo'}])
 
+    def testRepeatedValuesAreShared(self):
+        """a test that records holding the same field value share one string unless sharing is turned off
+        """
+        def subject(record):
+            return IIIFMetadataBoxFromMarc.from_dict(record).get_fields()[0]['value']
+        first = {'leader': self.data['leader'],
+                 'fields': [{'690': {'ind1': ' ', 'ind2': ' ', 'subfields': [{'a': ' Maps '}, {'x': 'Chicago'}]}}]}
+        second = json.loads(json.dumps(first))
+        self.assertEqual(combine_subfields_into_one_value(first['fields'][0]['690']['subfields']), 'Maps  Chicago')
+        self.assertIs(subject(first), subject(second))
+        try:
+            set_shared_value_limit(0)
+            self.assertIsNot(subject(first), subject(second))
+            self.assertEqual(subject(first), subject(second))
+        finally:
+            set_shared_value_limit(SHARED_VALUE_LIMIT)
+        self.assertRaises(ValueError, set_shared_value_limit, -1)
+
+    def testFromDictScalesLinearly(self):
+        """a test that extraction cost grows linearly with the number of fields in a record
+        """
+        def build_record(total):
+            record = {'leader': self.data['leader'], 'fields': list(self.data['fields'])}
+            tags = ['500', '650', '700', '690', '999']
+            for n in range(total):
+                record['fields'].append({tags[n % len(tags)]: {'ind1': ' ', 'ind2': ' ',
+                                                               'subfields': [{'a': 'value ' + str(n)}]}})
+            return record
+        small, large = build_record(100), build_record(1600)
+        small_time = min(repeat(lambda: IIIFMetadataBoxFromMarc.from_dict(small), number=5, repeat=5))
+        large_time = min(repeat(lambda: IIIFMetadataBoxFromMarc.from_dict(large), number=5, repeat=5))
+        # 16 times the fields; a quadratic extractor would be ~256 times slower
+        self.assertLess(large_time / small_time, 64)
+
+    def testToJsonMatchesToDict(self):
+        """a test that the fast serializer gives exactly the same json as dumping to_dict
+        """
+        test_object = IIIFDataExtractionFromMarc.from_dict(self.data)
+        test_object.change_title('Caf\u00e9 "quoted" title')
+        self.assertEqual(test_object.to_json(), json.dumps(test_object.to_dict()))
+        self.assertEqual(json.loads(test_object.to_json(use_orjson=True)), json.loads(json.dumps(test_object.to_dict())))
+
+    def testMissingValuesAreNull(self):
+        """a test that a record without a description or an identifier serializes them as null like to_dict does
+        """
+        test_object = IIIFDataExtractionFromMarc(IIIFMetadataBoxFromMarc('A Title', None, None, []))
+        self.assertEqual(test_object.to_json(), json.dumps(test_object.to_dict()))
+        self.assertEqual((test_object.to_dict()['@id'], test_object.to_dict()['description']), (None, None))
+        self.assertEqual(json.loads(test_object.to_json(use_orjson=True)), test_object.to_dict())
+        text = StringIO()
+        test_object.write_to(text)
+        self.assertEqual(json.loads(text.getvalue())['description'], None)
+
+    def testWriteTo(self):
+        """a test to write a manifest to both text and binary files
+        """
+        test_object = IIIFDataExtractionFromMarc.from_dict(self.data)
+        text, binary = StringIO(), BytesIO()
+        test_object.write_to(text)
+        test_object.write_to(binary)
+        self.assertEqual(text.getvalue(), test_object.to_json())
+        self.assertEqual(binary.getvalue().decode('ascii'), test_object.to_json())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,49 @@
+from os import environ
+from os.path import abspath, dirname
+from subprocess import run
+import sys
+from tempfile import TemporaryDirectory
+import unittest
+
+# the most time importing marc2iiif.classes may take, with its bytecode already cached
+IMPORT_TIME_BUDGET = 0.05
+PACKAGE_ROOT = dirname(dirname(abspath(__file__)))
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.env = {key: value for key, value in environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+        self.env['PYTHONPATH'] = PACKAGE_ROOT
+        self.env['PYTHONPYCACHEPREFIX'] = self.tmp.name
+
+    def python(self, *args):
+        return run([sys.executable] + list(args), env=self.env, cwd=self.tmp.name, capture_output=True, text=True,
+                   check=True)
+
+    def testHeavyDependenciesAreImportedOnUse(self):
+        """a test that converting a single record never imports the backends it does not use
+        """
+        out = self.python('-c', 'import sys\n'
+                                'from marc2iiif.classes import IIIFDataExtractionFromMarc\n'
+                                'from marc2iiif import random_access, server\n'
+                                'IIIFDataExtractionFromMarc.from_dict({"fields": []}).to_json()\n'
+                                'print(sorted(x for x in ("pymarc", "orjson", "xml.etree.ElementTree") '
+                                'if x in sys.modules))\n')
+        self.assertEqual(out.stdout.strip(), '[]')
+
+    def testImportTimeBudget(self):
+        """a test that importing marc2iiif.classes stays within its python -X importtime budget
+        """
+        self.python('-c', 'import marc2iiif.classes')
+        timings = []
+        for _ in range(3):
+            lines = self.python('-X', 'importtime', '-c', 'import marc2iiif.classes').stderr.splitlines()
+            cumulative = [line.split('|')[1] for line in lines if line.split('|')[-1].strip() == 'marc2iiif.classes']
+            timings.append(int(cumulative[0]) / 1e6)
+        self.assertLess(min(timings), IMPORT_TIME_BUDGET)
+
+
+if __name__ == "__main__":
+    unittest.main()
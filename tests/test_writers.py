@@ -0,0 +1,90 @@
+from os import stat, walk
+from os.path import join, relpath
+from tempfile import TemporaryDirectory
+import gzip
+import json
+import unittest
+
+from marc2iiif.classes import IIIFDataExtractionFromMarc, IIIFMetadataBoxFromMarc, IIIFMetadataField
+from marc2iiif.writers import NdjsonManifestReader, NdjsonManifestWriter, ShardedManifestWriter
+
+
+def build_extraction(identifier, label):
+    return IIIFDataExtractionFromMarc(IIIFMetadataBoxFromMarc(label, 'a description', identifier,
+                                                              [IIIFMetadataField('Local Subject', 'Maps')]))
+
+
+class Tests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def list_files(self):
+        return sorted(relpath(join(root, name), self.tmp.name)
+                      for root, _, names in walk(self.tmp.name) for name in names)
+
+    def testShardedLayout(self):
+        """a test that manifests are written in batches to hashed subdirectories
+        """
+        writer = ShardedManifestWriter(self.tmp.name, batch_size=3)
+        extractions = [build_extraction('http://example.org/' + str(n), 'Title ' + str(n)) for n in range(7)]
+        extractions.append(build_extraction('', 'No identifier'))
+        writer.write_all(extractions)
+        self.assertEqual((writer.written, writer.unchanged, writer.skipped), (7, 0, 1))
+        files = self.list_files()
+        self.assertEqual(len(files), 7)
+        for a_file in files:
+            first, second, name = a_file.split('/')
+            self.assertEqual(name[:4], first + second)
+        with open(writer.path_for('http://example.org/3')) as a_stream:
+            self.assertEqual(json.load(a_stream)['label'], 'Title 3')
+
+    def testUnchangedFilesAreSkipped(self):
+        """a test that rewriting identical manifests does not touch the files
+        """
+        with ShardedManifestWriter(self.tmp.name) as writer:
+            writer.write(build_extraction('http://example.org/1', 'Same'))
+            writer.write(build_extraction('http://example.org/2', 'Before'))
+        path = writer.path_for('http://example.org/1')
+        before = stat(path).st_ino
+        with ShardedManifestWriter(self.tmp.name, durable=True) as writer:
+            writer.write(build_extraction('http://example.org/1', 'Same'))
+            writer.write(build_extraction('http://example.org/2', 'After'))
+        self.assertEqual((writer.written, writer.unchanged), (1, 1))
+        self.assertEqual(stat(path).st_ino, before)
+        with open(writer.path_for('http://example.org/2')) as a_stream:
+            self.assertEqual(json.load(a_stream)['label'], 'After')
+        self.assertFalse([x for x in self.list_files() if x.endswith('.tmp')])
+
+    def testPackedOutput(self):
+        """a test that packed manifests stream as json lines and can be read back one at a time by identifier
+        """
+        extractions = [build_extraction('http://example.org/' + str(n), 'Title ' + str(n)) for n in range(50)]
+        extractions.append(build_extraction('', 'No identifier'))
+        extractions.append(build_extraction('http://example.org/7', 'Title 7 again'))
+        for compression in (None, 'gzip', 'bz2', 'lzma'):
+            path = join(self.tmp.name, 'manifests.ndjson')
+            writer = NdjsonManifestWriter(path, compression=compression, block_size=1000).write_all(extractions)
+            self.assertEqual((writer.written, writer.skipped), (51, 1))
+            with (gzip.open(path) if compression == 'gzip' else open(path, 'rb')) as a_stream:
+                lines = a_stream.read().splitlines() if compression in (None, 'gzip') else None
+            if lines is not None:
+                self.assertEqual(lines[3], extractions[3].to_json().encode('utf-8'))
+                self.assertEqual(len(lines), 51)
+            with NdjsonManifestReader(path) as reader:
+                self.assertEqual((len(reader), reader.compression), (50, compression))
+                self.assertEqual(reader.get('http://example.org/7')['label'], 'Title 7 again')
+                for n in (0, 23, 49, 22):
+                    self.assertEqual(reader.raw('http://example.org/' + str(n)),
+                                     extractions[n].to_json().encode('utf-8'))
+                self.assertRaises(KeyError, reader.raw, 'http://example.org/50')
+        self.assertRaises(ValueError, NdjsonManifestWriter, path, compression='rar')
+        odd = [build_extraction(identifier, 'Odd') for identifier in ('a\rb', 'c\u2028d', 'e\x85f', 'g\th')]
+        NdjsonManifestWriter(path).write_all(odd)
+        with NdjsonManifestReader(path) as reader:
+            self.assertEqual(sorted(reader), sorted(x.metadata.identifier for x in odd))
+            self.assertEqual(reader.raw('a\rb'), odd[0].to_json().encode('utf-8'))
+
+
+if __name__ == "__main__":
+    unittest.main()